@@ -0,0 +1,296 @@
+"""
+Benchmark harness for the load -> transform -> format -> export pipeline.
+
+Generates a synthetic orders workbook (Orders, BillTo and Items sheets) of
+the requested size, runs each stage against it and reports throughput,
+per-call latency percentiles and the process's peak RSS after each stage.
+Results are written as JSON so runs can be compared for regressions:
+
+    python benchmark.py --rows 100000 --items-per-order 3 --output bench.json
+    python benchmark.py --rows 100000 --items-per-order 3 --compare bench.json
+
+Loading and transforming cover every row. Formatting and export are
+measured on a sample of invoices (--sample, --pdf-sample), since their
+per-invoice cost does not depend on the size of the sheet.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+from openpyxl import Workbook
+
+import invoice
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+_PRODUCTS = ["Wireless Mouse", "USB-C Hub", "Laptop Stand", "Desk Lamp", "Monitor Arm",
+             "Keyboard", "Webcam", "Headset", "Docking Station", "Cable Kit"]
+
+
+def GenerateWorkbook(path: str, rows: int, items_per_order: int = 1, customers: int = 500,
+                     seed: int = 0) -> str:
+    """
+    Writes a synthetic orders workbook with `rows` order lines, grouped
+    `items_per_order` lines to an OrderID, plus matching BillTo and Items
+    sheets. The same seed always produces the same workbook.
+
+    Args:
+        path: Output .xlsx path
+        rows: Number of Orders rows
+        items_per_order: Lines sharing each OrderID
+        customers: Number of distinct customers
+        seed: Random seed
+
+    Returns:
+        The path written.
+    """
+    rng = random.Random(seed)
+    wb = Workbook(write_only=True)
+
+    orders = wb.create_sheet("Orders")
+    orders.append(["OrderID", "CustomerID", "ItemID", "ItemName", "Qty", "Price", "CustomerName", "Email"])
+    for n in range(rows):
+        customer = rng.randrange(customers) if n % items_per_order == 0 else customer
+        item = rng.randrange(len(_PRODUCTS))
+        orders.append([f"{100000 + n // items_per_order}", f"CUST{customer:05d}", f"ITEM{item:03d}",
+                       _PRODUCTS[item], rng.randint(1, 20), round(rng.uniform(1, 500), 2),
+                       f"Customer {customer}", f"customer{customer}@example.com"])
+
+    bill_to = wb.create_sheet("BillTo")
+    bill_to.append(["CustomerID", "CustomerName", "Email", "Phone", "Address", "City"])
+    for c in range(customers):
+        bill_to.append([f"CUST{c:05d}", f"Customer {c}", f"customer{c}@example.com",
+                        f"(555) {c // 10000:03d}-{c % 10000:04d}", f"{c + 1} Business Park Drive", "Toronto"])
+
+    items = wb.create_sheet("Items")
+    items.append(["ItemID", "ItemName", "Price"])
+    for i, name in enumerate(_PRODUCTS):
+        items.append([f"ITEM{i:03d}", name, round(10 + 7.5 * i, 2)])
+
+    wb.save(path)
+    return path
+
+
+def _peak_rss_mb():
+    """
+    Peak resident set size of this process so far, in MB (None if unknown).
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return round(peak / (1024 * 1024 if sys.platform == "darwin" else 1024), 1)
+
+
+def _percentile(sorted_values: list, pct: float) -> float:
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, max(0, round(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def _summarize(count: int, seconds: float, latencies: list = None) -> dict:
+    result = {
+        "count": count,
+        "seconds": round(seconds, 4),
+        "throughput_per_s": round(count / seconds, 2) if seconds else None,
+        "peak_rss_mb": _peak_rss_mb(),
+    }
+    if latencies:
+        latencies = sorted(latencies)
+        result["latency_ms"] = {
+            name: round(_percentile(latencies, pct) * 1000, 3)
+            for name, pct in (("p50", 50), ("p90", 90), ("p99", 99), ("max", 100))
+        }
+    return result
+
+
+def _time_each(func, inputs) -> dict:
+    """
+    Calls func once per input, timing every call.
+    """
+    latencies = []
+    start = time.perf_counter()
+    for value in inputs:
+        t0 = time.perf_counter()
+        func(value)
+        latencies.append(time.perf_counter() - t0)
+    return _summarize(len(latencies), time.perf_counter() - start, latencies)
+
+
+@contextmanager
+def _scratch_counters(directory: str):
+    # Number allocation is part of TransformOrder's cost, but a benchmark
+    # must not consume real invoice/PO numbers
+    allocators = (invoice._invoice_numbers, invoice._po_numbers)
+    previous = [a.counter_file for a in allocators]
+    for a in allocators:
+        a.release()
+        a.counter_file = os.path.join(directory, os.path.basename(a.counter_file))
+    try:
+        yield
+    finally:
+        for a, path in zip(allocators, previous):
+            a.release()
+            a.counter_file = path
+
+
+def _office_available() -> bool:
+    if platform.system() == "Windows":
+        return True
+    return shutil.which("soffice") is not None or shutil.which("libreoffice") is not None
+
+
+def RunBenchmark(rows: int = 1000, items_per_order: int = 1, sample: int = 200, pdf_sample: int = 20,
+                 workdir: str = None, office_pdf: bool = None) -> dict:
+    """
+    Generates a workbook and times each pipeline stage against it.
+
+    Args:
+        rows: Orders rows in the synthetic workbook
+        items_per_order: Lines per OrderID (and so per invoice)
+        sample: Invoices formatted and exported to xlsx
+        pdf_sample: Invoices exported to PDF by each engine
+        workdir: Directory for the workbook and output files (a temporary
+            directory by default)
+        office_pdf: Whether to time Excel/LibreOffice PDF conversion
+            (default: when an office suite is installed)
+
+    Returns:
+        Dict with "meta" (run parameters and environment) and "stages"
+        (results per stage, keyed by stage name).
+    """
+    if office_pdf is None:
+        office_pdf = _office_available()
+    with tempfile.TemporaryDirectory() as scratch:
+        workdir = workdir or scratch
+        os.makedirs(workdir, exist_ok=True)
+        stages = {}
+
+        start = time.perf_counter()
+        path = GenerateWorkbook(os.path.join(workdir, "bench_orders.xlsx"), rows, items_per_order)
+        generate_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        orders = invoice.LoadOrders(path)
+        stages["LoadOrders"] = _summarize(len(orders), time.perf_counter() - start)
+
+        bill_to = invoice.LoadBillToData(path)
+        groups = invoice.GroupOrders(orders) if items_per_order > 1 else [[order] for order in orders]
+        transformed = []
+        with _scratch_counters(workdir), invoice.ReservedNumbers():
+            stages["TransformOrder"] = _time_each(
+                lambda lines: transformed.append(invoice.TransformOrderGroup(lines, bill_to)), groups)
+        del orders, groups
+
+        sampled = transformed[:sample]
+        workbooks = []
+        stages["FormatInvoice"] = _time_each(lambda order: workbooks.append(invoice.FormatInvoice(order)), sampled)
+
+        out = os.path.join(workdir, "out")
+        os.makedirs(out, exist_ok=True)
+        names = iter(range(len(transformed)))
+        stages["ExportInvoice[xlsx]"] = _time_each(
+            lambda wb: invoice.ExportInvoice(wb, os.path.join(out, f"x{next(names)}"), format="xlsx"), workbooks)
+
+        names = iter(range(len(transformed)))
+        stages["ExportInvoice[pdf,native]"] = _time_each(
+            lambda order: invoice.ExportInvoice(order, os.path.join(out, f"n{next(names)}"),
+                                                format="pdf", engine="native"),
+            sampled[:pdf_sample])
+
+        if office_pdf:
+            names = iter(range(len(transformed)))
+            stages["ExportInvoice[pdf,office]"] = _time_each(
+                lambda wb: invoice.ExportInvoice(wb, os.path.join(out, f"o{next(names)}"), format="pdf"),
+                workbooks[:pdf_sample])
+
+    return {
+        "meta": {
+            "rows": rows,
+            "items_per_order": items_per_order,
+            "invoices": len(transformed),
+            "sample": len(sampled),
+            "pdf_sample": min(pdf_sample, len(sampled)),
+            "generate_seconds": round(generate_seconds, 4),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+        },
+        "stages": stages,
+    }
+
+
+def CompareResults(current: dict, baseline: dict, tolerance: float = 0.10) -> list[str]:
+    """
+    Compares stage throughput against a baseline result.
+
+    Args:
+        current, baseline: Dicts as returned by RunBenchmark
+        tolerance: Fractional throughput drop still accepted (0.10 = 10%)
+
+    Returns:
+        A list of messages, one per stage that regressed beyond tolerance.
+    """
+    regressions = []
+    for name, stage in current["stages"].items():
+        before = baseline.get("stages", {}).get(name, {}).get("throughput_per_s")
+        after = stage.get("throughput_per_s")
+        if before and after is not None and after < before * (1 - tolerance):
+            regressions.append(f"{name}: {after:.1f}/s vs {before:.1f}/s ({after / before - 1:+.0%})")
+    return regressions
+
+
+def _print_report(result: dict) -> None:
+    meta = result["meta"]
+    print(f"{meta['rows']} rows, {meta['items_per_order']} per order, {meta['invoices']} invoices")
+    print(f"{'stage':<28}{'count':>8}{'per s':>12}{'p50 ms':>10}{'p99 ms':>10}{'RSS MB':>9}")
+    for name, stage in result["stages"].items():
+        latency = stage.get("latency_ms", {})
+        p50 = f"{latency['p50']:.2f}" if latency else "-"
+        p99 = f"{latency['p99']:.2f}" if latency else "-"
+        print(f"{name:<28}{stage['count']:>8}{stage['throughput_per_s'] or 0:>12.1f}"
+              f"{p50:>10}{p99:>10}{stage['peak_rss_mb'] or 0:>9.1f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the invoice pipeline on a synthetic workbook.")
+    parser.add_argument("--rows", type=int, default=1000, help="Orders rows to generate (default: 1000)")
+    parser.add_argument("--items-per-order", type=int, default=1,
+                        help="Lines per OrderID, i.e. per invoice (default: 1)")
+    parser.add_argument("--sample", type=int, default=200,
+                        help="Invoices to format and export to xlsx (default: 200)")
+    parser.add_argument("--pdf-sample", type=int, default=20,
+                        help="Invoices to export to PDF per engine (default: 20)")
+    parser.add_argument("--no-office", action="store_true", help="Skip Excel/LibreOffice PDF conversion")
+    parser.add_argument("--workdir", default=None, help="Keep the workbook and outputs in this directory")
+    parser.add_argument("--output", default=None, help="Write the results to this JSON file")
+    parser.add_argument("--compare", default=None, metavar="BASELINE",
+                        help="Fail if throughput dropped against this earlier JSON result")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="Throughput drop accepted by --compare (default: 0.10)")
+    args = parser.parse_args()
+
+    result = RunBenchmark(args.rows, args.items_per_order, args.sample, args.pdf_sample,
+                          workdir=args.workdir, office_pdf=False if args.no_office else None)
+    _print_report(result)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(result, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            regressions = CompareResults(result, json.load(f), args.tolerance)
+        for message in regressions:
+            print(f"Regression {message}")
+        sys.exit(1 if regressions else 0)
@@ -0,0 +1,225 @@
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+from multiprocessing.util import Finalize
+
+
+class ConversionError(RuntimeError):
+    """Raised when a document could not be converted to PDF."""
+
+
+def _free_port() -> int:
+    """
+    Asks the OS for an unused local TCP port.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class SofficeInstance:
+    """
+    A single headless LibreOffice process listening on a local UNO socket.
+
+    Each instance gets its own user profile directory so several can run
+    side by side, and documents are converted over the UNO bridge instead
+    of launching a new soffice process per file. Requires the LibreOffice
+    Python bindings (`uno`, e.g. the python3-uno package).
+    """
+
+    def __init__(self, soffice: str = "soffice", start_timeout: float = 30.0):
+        self.soffice = soffice
+        self.start_timeout = start_timeout
+        self.port = None
+        self._proc = None
+        self._profile = None
+        self._desktop = None
+
+    def start(self) -> None:
+        """
+        Launches soffice and waits until its UNO socket accepts connections.
+        """
+        self.port = _free_port()
+        self._profile = tempfile.mkdtemp(prefix="soffice-profile-")
+        self._proc = subprocess.Popen(
+            [
+                self.soffice,
+                "--headless", "--invisible", "--nologo", "--norestore", "--nodefault",
+                f"--accept=socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext",
+                f"-env:UserInstallation=file://{self._profile}",
+            ],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+        deadline = time.monotonic() + self.start_timeout
+        while time.monotonic() < deadline:
+            if self.healthy():
+                return
+            if self._proc.poll() is not None:
+                break
+            time.sleep(0.1)
+        self.stop()
+        raise ConversionError(f"soffice did not start listening within {self.start_timeout}s")
+
+    def healthy(self) -> bool:
+        """
+        True if the process is still running and its UNO socket is reachable.
+        """
+        if self._proc is None or self._proc.poll() is not None:
+            return False
+        try:
+            with socket.create_connection(("127.0.0.1", self.port), timeout=1):
+                return True
+        except OSError:
+            return False
+
+    def stop(self) -> None:
+        """
+        Terminates the process and removes its profile directory.
+        """
+        self._desktop = None
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.terminate()
+            try:
+                self._proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                self._proc.kill()
+                self._proc.wait()
+        self._proc = None
+        if self._profile:
+            shutil.rmtree(self._profile, ignore_errors=True)
+            self._profile = None
+
+    def _connect(self):
+        import uno
+
+        local = uno.getComponentContext()
+        resolver = local.ServiceManager.createInstanceWithContext(
+            "com.sun.star.bridge.UnoUrlResolver", local)
+        ctx = resolver.resolve(
+            f"uno:socket,host=127.0.0.1,port={self.port};urp;StarOffice.ComponentContext")
+        return ctx.ServiceManager.createInstanceWithContext("com.sun.star.frame.Desktop", ctx)
+
+    def convert(self, src_path: str, pdf_path: str) -> str:
+        """
+        Converts the spreadsheet at `src_path` to a PDF at `pdf_path`.
+        """
+        import uno
+        from com.sun.star.beans import PropertyValue
+
+        def prop(name, value):
+            p = PropertyValue()
+            p.Name, p.Value = name, value
+            return p
+
+        if self._desktop is None:
+            self._desktop = self._connect()
+        doc = self._desktop.loadComponentFromURL(
+            uno.systemPathToFileUrl(os.path.abspath(src_path)), "_blank", 0, (prop("Hidden", True),))
+        if doc is None:
+            raise ConversionError(f"LibreOffice could not open {src_path}")
+        try:
+            doc.storeToURL(uno.systemPathToFileUrl(os.path.abspath(pdf_path)),
+                           (prop("FilterName", "calc_pdf_Export"),))
+        finally:
+            doc.close(True)
+        return pdf_path
+
+
+class ConverterPool:
+    """
+    A fixed-size pool of long-lived SofficeInstance workers.
+
+    Instances are started lazily and handed out one conversion at a time.
+    Before each use an instance is health-checked and restarted if it has
+    died; a conversion that fails because the instance crashed mid-way is
+    retried once on a fresh instance.
+
+    Usage:
+        with ConverterPool(size=2) as pool:
+            ExportInvoice(wb, "out/invoice_1", format="pdf", converter=pool)
+    """
+
+    def __init__(self, size: int = 2, soffice: str = "soffice", start_timeout: float = 30.0):
+        if size < 1:
+            raise ValueError("ConverterPool size must be at least 1")
+        self.size = size
+        # LIFO so light load keeps reusing the most recently warmed instance
+        self._idle = queue.LifoQueue()
+        self._instances = []
+        for _ in range(size):
+            instance = SofficeInstance(soffice=soffice, start_timeout=start_timeout)
+            self._instances.append(instance)
+            self._idle.put(instance)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _ensure_running(self, instance: SofficeInstance) -> None:
+        if not instance.healthy():
+            instance.stop()
+            instance.start()
+
+    def warm(self) -> None:
+        """
+        Starts every instance now rather than on its first conversion, so
+        the first requests of a long-running process do not pay for it.
+        """
+        for instance in self._instances:
+            self._ensure_running(instance)
+
+    def convert(self, src_path: str, pdf_path: str) -> str:
+        """
+        Converts `src_path` to `pdf_path` on the next free instance.
+        Blocks while every instance is busy.
+        """
+        instance = self._idle.get()
+        try:
+            self._ensure_running(instance)
+            try:
+                return instance.convert(src_path, pdf_path)
+            except ConversionError:
+                raise
+            except Exception:
+                # The bridge is gone if soffice crashed; restart and retry once
+                instance.stop()
+                instance.start()
+                return instance.convert(src_path, pdf_path)
+        finally:
+            self._idle.put(instance)
+
+    def close(self) -> None:
+        """
+        Stops every instance in the pool.
+        """
+        for instance in self._instances:
+            instance.stop()
+
+
+_shared_pool = None
+_shared_lock = threading.Lock()
+
+def get_shared_pool(size: int = None) -> ConverterPool:
+    """
+    Returns the process-wide ConverterPool, creating it on first use.
+
+    The size defaults to the INVOICE_CONVERTER_POOL_SIZE environment variable
+    (or 2) and is fixed once the pool exists. The pool is shut down when the
+    process exits, including ProcessPoolExecutor workers, which skip atexit.
+    """
+    global _shared_pool
+    with _shared_lock:
+        if _shared_pool is None:
+            if size is None:
+                size = int(os.environ.get("INVOICE_CONVERTER_POOL_SIZE", "2"))
+            _shared_pool = ConverterPool(size=size)
+            Finalize(_shared_pool, _shared_pool.close, exitpriority=10)
+        return _shared_pool
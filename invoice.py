@@ -1,278 +1,721 @@
 from openpyxl import Workbook, load_workbook
-from openpyxl.worksheet.table import Table, TableStyleInfo
+from openpyxl.worksheet.table import Table, TableColumn, TableStyleInfo
+from openpyxl.worksheet.filters import AutoFilter
+from openpyxl.cell import WriteOnlyCell
 from openpyxl.drawing.image import Image
-from openpyxl.styles import Alignment, Font, Border, Side
+import io
 import os
+import heapq
+import shutil
+import subprocess
+import tempfile
+import threading
+import warnings
 from openpyxl.worksheet.page import PageMargins
-from datetime import datetime
+from openpyxl.utils.indexed_list import IndexedList
+from copy import copy
+from operator import itemgetter
+from itertools import islice
+from logo_cache import DEFAULT_LOGO_PATH, get_logo
+from numbering import NumberAllocator
+import metrics
+import invoice_styles
+from totals import apply_totals, order_totals, to_quantity
+from records import Customer, Invoice, LineItem, Order, key_errors
+from invoice_email import invoice_email_content
+from contextlib import contextmanager
+from datetime import datetime, timedelta
 import platform
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
 
 
+def _iter_order_rows(ws):
+    """
+    Yields one typed Order record per data row of an Orders worksheet.
+    """
+    rows = ws.iter_rows(values_only=True)
+    headers = next(rows, None)
+    if headers is None:
+        return
+    # convert numeric fields
+    read = Order.row_reader(headers, convert={"Qty": to_quantity, "Price": float})
+    width = len(headers)
+    for row in rows:
+        # read-only sheets can report trailing blank rows
+        if all(v is None for v in row):
+            continue
+        if len(row) < width:
+            # without a stored dimension, trailing empty cells are not padded
+            row += (None,) * (width - len(row))
+        yield read(row)
+
+def _index_rows(ws, key: str, record=None) -> dict:
+    """
+    Builds a dict mapping the `key` column of a worksheet to its row data,
+    as `record` instances (see records.py) or plain dicts.
+    Rows where `key` is missing or empty are skipped.
+    """
+    rows = ws.iter_rows(values_only=True)
+    headers = next(rows, None)
+    data = {}
+    if headers is None:
+        return data
+    read = record.row_reader(headers) if record is not None else lambda row: dict(zip(headers, row))
+    width = len(headers)
+    for row in rows:
+        if len(row) < width:
+            row += (None,) * (width - len(row))
+        entry = read(row)
+        if key in entry and entry[key]:  # Only add if the key exists and is not empty
+            data[entry[key]] = entry
+    return data
+
+class WorkbookSource:
+    """
+    Opens an input workbook once and serves the Orders, BillTo and Items
+    sheets from that single handle.
+
+    The workbook is opened read-only, so a sheet is only parsed when it is
+    actually requested; the BillTo and Items indexes are built on first use
+    and cached for the lifetime of the source. With a `master`
+    (master_index.MasterDataIndex) they are served from its persisted
+    index instead, and the sheets are only parsed when they have changed.
+
+    Usage:
+        with WorkbookSource(path) as source:
+            bill_to_data = source.bill_to()
+            for order in source.orders():
+                ...
+    """
+
+    def __init__(self, path: str, master=None):
+        self.path = path
+        self._master = master
+        if master is None:
+            self._open()
+        else:
+            # Opened on first use: a fresh master index may mean it never is
+            self._wb = None
+        self._bill_to = None
+        self._items = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _open(self):
+        with metrics.timer("load_workbook"):
+            self._wb = load_workbook(self.path, read_only=True, data_only=True)
+        return self._wb
+
+    def _sheet(self, name: str):
+        ws = (self._wb or self._open())[name]
+        # Read-only sheets trust the stored <dimension>, which many writers
+        # leave stale or omit; size the sheet from its actual rows instead
+        ws.reset_dimensions()
+        return ws
+
+    def close(self) -> None:
+        if self._wb is not None:
+            self._wb.close()
+
+    def orders(self):
+        """
+        Streams the Orders sheet, yielding one typed dict per order.
+        """
+        return _iter_order_rows(self._sheet("Orders"))
+
+    def bill_to(self) -> dict:
+        """
+        Returns the BillTo sheet indexed by CustomerID (empty if the sheet is missing).
+        """
+        if self._bill_to is None:
+            self._bill_to = self._sheet_index("BillTo", "CustomerID", "bill-to", Customer)
+        return self._bill_to
+
+    def items(self) -> dict:
+        """
+        Returns the Items sheet indexed by ItemID (empty if the sheet is missing).
+        """
+        if self._items is None:
+            self._items = self._sheet_index("Items", "ItemID", "item")
+        return self._items
+
+    def _sheet_index(self, sheet: str, key: str, label: str, record=None):
+        def build():
+            try:
+                return _index_rows(self._sheet(sheet), key, record)
+            except KeyError:
+                print(f"Warning: Could not load {label} data from {self.path}. Using empty {label} data.")
+                return {}
+        if self._master is None:
+            return build()
+        return self._master.table(self.path, sheet, key, build, record)
+
+    def load(self) -> tuple[list[dict], dict, dict]:
+        """
+        Reads everything at once and returns (orders, bill_to_data, item_data).
+        """
+        return list(self.orders()), self.bill_to(), self.items()
+
+def IterOrders(path: str):
+    """
+    Streams the Orders sheet row by row and yields one dict per order.
+    Expects columns: CustomerID, ItemID, Qty, Price, CustomerName, Email
+
+    The workbook is opened in read-only mode, so rows are parsed lazily and
+    memory stays flat no matter how many orders the sheet holds.
+    """
+    with WorkbookSource(path) as source:
+        yield from source.orders()
+
 def LoadOrders(path: str) -> list[dict]:
     """
     Reads the Orders sheet and returns a list of dicts. 
     Expects columns: CustomerID, ItemID, Qty, Price, CustomerName, Email
     """
-    wb = load_workbook(path, data_only=True)
-    ws = wb["Orders"]
-    rows = list(ws.values)
-    headers = rows[0]
-    orders = []
-    for row in rows[1:]:
-        entry = dict(zip(headers, row))
-        # convert numeric fields
-        if "Qty" in entry:
-            entry["Qty"] = int(entry["Qty"])
-        if "Price" in entry:
-            entry["Price"] = float(entry["Price"])
-        orders.append(entry)
-    return orders
-
-def LoadBillToData(path: str) -> dict:
+    return list(IterOrders(path))
+
+def LoadBillToData(path: str, master=None) -> dict:
     """
     Reads the BillTo sheet and returns a dict mapping CustomerID to its row data.
     Expects columns: CustomerID, CustomerName, Email, Phone, Address, City
     
     If a customer is not found in the bill-to data, returns an empty dict for that customer.
+    With a `master` (master_index.MasterDataIndex) a read-only mapping
+    backed by its persisted index is returned instead.
     """
     try:
-        wb = load_workbook(path, data_only=True)
-        ws = wb["BillTo"]
-        rows = list(ws.values)
-        headers = rows[0]
-        data = {}
-        for row in rows[1:]:
-            entry = dict(zip(headers, row))
-            if "CustomerID" in entry and entry["CustomerID"]:  # Only add if CustomerID exists and is not empty
-                data[entry["CustomerID"]] = entry
-        return data
-    except (KeyError, FileNotFoundError):
+        with WorkbookSource(path, master) as source:
+            return source.bill_to()
+    except FileNotFoundError:
         print(f"Warning: Could not load bill-to data from {path}. Using empty bill-to data.")
         return {}
 
-def LoadItemData(path: str) -> dict:
+def LoadItemData(path: str, master=None) -> dict:
     """
     Reads the Items sheet and returns a dict mapping ItemID to item details.
     Expects columns: ItemID, Name, Description, UnitPrice
+    With a `master` (master_index.MasterDataIndex) a read-only mapping
+    backed by its persisted index is returned instead.
     """
     try:
-        wb = load_workbook(path, data_only=True)
-        ws = wb["Items"]
-        rows = list(ws.values)
-        headers = rows[0]
-        data = {}
-        for row in rows[1:]:
-            entry = dict(zip(headers, row))
-            if "ItemID" in entry and entry["ItemID"]:  # Only add if ItemID exists and is not empty
-                data[entry["ItemID"]] = entry
-        return data
-    except (KeyError, FileNotFoundError):
+        with WorkbookSource(path, master) as source:
+            return source.items()
+    except FileNotFoundError:
         print(f"Warning: Could not load item data from {path}. Using empty item data.")
         return {}
 
-def FormatInvoice(order: dict) -> Workbook:
+class InvoiceTemplate:
+    """
+    The static part of the invoice sheet, built once and cloned per invoice.
+
+    The title, company block, Bill To/Ship To and metadata labels, table
+    header, column widths and page setup are laid out a single time. Every
+    style is registered up front (see invoice_styles.py) and `styles`
+    maps each style name to its precomputed reference, so `clone`
+    only copies cell values and style references and per-invoice work
+    grows with the number of line items, not the layout.
+    """
+
+    VERSION = 1  # bump whenever the layout changes; cached renders are keyed on it
+    TABLE_START = 21  # header row of the line-items table
+    HEADERS = ["Qty", "Description", "Unit Price", "Amount", "Notes", "Status"]
+    COLUMN_WIDTHS = {"A": 8, "B": 30, "C": 14, "D": 14, "E": 20, "F": 12}
+
+    def __init__(self):
+        self.wb = Workbook()
+        ws = self.wb.active
+        ws.title = "Invoice"
+        # Register the shared styles once; cells take them by reference
+        styles = self.styles = invoice_styles.register(self.wb)
+
+        def put(row, column, value, style):
+            cell = ws.cell(row=row, column=column, value=value)
+            cell._style = copy(styles[style])
+
+        put(4, 2, "INVOICE", "title")
+
+        # — Company Info (the phone line is filled per invoice) —
+        for i, txt in enumerate(["Yukon Packing", "443 Maple Avenue", "Ontario, NT B4M 3B7", None], start=9):
+            put(i, 1, txt, "company")
+
+        # — Bill To / Ship To —
+        put(14, 1, "Bill To", "heading")
+        put(14, 3, "Ship To", "heading")
+        for column in (1, 3):
+            for r in range(15, 20):
+                put(r, column, None, "address")
+
+        # — Metadata labels —
+        for row, label in enumerate(["Invoice #", "Invoice Date", "P.O.#", "Due Date"], start=14):
+            put(row, 5, label, "label")
+            put(row, 6, None, "value")
+
+        # — Line-Items Table header —
+        for i, h in enumerate(self.HEADERS, start=1):
+            put(self.TABLE_START, i, h, "table_header")
+
+        self._static_cells = sorted((coord, cell.value, cell._style) for coord, cell in ws._cells.items())
+
+    def clone(self, logo_path: str = DEFAULT_LOGO_PATH) -> Workbook:
+        """
+        Returns a new workbook holding a copy of the static invoice layout,
+        with the logo at `logo_path` (None for no logo).
+        """
+        wb = Workbook()
+        self.share_styles(wb)
+        ws = wb.active
+        ws.title = "Invoice"
+
+        for (row, column), value, style in self._static_cells:
+            cell = ws.cell(row=row, column=column, value=value)
+            cell._style = copy(style)
+
+        self.setup_sheet(ws, logo_path)
+        ws.merge_cells("B4:F4")
+        return wb
+
+    def share_styles(self, wb: Workbook) -> None:
+        """
+        Gives `wb` copies of the template's style tables, so the template's
+        precomputed style references are valid in it.
+        """
+        for attr in ("_fonts", "_fills", "_borders", "_alignments", "_protections",
+                     "_number_formats", "_cell_styles"):
+            setattr(wb, attr, IndexedList(getattr(self.wb, attr)))
+
+    def setup_sheet(self, ws, logo_path: str = DEFAULT_LOGO_PATH) -> None:
+        """
+        Adds the logo, column widths and page setup to an invoice sheet.
+        Also works on write-only sheets, where it must be called before
+        any row is written.
+        """
+        cached = get_logo(logo_path) if logo_path else None
+        if cached is not None:
+            logo = _LogoImage(cached)
+            logo.width, logo.height = 150, 150
+            ws.add_image(logo, "A1")
+
+        # — Column Widths & Page Setup —
+        for col, width in self.COLUMN_WIDTHS.items():
+            ws.column_dimensions[col].width = width
+        ws.page_margins = PageMargins(left=0.5, right=0.5, top=0.75, bottom=0.75)
+        ws.page_setup.orientation = "portrait"
+        ws.page_setup.fitToPage = True
+        ws.page_setup.fitToWidth = 1
+        ws.page_setup.fitToHeight = 0
+
+class _LogoImage(Image):
+    """
+    A worksheet image backed by a CachedLogo, so the file is not re-read
+    or re-decoded for every workbook that embeds it.
+    """
+
+    def __init__(self, logo):
+        self.ref = logo.path
+        self.format = "png"
+        self.width, self.height = logo.size
+        self._png = logo.png
+
+    def _data(self):
+        return self._png
+
+_invoice_template = None
+
+def GetInvoiceTemplate() -> InvoiceTemplate:
+    """
+    Returns the process-wide InvoiceTemplate, building it on first use.
+    """
+    global _invoice_template
+    if _invoice_template is None:
+        _invoice_template = InvoiceTemplate()
+    return _invoice_template
+
+@metrics.timed("format")
+def FormatInvoice(order: dict, logo_path: str = DEFAULT_LOGO_PATH) -> Workbook:
     """
     Generate a professional, black-and-white invoice with a styled table and currency formatting.
+
+    The static layout comes from the shared InvoiceTemplate; only the
+    order-specific cells are written here. The logo is read from
+    `logo_path` once per process and reused (None leaves it out).
     """
-    wb = Workbook()
+    template = GetInvoiceTemplate()
+    wb = template.clone(logo_path)
     ws = wb.active
-    ws.title = "Invoice"
 
-    # — Logo & Title —
-    try:
-        logo = Image("docs/assets/logo.png")
-        logo.width, logo.height = 150, 150
-        ws.add_image(logo, "A1")
-    except FileNotFoundError:
-        pass
-
-    ws.merge_cells("B4:F4")
-    title = ws["B4"]
-    title.value = "INVOICE"
-    title.font = Font(size=20, bold=True, color="000000")
-    title.alignment = Alignment(horizontal="right", vertical="top")
-
-    # — Company Info & Contact —
-    company_lines = [
-        "Yukon Packing",
-        "443 Maple Avenue",
-        "Ontario, NT B4M 3B7",
-        f"Phone: {order.get('CompanyContact','')}"
-    ]
-    for i, txt in enumerate(company_lines, start=9):
-        cell = ws[f"A{i}"]
-        cell.value = txt
-        cell.font = Font(size=11, color="000000")
-        cell.alignment = Alignment(horizontal="left")
-
-    # — Bill To / Ship To —
-    ws["A14"].value = "Bill To"
-    ws["C14"].value = "Ship To"
-    for cell in ("A14","C14"):
-        ws[cell].font = Font(size=12, bold=True, color="000000")
-
-    for col, key, col_offset in [("A","BillTo",0), ("C","ShipTo",0)]:
-        info = order.get(key, {})
-        ws[f"{col}15"].value = info.get("CustomerName","")
-        ws[f"{col}16"].value = info.get("Address","")
-        ws[f"{col}17"].value = info.get("City","")
-        ws[f"{col}18"].value = f"Phone: {info.get('Phone','')}"
-        ws[f"{col}19"].value = f"Email: {info.get('Email','')}"
-        for r in range(15,20):
-            ws[f"{col}{r}"].font = Font(size=11, color="000000")
-
-    # — Metadata —
-    meta = {
-        "Invoice #":     order["InvoiceNumber"],
-        "Invoice Date":  (order["InvoiceDate"].strftime("%d/%m/%Y")
-                          if isinstance(order["InvoiceDate"], datetime)
-                          else order["InvoiceDate"]),
-        "P.O.#":         order.get("PO",""),
-        "Due Date":      (order["DueDate"].strftime("%d/%m/%Y")
-                          if isinstance(order["DueDate"], datetime)
-                          else order["DueDate"])
-    }
-    row = 14
-    for label, val in meta.items():
-        lbl_cell = ws[f"E{row}"]
-        val_cell = ws[f"F{row}"]
-        lbl_cell.value = label
-        val_cell.value = val
-        lbl_cell.font = Font(bold=True, color="000000")
-        val_cell.font = Font(color="000000")
-        val_cell.alignment = Alignment(horizontal="right")
-        row += 1
-
-    # — Line-Items Table —
-    start = 21  # leave a blank row above for breathing room
-    headers = ["Qty", "Description", "Unit Price", "Amount", "Notes", "Status"]
-    thin = Side(border_style="thin", color="000000")
-    border = Border(top=thin, bottom=thin, left=thin, right=thin)
-
-    # Header row
-    for i, h in enumerate(headers, start=1):
-        cell = ws.cell(row=start, column=i, value=h)
-        cell.font = Font(bold=True, color="000000")
-        cell.alignment = Alignment(horizontal="center")
-        cell.border = border
-
-    # Data rows
-    for idx, item in enumerate(order["Items"], start=1):
-        r = start + idx
-        # Qty
-        ws.cell(r, 1, item["Qty"]).border = border
-        # Description
-        ws.cell(r, 2, item["Description"]).border = border
-        # Unit Price
-        up = ws.cell(r, 3, item["UnitPrice"])
-        up.number_format = '"$"#,##0.00'
-        up.alignment = Alignment(horizontal="right")
-        up.border = border
-        # Amount
-        amt = item["Qty"] * item["UnitPrice"]
-        a = ws.cell(r, 4, amt)
-        a.number_format = '"$"#,##0.00'
-        a.alignment = Alignment(horizontal="right")
-        a.border = border
-        # Notes (empty)
-        ws.cell(r, 5, "").border = border
-        # Status (empty)
-        ws.cell(r, 6, "").border = border
+    for row, column, value, style in _InvoiceCells(order, template):
+        cell = ws.cell(row=row, column=column, value=value)
+        if style is not None:
+            cell._style = copy(style)
 
     # Turn into a styled Table (black & white)
-    last_row = start + len(order["Items"])
-    tbl = Table(displayName="InvoiceTable", ref=f"A{start}:F{last_row}")
-    tbl_style = TableStyleInfo(
+    ws.add_table(_InvoiceTable("InvoiceTable", template.TABLE_START, len(order["Items"])))
+
+    return wb
+
+def _InvoiceCells(order: dict, template: InvoiceTemplate):
+    """
+    Yields (row, column, value, style) for every order-specific cell of an
+    invoice sheet laid out by `template`, in row order (and column order
+    within a row), so they can be streamed to a write-only sheet. A style
+    of None keeps the template's style for that cell.
+    """
+    with key_errors():
+        order = Invoice.of(order)
+        # — Company Contact —
+        yield 12, 1, f"Phone: {getattr(order, 'CompanyContact', '')}", None
+
+        # — Bill To / Ship To / Metadata —
+        invoice_date, due_date = order.InvoiceDate, order.DueDate
+        meta = [
+            order.InvoiceNumber,
+            (invoice_date.strftime("%d/%m/%Y")
+             if isinstance(invoice_date, datetime)
+             else invoice_date),
+            getattr(order, "PO", ""),
+            (due_date.strftime("%d/%m/%Y")
+             if isinstance(due_date, datetime)
+             else due_date),
+        ]
+        yield 14, 6, meta[0], None
+        bill_to, ship_to = getattr(order, "BillTo", {}), getattr(order, "ShipTo", {})
+        for row, key, prefix in [(15, "CustomerName", None), (16, "Address", None), (17, "City", None),
+                                 (18, "Phone", "Phone: "), (19, "Email", "Email: ")]:
+            for column, info in ((1, bill_to), (3, ship_to)):
+                value = info.get(key, "")
+                # Blank sheet cells read as None; keep them blank rather than "None"
+                if prefix is not None:
+                    value = prefix + ("" if value is None else str(value))
+                yield row, column, value, None
+            if row - 14 < len(meta):
+                yield row, 6, meta[row - 14], None
+
+        # — Line-Items Table —
+        amounts, sub, gst, total = order_totals(order)
+        start = template.TABLE_START
+        item_style, money_style = template.styles["item"], template.styles["money"]
+        items = order.Items
+        for idx, (item, amt) in enumerate(zip(items, amounts), start=1):
+            item = LineItem.of(item)
+            r = start + idx
+            yield r, 1, item.Qty, item_style
+            yield r, 2, item.Description, item_style
+            yield r, 3, item.UnitPrice, money_style
+            yield r, 4, amt, money_style
+            yield r, 5, "", item_style   # Notes (empty)
+            yield r, 6, "", item_style   # Status (empty)
+
+        # — Summary —
+        summary = [("Subtotal", sub), ("GST 5%", gst), ("TOTAL", total)]
+        base = start + len(items) + 2
+        for i, (lbl, val) in enumerate(summary):
+            yield base + i, 5, lbl, template.styles["summary_label"]
+            yield base + i, 6, val, template.styles["summary_value"]
+
+        # — Terms & Conditions —
+        trow = base + 4
+        yield trow, 1, "Terms & Conditions:", template.styles["label"]
+        yield trow + 1, 1, getattr(order, "Terms", "Payment is due within 15 days."), template.styles["text"]
+
+@metrics.timed("format")
+def FormatInvoiceStreaming(order: dict, logo_path: str = DEFAULT_LOGO_PATH) -> Workbook:
+    """
+    The same invoice as FormatInvoice, streamed onto a write-only workbook.
+
+    Rows are written out as they are produced, with the template's
+    precomputed styles, so memory stays flat however many line items the
+    invoice has. The result can only be saved (once, e.g. by
+    ExportInvoice); its cells cannot be read back or changed.
+    """
+    template = GetInvoiceTemplate()
+    wb = Workbook(write_only=True)
+    template.share_styles(wb)
+    WriteInvoiceSheet(wb.create_sheet("Invoice"), order, template, "InvoiceTable", logo_path)
+    return wb
+
+# GenerateAllInvoices transforms this many invoices at a time with TransformOrders
+TRANSFORM_BATCH = 1000
+
+# Invoices with at least this many line items are streamed (FormatInvoiceStreaming)
+# when they are formatted only to be exported
+STREAMING_ITEMS = 500
+
+def FormatForExport(order: dict) -> Workbook:
+    if len(order.get("Items", ())) >= STREAMING_ITEMS:
+        return FormatInvoiceStreaming(order)
+    return FormatInvoice(order)
+
+def WriteInvoiceSheet(ws, order: dict, template: InvoiceTemplate, table_name: str,
+                       logo_path: str = DEFAULT_LOGO_PATH) -> None:
+    """
+    Writes one invoice onto an empty write-only worksheet whose workbook
+    shares the template's styles (see InvoiceTemplate.share_styles), then
+    closes the sheet. Only the row being written is held in memory.
+    """
+    template.setup_sheet(ws, logo_path)
+    ws.merged_cells.add("B4:F4")
+
+    written = 0
+    current, line = None, {}
+
+    def flush():
+        nonlocal written
+        while written < current - 1:
+            ws.append([])
+            written += 1
+        row = [None] * max(line)
+        for column, (value, style) in line.items():
+            cell = WriteOnlyCell(ws, value)
+            if style is not None:
+                cell._style = copy(style)
+            row[column - 1] = cell
+        ws.append(row)
+        written += 1
+
+    # The static layout and the order's cells, merged in row order; where
+    # both have a cell the order's value wins
+    variable = (((row, column), value, style) for row, column, value, style in _InvoiceCells(order, template))
+    for (row, column), value, style in heapq.merge(template._static_cells, variable, key=itemgetter(0)):
+        if row != current:
+            if line:
+                flush()
+            current, line = row, {}
+        if style is None and column in line:
+            style = line[column][1]
+        line[column] = (value, style)
+    if line:
+        flush()
+
+    table = _InvoiceTable(table_name, template.TABLE_START, len(order["Items"]))
+    # write-only sheets cannot read the header row back, so name the
+    # columns here (openpyxl warns about this regardless)
+    table.tableColumns = [TableColumn(id=i, name=h) for i, h in enumerate(template.HEADERS, start=1)]
+    # openpyxl only adds the header filter itself when it fills in the columns
+    table.autoFilter = AutoFilter(ref=table.ref)
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", UserWarning)
+        ws.add_table(table)
+    ws.close()
+
+def _InvoiceTable(name: str, start: int, item_count: int) -> Table:
+    """
+    Returns the unstyled (black & white) table over the line items.
+    """
+    tbl = Table(displayName=name, ref=f"A{start}:F{start + item_count}")
+    tbl.tableStyleInfo = TableStyleInfo(
         name="None",  # no styling
         showFirstColumn=False,
         showLastColumn=False,
         showRowStripes=True,
         showColumnStripes=False
     )
-    tbl.tableStyleInfo = tbl_style
-    ws.add_table(tbl)
-
-    # — Summary —
-    sub = sum(i["Qty"] * i["UnitPrice"] for i in order["Items"])
-    gst = round(sub * 0.05, 2)
-    summary = [("Subtotal", sub), ("GST 5%", gst), ("TOTAL", sub + gst)]
-    base = last_row + 2
-    for i, (lbl, val) in enumerate(summary):
-        lbl_cell = ws.cell(base + i, 5, lbl)  
-        val_cell = ws.cell(base + i, 6, val)  
-        lbl_cell.font = Font(bold=True, color="000000")
-        lbl_cell.alignment = Alignment(horizontal="right")
-        val_cell.number_format = '"$"#,##0.00'
-        val_cell.font = Font(color="000000")
-        val_cell.alignment = Alignment(horizontal="right")
-        val_cell.border = border
-
-    # — Terms & Conditions —
-    trow = base + 4
-    ws[f"A{trow}"].value = "Terms & Conditions:"
-    ws[f"A{trow}"].font = Font(bold=True, color="000000")
-    ws[f"A{trow+1}"].value = order.get("Terms", "Payment is due within 15 days.")
-    ws[f"A{trow+1}"].font = Font(color="000000")
-
-    # — Column Widths & Page Setup —
-    ws.column_dimensions["A"].width = 8
-    ws.column_dimensions["B"].width = 30
-    ws.column_dimensions["C"].width = 14
-    ws.column_dimensions["D"].width = 14
-    ws.column_dimensions["E"].width = 20
-    ws.column_dimensions["F"].width = 12
-
-    ws.page_margins = PageMargins(left=0.5, right=0.5, top=0.75, bottom=0.75)
-    ws.page_setup.orientation = ws.ORIENTATION_PORTRAIT
-    ws.page_setup.fitToPage = True
-    ws.page_setup.fitToWidth = 1
-    ws.page_setup.fitToHeight = 0
+    return tbl
 
-    return wb
-
-def ExportInvoice(workbook: Workbook, output_path: str, format: str = "xlsx") -> str:
+@metrics.timed("export", output_file=True)
+def ExportInvoice(workbook: Workbook, output_path: str, format: str = "xlsx", converter=None,
+                  engine: str = "office") -> str:
     """
     Save `workbook` to disk:
       - as .xlsx if format=="xlsx"
+      - as .pdf drawn directly by pdf_renderer if engine=="native"; `workbook`
+        must then be the transformed order dict rather than a Workbook
+      - as .pdf through `converter` if one is given (e.g. a converter.ConverterPool
+        of long-lived LibreOffice instances)
       - as .pdf using Excel COM if format=="pdf" (Windows only)
       - as .pdf using LibreOffice if format=="pdf" (Linux)
     Returns the full path of the generated file.
     """
+    if engine == "native":
+        pdf_path = output_path + ".pdf"
+        data = _RenderNativePdf(workbook, format)
+        with open(pdf_path, "wb") as f:
+            f.write(data)
+        return pdf_path
+    elif engine != "office":
+        raise ValueError(f"Unsupported engine: {engine}")
+
     if format == "xlsx":
         file = output_path + ".xlsx"
-        workbook.save(file)
+        with metrics.timer("save"):
+            workbook.save(file)
         return file
 
     elif format == "pdf":
-        # First save as xlsx
-        xlsx_path = output_path + "_tmp.xlsx"
-        workbook.save(xlsx_path)
-        
+        return _ConvertToPdf(workbook, output_path + ".pdf", converter)
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+
+@metrics.timed("export")
+def ExportInvoiceToBytes(workbook: Workbook, format: str = "xlsx", converter=None,
+                         engine: str = "office") -> bytes:
+    """
+    Like ExportInvoice, but returns the file's contents instead of writing
+    it to a path, e.g. to stream an invoice over HTTP or attach it to an
+    email.
+
+    xlsx output and the native PDF engine never touch the disk. Office PDF
+    conversion needs files, so its temporary .xlsx and .pdf live in the
+    RAM-backed scratch area (see _ScratchDir) and are removed straight away.
+    """
+    if engine == "native":
+        data = _RenderNativePdf(workbook, format)
+    elif engine != "office":
+        raise ValueError(f"Unsupported engine: {engine}")
+    elif format == "xlsx":
+        buf = io.BytesIO()
+        with metrics.timer("save"):
+            workbook.save(buf)
+        data = buf.getvalue()
+    elif format == "pdf":
+        fd, pdf_path = tempfile.mkstemp(prefix="invoice_", suffix=".pdf", dir=_ScratchDir())
+        os.close(fd)
+        try:
+            _ConvertToPdf(workbook, pdf_path, converter)
+            with open(pdf_path, "rb") as f:
+                data = f.read()
+        finally:
+            if os.path.exists(pdf_path):
+                os.remove(pdf_path)
+    else:
+        raise ValueError(f"Unsupported format: {format}")
+    metrics.add_bytes("export", len(data))
+    return data
+
+def _RenderNativePdf(order: dict, format: str) -> bytes:
+    if format != "pdf":
+        raise ValueError(f"The native engine only supports pdf, not {format}")
+    if isinstance(order, Workbook):
+        raise ValueError("The native engine renders from the transformed order dict, not a Workbook")
+    from pdf_renderer import RenderInvoicePDF
+    with metrics.timer("render_pdf"):
+        return RenderInvoicePDF(order)
+
+def _ScratchDir() -> str:
+    """
+    Returns the directory for the converter's temporary files:
+    INVOICE_SCRATCH_DIR if set, else /dev/shm (RAM-backed on Linux) when
+    it is writable, else the system temp directory.
+    """
+    scratch = os.environ.get("INVOICE_SCRATCH_DIR")
+    if scratch:
+        return scratch
+    if os.path.isdir("/dev/shm") and os.access("/dev/shm", os.W_OK):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+def _ConvertToPdf(workbook: Workbook, pdf_path: str, converter=None) -> str:
+    """
+    Converts `workbook` to a PDF at `pdf_path` through `converter`, Excel
+    COM (Windows) or LibreOffice. The intermediate .xlsx is written to the
+    scratch area rather than next to the output, and always removed.
+    """
+    fd, xlsx_path = tempfile.mkstemp(prefix="invoice_", suffix=".xlsx", dir=_ScratchDir())
+    os.close(fd)
+    try:
+        with metrics.timer("save"):
+            workbook.save(xlsx_path)
+
+        if converter is not None:
+            try:
+                with metrics.timer("convert"):
+                    converter.convert(xlsx_path, pdf_path)
+            except Exception as e:
+                raise RuntimeError(f"PDF conversion failed: {str(e)}")
+            return pdf_path
+
         try:
             # Try Windows method first
             from win32com.client import Dispatch
+        except ImportError:
+            # Fall back to LibreOffice on Linux
+            try:
+                out_dir = os.path.dirname(os.path.abspath(pdf_path))
+                _SofficeConvert([xlsx_path], out_dir)
+                # soffice names the PDF after its input
+                stem = os.path.splitext(os.path.basename(xlsx_path))[0]
+                os.replace(os.path.join(out_dir, stem + ".pdf"), pdf_path)
+                return pdf_path
+            except Exception as e:
+                raise RuntimeError(f"PDF conversion failed: {str(e)}")
+
+        with metrics.timer("convert"):
             excel = Dispatch('Excel.Application')
             excel.Visible = False
             wb = excel.Workbooks.Open(os.path.abspath(xlsx_path))
-            pdf_path = output_path + ".pdf"
             wb.ExportAsFixedFormat(0, os.path.abspath(pdf_path))
             wb.Close()
             excel.Quit()
-            os.remove(xlsx_path)
-            return pdf_path
-        except ImportError:
-            # Fall back to LibreOffice on Linux
+        return pdf_path
+    finally:
+        os.remove(xlsx_path)
+
+@metrics.timed("convert")
+def _SofficeConvert(xlsx_paths: list, out_dir: str) -> None:
+    """
+    Converts every file in `xlsx_paths` to PDF with a single headless
+    LibreOffice invocation. Each PDF is written to `out_dir` and named
+    after its input file.
+    """
+    subprocess.run(['soffice', '--headless', '--convert-to', 'pdf', '--outdir', out_dir, *xlsx_paths], check=True)
+
+@metrics.timed("export_batch")
+def ExportInvoicesBatch(workbooks: dict, out_dir: str, chunk_size: int = 50) -> dict:
+    """
+    Export many invoice workbooks to PDF using as few LibreOffice launches
+    as possible.
+
+    Every workbook is first saved to a temporary .xlsx, then the files are
+    converted `chunk_size` at a time, one soffice call per chunk, so the
+    startup cost is paid once per chunk instead of once per invoice.
+
+    Args:
+        workbooks: Dict mapping each invoice's base filename (e.g. its
+            invoice number) to its Workbook
+        out_dir: Directory the PDFs are written to
+        chunk_size: Maximum number of files converted per soffice call
+
+    Returns:
+        Dict mapping each base filename to the path of its PDF.
+    """
+    if chunk_size < 1:
+        raise ValueError("chunk_size must be at least 1")
+    os.makedirs(out_dir, exist_ok=True)
+    out_dir = os.path.abspath(out_dir)
+
+    # soffice names each PDF after its input, so outputs map back by base name
+    results = {base: os.path.join(out_dir, f"{base}.pdf") for base in workbooks}
+    # A PDF left over from an earlier run would hide a failed conversion
+    for path in results.values():
+        if os.path.exists(path):
+            os.remove(path)
+
+    tmp_dir = tempfile.mkdtemp(prefix="invoices_")
+    try:
+        xlsx_paths = []
+        for base, workbook in workbooks.items():
+            xlsx_path = os.path.join(tmp_dir, f"{base}.xlsx")
+            with metrics.timer("save"):
+                workbook.save(xlsx_path)
+            xlsx_paths.append(xlsx_path)
+
+        for i in range(0, len(xlsx_paths), chunk_size):
             try:
-                import subprocess
-                pdf_path = output_path + ".pdf"
-                subprocess.run(['soffice', '--headless', '--convert-to', 'pdf', xlsx_path, '--outdir', os.path.dirname(pdf_path)], check=True)
-                os.remove(xlsx_path)
-                return pdf_path
+                _SofficeConvert(xlsx_paths[i:i + chunk_size], out_dir)
             except Exception as e:
                 raise RuntimeError(f"PDF conversion failed: {str(e)}")
-    else:
-        raise ValueError(f"Unsupported format: {format}")
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    missing = [base for base, path in results.items() if not os.path.exists(path)]
+    if missing:
+        raise RuntimeError(f"PDF conversion failed for: {', '.join(missing)}")
+    return results
     
+@metrics.timed("send")
 def SendInvoice(emailAddr: str, filePath: str, cc: str = None, additional_attachments: list = None) -> None:
     """
     Open Outlook, create a mail item, attach the file at filePath, and send to emailAddr.
@@ -312,38 +755,7 @@ def SendInvoice(emailAddr: str, filePath: str, cc: str = None, additional_attach
         if cc:
             mail.CC = cc
 
-        # Extract invoice number from filename
-        invoice_number = os.path.basename(filePath).split('.')[0]
-        
-        mail.Subject = f"Invoice {invoice_number} - Contoso Logistics"
-        
-        # Create a professional email body
-        email_body = f"""Dear Valued Customer,
-
-I hope this email finds you well. Please find attached Invoice {invoice_number} for your recent order with Contoso Logistics.
-
-Invoice Details:
-- Invoice Number: {invoice_number}
-- Date: {datetime.now().strftime('%B %d, %Y')}
-
-Payment Terms:
-- Payment is due within 15 days from invoice date
-- Payment methods accepted: Bank Transfer, Credit Card
-- For wire transfer details, please refer to the invoice
-
-If you have any questions regarding this invoice or need any clarification, please don't hesitate to contact our accounting department at accounting@contosologistics.com or call us at (416) 555-0123.
-
-Thank you for your business.
-
-Best regards,
-Contoso Logistics
-Accounting Department
-Phone: (416) 555-0123
-Email: accounting@contosologistics.com
-
----
-This is an automated message. Please do not reply directly to this email.
-For immediate assistance, please contact our customer service department."""
+        mail.Subject, email_body = invoice_email_content(filePath)
 
         mail.Body = email_body
         mail.HTMLBody = email_body.replace('\n', '<br>')  # Convert to HTML format
@@ -381,27 +793,381 @@ For immediate assistance, please contact our customer service department."""
     except Exception as e:
         raise RuntimeError(f"Failed to send invoice: {str(e)}")
 
-def GenerateAllInvoices(path_to_orders: str) -> None:
+def _InvoiceBasename(order: dict, transformed_order: dict, taken=()) -> str:
+    """
+    Output filename (without extension) for an order: the OrderID when the
+    sheet has one, otherwise the invoice number. When the OrderID name is
+    in `taken` (e.g. another row of the same order, invoiced separately)
+    the invoice number is appended, so every invoice of a run gets a file
+    of its own.
+    """
+    number = transformed_order["InvoiceNumber"]
+    order_id = order.get("OrderID")
+    if not order_id:
+        return f"invoice_{number}"
+    base = f"invoice_{order_id}"
+    return f"{base}_{number}" if base in taken else base
+
+def _LinesDigest(lines: list[dict]) -> str:
+    """
+    Digest of the order lines an invoice is made from, so a journal entry
+    can be matched against the sheet's current contents.
+    """
+    from order_index import row_digest
+    if len(lines) == 1:
+        return row_digest(lines[0])
+    return row_digest({"lines": [row_digest(line) for line in lines]})
+
+def RenderKey(transformed_order: dict, format: str, engine: str) -> str:
+    """
+    Render cache key for an order: its contents plus everything else that
+    shapes the output (format, engine, layout version and logo).
+    """
+    from render_cache import render_key
+    if engine == "native":
+        from pdf_renderer import LAYOUT_VERSION as version
+    else:
+        version = InvoiceTemplate.VERSION
+    return render_key(transformed_order, format, engine, version, DEFAULT_LOGO_PATH)
+
+def RenderInvoice(transformed_order: dict, output_path: str, format: str = "pdf", converter=None,
+                  engine: str = "office", cache=None) -> str:
+    """
+    Formats and exports a transformed order in one step, reusing an
+    identical earlier render from `cache` when there is one.
+
+    Args:
+        transformed_order: Dict as returned by TransformOrder
+        output_path: Output path without extension
+        format, converter, engine: As for ExportInvoice
+        cache: render_cache.RenderCache to look up and store renders in
+
+    Returns:
+        The full path of the generated file.
+    """
+    if cache is not None:
+        key = RenderKey(transformed_order, format, engine)
+        path = f"{output_path}.{format}"
+        if cache.fetch(key, format, path):
+            metrics.increment("invoice_render_cache_total", result="hit")
+            return path
+        metrics.increment("invoice_render_cache_total", result="miss")
+
+    if engine == "native":
+        # Drawn straight from the order; no workbook is needed
+        path = ExportInvoice(transformed_order, output_path, format=format, engine="native")
+    elif converter is not None:
+        path = ExportInvoice(FormatForExport(transformed_order), output_path, format=format, converter=converter)
+    else:
+        path = ExportInvoice(FormatForExport(transformed_order), output_path, format=format)
+
+    if cache is not None:
+        cache.store(key, format, path)
+    return path
+
+def _RenderInvoice(transformed_order: dict, base: str, converter_pool: int = 0, engine: str = "office",
+                   cache=None) -> str:
+    """
+    Formats and exports a single transformed order to PDF.
+    Module-level so it can be shipped to a worker process.
+    """
+    converter = None
+    if converter_pool and engine != "native":
+        from converter import get_shared_pool
+        converter = get_shared_pool(converter_pool)
+    return RenderInvoice(transformed_order, base, format="pdf", converter=converter, engine=engine, cache=cache)
+
+def _RenderInvoiceMeasured(*args, **kwargs) -> tuple:
+    """
+    Runs _RenderInvoice in a worker process and returns (path, metrics
+    snapshot, error) so the parent can merge what the worker recorded.
+    """
+    with metrics.capture() as registry:
+        try:
+            path = _RenderInvoice(*args, **kwargs)
+        except Exception as e:
+            return None, registry.snapshot(), e
+    return path, registry.snapshot(), None
+
+def _GenerateParallel(jobs, workers: int, send, converter_pool: int = 0, engine: str = "office",
+                      cache=None) -> dict:
+    """
+    Renders `jobs` (transformed_order, base, email) across a process pool and
+    sends each invoice as soon as its PDF is ready.
+
+    At most 2 * workers renders are in flight, so the stream of orders is
+    never buffered in full. Failures are captured per order and returned as
+    a dict mapping the output base name to the exception.
+    """
+    failures = {}
+    pending = {}
+    # Worker processes have their own metrics; ship them back with each result
+    measured = metrics.enabled()
+    render = _RenderInvoiceMeasured if measured else _RenderInvoice
+
+    def finish(done):
+        for fut in done:
+            base, email = pending.pop(fut)
+            try:
+                if measured:
+                    pdf_path, recorded, error = fut.result()
+                    metrics.merge(recorded)
+                    if error is not None:
+                        raise error
+                else:
+                    pdf_path = fut.result()
+                send(email, pdf_path)
+            except Exception as e:
+                failures[base] = e
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for transformed_order, base, email in jobs:
+            if len(pending) >= workers * 2:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                finish(done)
+            fut = pool.submit(render, transformed_order, base, converter_pool, engine, cache=cache)
+            pending[fut] = (base, email)
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            finish(done)
+    return failures
+
+def _KeyedOrderGroups(orders, group_by: str = None, keyed: bool = True):
+    """
+    Yields (key, lines) for every invoice in a run, where `key` identifies
+    the invoice stably across reruns of the same workbook: the group_by
+    value when grouping, otherwise the row's contents and how many
+    identical rows came before it (see order_index.RowKeys), so inserting,
+    deleting or sorting other rows does not change it. Without `keyed`
+    every key is None and no row is hashed.
+    """
+    row_key = None
+    if keyed:
+        from order_index import RowKeys
+        row_key = RowKeys()
+
+    def content_key(order):
+        return f"row:{row_key(order)[1]}" if row_key is not None else None
+
+    if group_by is None:
+        for order in orders:
+            yield content_key(order), [order]
+        return
+    for lines in GroupOrders(orders, by=group_by):
+        value = lines[0].get(group_by)
+        if value in (None, ""):
+            yield content_key(lines[0]), lines
+        elif keyed:
+            yield f"{group_by}:{value}", lines
+        else:
+            yield None, lines
+
+def GenerateAllInvoices(path_to_orders: str, workers: int = 1, converter_pool: int = 0,
+                        engine: str = "office", group_by: str = None, sender=None,
+                        stages: dict = None, journal=None, index=None, cache=None,
+                        master=None, archive=None) -> dict:
     """
     Full pipeline: load all orders, format each invoice, export to PDF,
     and send via Outlook.
+
+    Args:
+        path_to_orders: Workbook with an Orders sheet (and optionally BillTo)
+        workers: Number of processes used to format and export invoices.
+            With 1 (the default) everything runs in-process and the first
+            error is raised. With more, rendering is fanned out to a process
+            pool and errors are collected per order instead.
+        converter_pool: Number of persistent LibreOffice instances each
+            rendering process keeps for PDF conversion. 0 (the default)
+            converts every invoice with a fresh Excel/soffice launch.
+        engine: "office" to format a workbook and convert it with
+            Excel/LibreOffice, or "native" to draw the PDF directly.
+        group_by: Column ("OrderID" or "CustomerID") whose matching rows are
+            combined into one multi-line invoice. By default every row is
+            invoiced on its own and rows are streamed; grouping has to
+            read the whole sheet first.
+        sender: Object whose send(email, path) delivers each invoice, such
+            as smtp_sender.SMTPSender. Defaults to SendInvoice (Outlook).
+        stages: Worker counts for the asyncio pipeline, e.g.
+            {"format_workers": 2, "export_workers": 4, "send_workers": 8}.
+            When given, formatting, export and sending overlap through
+            bounded queues (see pipeline.RunPipeline) and errors are
+            collected per order. Cannot be combined with workers > 1.
+        journal: journal.RunJournal recording each invoice's progress.
+            Invoices it shows as sent are skipped, exported ones are sent
+            without re-rendering, and the rest are rendered from their
+            recorded transformed order so their numbers do not change.
+        index: order_index.OrderIndex of rows invoiced by earlier runs.
+            Only new or changed rows are transformed, rendered and sent,
+            and each row is added to the index once its invoice is sent.
+        cache: render_cache.RenderCache; invoices identical to an earlier
+            render are copied from it instead of being rendered again.
+        master: master_index.MasterDataIndex; BillTo customers are looked
+            up in its persisted index, which is only rebuilt when the
+            BillTo sheet has changed.
+        archive: invoice_archive.InvoiceArchive every invoice is also
+            written to, as one sheet of a bulk .xlsx shard, once it has
+            been sent. Invoices that fail to render or send are left out.
+
+    Returns:
+        Dict mapping each failed invoice's base filename to its exception
+        (always empty when workers == 1 and no stages are given).
     """
-    orders = LoadOrders(path_to_orders)
-    bill_to_data = LoadBillToData(path_to_orders)
-    
-    for order in orders:
-        # Transform order data
-        transformed_order = TransformOrder(order, bill_to_data)
-        
-        # 1) Format
-        wb = FormatInvoice(transformed_order)
+    if stages is not None and workers > 1:
+        raise ValueError("Use either workers or stages, not both")
 
-        # 2) Export (use OrderID as base filename)
-        base = f"invoice_{order.get('OrderID', '')}"
-        pdf_path = ExportInvoice(wb, base, format="pdf")
+    # One open workbook serves both sheets; orders are streamed so large
+    # sheets are never held in memory at once. Invoice/PO numbers are
+    # reserved in blocks for the run and the unused tail handed back.
+    # Metrics (when enabled) are flushed to their sinks once the run ends.
+    with metrics.flushing(), WorkbookSource(path_to_orders, master) as source, ReservedNumbers():
+        bill_to_data = source.bill_to()
 
-        # 3) Send
-        SendInvoice(order.get("Email", ""), pdf_path)
+        send = sender.send if sender is not None else SendInvoice
+        collect = stages is not None or workers > 1
+        resend_failures = {}
+
+        # Bookkeeping that must only happen once an invoice has been sent
+        track = journal is not None or index is not None or archive is not None
+        if track:
+            from journal import EXPORTED, SENT
+            tracked = {}  # journal key -> (index row keys, transformed order)
+            job_keys = {}  # output path -> journal key; bases are unique within a run
+            archive_lock = threading.Lock()  # send stages may run on several threads
+            deliver = send
+
+            def send(email, pdf_path):
+                key = job_keys.pop(os.path.abspath(pdf_path))
+                send_job(key, email, pdf_path)
+
+            def send_job(key, email, pdf_path):
+                row_keys, transformed_order = tracked.pop(key)
+                if journal is not None:
+                    journal.record_exported(key, pdf_path)
+                try:
+                    deliver(email, pdf_path)
+                except Exception as e:
+                    if journal is not None:
+                        journal.record_failed(key, e)
+                    raise
+                if journal is not None:
+                    journal.record_sent(key)
+                if index is not None:
+                    index.record(row_keys, transformed_order["InvoiceNumber"])
+                if archive is not None:
+                    with archive_lock:
+                        archive.add(transformed_order)
+
+        if index is not None:
+            from order_index import RowKeys
+            row_key = RowKeys()
+            # Every line of a changed order is reinvoiced; wider groups
+            # (e.g. CustomerID) only pick up their new lines
+            whole_groups = group_by in (None, "OrderID")
+
+        # Orders are transformed here, in order, so invoice/PO numbers are
+        # allocated deterministically before work is handed to the pool
+        bases = set()
+
+        def unsent_groups():
+            for key, lines in _KeyedOrderGroups(source.orders(), group_by, keyed=track):
+                row_keys = ()
+                if index is not None:
+                    keyed = [(row_key(line), line) for line in lines]
+                    pending = [(k, line) for k, line in keyed if not index.seen(k)]
+                    if not pending:
+                        continue
+                    if not whole_groups:
+                        keyed = pending
+                    row_keys = [k for k, _ in keyed]
+                    lines = [line for _, line in keyed]
+
+                digest = entry = None
+                if journal is not None:
+                    # An entry made from other lines (the sheet was edited) is ignored
+                    digest = _LinesDigest(lines)
+                    entry = journal.get(key, digest)
+                if entry is not None and entry["status"] == SENT:
+                    continue
+                yield key, lines, row_keys, digest, entry
+
+        def jobs():
+            groups = unsent_groups()
+            while True:
+                batch = list(islice(groups, TRANSFORM_BATCH))
+                if not batch:
+                    return
+                # Invoices not restored from the journal are transformed
+                # together, so their totals take one columnar pass
+                transformed = iter(TransformOrders(
+                    [lines for _, lines, _, _, entry in batch if entry is None or entry["order"] is None],
+                    bill_to_data))
+                for key, lines, row_keys, digest, entry in batch:
+                    first = lines[0]
+                    email = first.get("Email", "")
+                    if entry is not None and entry["order"] is not None:
+                        transformed_order = entry["order"]
+                    else:
+                        transformed_order = next(transformed)
+                    # Name by OrderID only when every line shares it
+                    same_order = all(line.get("OrderID") == first.get("OrderID") for line in lines)
+                    base = _InvoiceBasename(first if same_order else {}, transformed_order, bases)
+                    bases.add(base)
+
+                    if track:
+                        tracked[key] = (row_keys, transformed_order)
+                    if journal is not None:
+                        if entry is None or entry["order"] is None:
+                            journal.record_transformed(key, transformed_order, email, digest)
+                        elif entry["status"] == EXPORTED and os.path.exists(entry["output_path"]):
+                            # Rendered before the previous run stopped; only the send is left
+                            try:
+                                send_job(key, entry["email"], entry["output_path"])
+                            except Exception as e:
+                                if not collect:
+                                    raise
+                                resend_failures[base] = e
+                            continue
+                    if track:
+                        job_keys[os.path.abspath(base + ".pdf")] = key
+                    yield transformed_order, base, email
+
+        def render_failed(failures: dict) -> None:
+            # Send failures are journaled by send_job; these never got that far
+            if journal is not None:
+                for base, error in failures.items():
+                    key = job_keys.pop(os.path.abspath(base + ".pdf"), None)
+                    if key is not None:
+                        journal.record_failed(key, error)
+
+        if stages is not None:
+            import asyncio
+            from pipeline import RunPipeline
+            failures = asyncio.run(RunPipeline(jobs(), send, converter_pool=converter_pool,
+                                               engine=engine, cache=cache, **stages))
+            render_failed(failures)
+            return {**resend_failures, **failures}
+
+        if workers > 1:
+            failures = _GenerateParallel(jobs(), workers, send, converter_pool, engine, cache)
+            render_failed(failures)
+            return {**resend_failures, **failures}
+
+        for transformed_order, base, email in jobs():
+            # 1) Format & 2) Export
+            try:
+                pdf_path = _RenderInvoice(transformed_order, base, converter_pool, engine, cache=cache)
+            except Exception as e:
+                render_failed({base: e})
+                raise
+
+            # 3) Send
+            send(email, pdf_path)
+        return {}
+
+# In a real application, you would store and retrieve these from a database.
+# For now, we'll use simple file-based counters guarded by a file lock.
+_po_numbers = NumberAllocator("po_counter.txt", "PO")
+_invoice_numbers = NumberAllocator("invoice_counter.txt", "INV")
 
 def get_next_po_number() -> str:
     """
@@ -411,26 +1177,7 @@ def get_next_po_number() -> str:
     Returns:
         str: A formatted PO number
     """
-    today = datetime.now().strftime("%Y%m%d")
-    # In a real application, you would store and retrieve this from a database
-    # For now, we'll use a simple file-based approach
-    counter_file = "po_counter.txt"
-    
-    try:
-        with open(counter_file, "r") as f:
-            last_date, counter = f.read().strip().split("-")
-            counter = int(counter)
-            if last_date != today:
-                counter = 1
-            else:
-                counter += 1
-    except (FileNotFoundError, ValueError):
-        counter = 1
-    
-    with open(counter_file, "w") as f:
-        f.write(f"{today}-{counter}")
-    
-    return f"PO-{today}-{counter:04d}"
+    return _po_numbers.next()
 
 def get_next_invoice_number() -> str:
     """
@@ -440,26 +1187,17 @@ def get_next_invoice_number() -> str:
     Returns:
         str: A formatted invoice number
     """
-    today = datetime.now().strftime("%Y%m%d")
-    # In a real application, you would store and retrieve this from a database
-    # For now, we'll use a simple file-based approach
-    counter_file = "invoice_counter.txt"
-    
-    try:
-        with open(counter_file, "r") as f:
-            last_date, counter = f.read().strip().split("-")
-            counter = int(counter)
-            if last_date != today:
-                counter = 1
-            else:
-                counter += 1
-    except (FileNotFoundError, ValueError):
-        counter = 1
-    
-    with open(counter_file, "w") as f:
-        f.write(f"{today}-{counter}")
-    
-    return f"INV-{today}-{counter:04d}"
+    return _invoice_numbers.next()
+
+@contextmanager
+def ReservedNumbers(block_size: int = 1000):
+    """
+    Within this block, invoice and PO numbers are reserved `block_size` at
+    a time and issued from memory instead of rewriting the counter files
+    for every number. Numbers left unused are handed back on exit.
+    """
+    with _invoice_numbers.reserving(block_size), _po_numbers.reserving(block_size):
+        yield
 
 def TransformOrder(order: dict, bill_to_data: dict) -> dict:
     """
@@ -470,36 +1208,226 @@ def TransformOrder(order: dict, bill_to_data: dict) -> dict:
         bill_to_data: Dict mapping CustomerID to bill-to information
         
     Returns:
-        Dict in the format expected by FormatInvoice
+        records.Invoice in the format expected by FormatInvoice; it works
+        as a dict, and records.plain() turns it into one for serializing.
+        A required field missing from `order` raises KeyError.
+    """
+    return TransformOrderGroup([order], bill_to_data)
+
+def TransformOrderGroup(lines: list[dict], bill_to_data: dict) -> dict:
     """
-    # Get bill-to information
-    bill_to = bill_to_data.get(order["CustomerID"], {})
-    email = bill_to.get("Email", order["Email"])  # Get email from customer's bill-to data
+    Transforms several order lines for the same customer into a single
+    invoice in the format expected by FormatInvoice, with one item per line.
+
+    Args:
+        lines: Order dicts (as from LoadOrders) that belong on one invoice
+        bill_to_data: Dict mapping CustomerID to bill-to information
+
+    Returns:
+        Dict in the format expected by FormatInvoice, including its
+        line amounts and Subtotal, GST and Total
+    """
+    transformed_order = _TransformLines(lines, bill_to_data)
+    apply_totals([transformed_order])
+    return transformed_order
+
+@metrics.timed("transform_batch")
+def TransformOrders(groups, bill_to_data: dict) -> list[dict]:
+    """
+    Transforms many invoices at once. Numbers are allocated in order as
+    with TransformOrderGroup, but the amounts, subtotals, GST and totals
+    of the whole batch are computed in one columnar pass (see totals.py).
+
+    Args:
+        groups: Iterable of order line lists, one per invoice (e.g. from
+            GroupOrders, or [[order] for order in orders])
+        bill_to_data: Dict mapping CustomerID to bill-to information
+
+    Returns:
+        List of dicts in the format expected by FormatInvoice
+    """
+    transformed_orders = [_TransformLines(lines, bill_to_data) for lines in groups]
+    apply_totals(transformed_orders)
+    return transformed_orders
+
+@metrics.timed("transform")
+def _TransformLines(lines: list[dict], bill_to_data: dict) -> dict:
+    with key_errors():
+        lines = [Order.of(line) for line in lines]
+        order = lines[0]
+        customer_id = order.CustomerID
+        if any(line.CustomerID != customer_id for line in lines):
+            raise ValueError(f"Cannot invoice lines for several customers together: {getattr(order, 'OrderID', '')}")
+
+        # Get bill-to information
+        bill_to = bill_to_data.get(customer_id, {})
+        email = bill_to.get("Email", order.Email)  # Get email from customer's bill-to data
     
-    # Create items list
-    items = [{
-        "Qty": order["Qty"],
-        "Description": order.get("ItemName", f"Item {order['ItemID']}"),  # Use ItemName if available
-        "UnitPrice": order["Price"]
-    }]
+        # Create items list
+        items = []
+        for line in lines:
+            description = getattr(line, "ItemName", None)  # Use ItemName if available
+            if description is None:
+                description = f"Item {line.ItemID}"
+            items.append(LineItem(Qty=line.Qty, Description=description, UnitPrice=line.Price))
     
-    # Generate sequential invoice number
-    invoice_number = get_next_invoice_number()
+        # Generate sequential invoice number
+        invoice_number = get_next_invoice_number()
     
-    # Calculate due date (15 days from now)
-    due_date = datetime.now().replace(day=datetime.now().day + 15)
+        # Calculate due date (15 days from now)
+        due_date = datetime.now() + timedelta(days=15)
     
-    return {
-        "CustomerID": order["CustomerID"],
-        "CustomerName": order["CustomerName"],
-        "Email": email,  # Use bill-to email if available, otherwise use order email
-        "BillTo": bill_to,
-        "ShipTo": bill_to,  # Using same address for shipping
-        "CompanyContact": "555-0123",  # You may want to load this from a config
-        "InvoiceNumber": invoice_number,
-        "InvoiceDate": datetime.now(),
-        "PO": get_next_po_number(),  # Generate sequential PO number
-        "DueDate": due_date,
-        "Items": items,
-        "Terms": "Payment is due within 15 days."
-    }
+        return Invoice(
+            CustomerID=customer_id,
+            CustomerName=order.CustomerName,
+            Email=email,  # Use bill-to email if available, otherwise use order email
+            BillTo=bill_to,
+            ShipTo=bill_to,  # Using same address for shipping
+            CompanyContact="555-0123",  # You may want to load this from a config
+            InvoiceNumber=invoice_number,
+            InvoiceDate=datetime.now(),
+            PO=get_next_po_number(),  # Generate sequential PO number
+            DueDate=due_date,
+            Items=items,
+            Terms="Payment is due within 15 days."
+        )
+
+def GroupOrders(orders, by: str = "OrderID") -> list[list[dict]]:
+    """
+    Groups order lines that belong on the same invoice in a single pass.
+
+    Args:
+        orders: Iterable of order dicts (as from LoadOrders or IterOrders)
+        by: Column to group on, e.g. "OrderID" or "CustomerID"
+
+    Returns:
+        A list of line groups, in the order each key first appears. Lines
+        with an empty key are not grouped and get an invoice of their own.
+    """
+    groups = {}
+    for order in orders:
+        key = order.get(by)
+        if key is None or key == "":
+            # unique placeholder so ungroupable lines stay separate
+            key = object()
+        groups.setdefault(key, []).append(order)
+    return list(groups.values())
+
+def main(argv: list = None) -> None:
+    """
+    Command-line entry point: runs GenerateAllInvoices with the options in
+    `argv` (sys.argv by default).
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generate, export and send invoices for every order in a workbook.")
+    parser.add_argument("orders", help="Path to the orders workbook")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of processes used to render invoices (default: 1)")
+    parser.add_argument("--converter-pool", type=int, default=0,
+                        help="Persistent LibreOffice instances per rendering process (default: 0, one soffice launch per invoice)")
+    parser.add_argument("--engine", choices=["office", "native"], default="office",
+                        help="PDF backend: Excel/LibreOffice conversion or the built-in renderer (default: office)")
+    parser.add_argument("--group-by", choices=["OrderID", "CustomerID"], default=None,
+                        help="Combine rows sharing this column into one invoice (default: one invoice per row)")
+    parser.add_argument("--smtp-host", default=None,
+                        help="Send through this SMTP server instead of Outlook (password from SMTP_PASSWORD)")
+    parser.add_argument("--smtp-port", type=int, default=587)
+    parser.add_argument("--smtp-user", default=None)
+    parser.add_argument("--smtp-pool", type=int, default=4,
+                        help="Number of SMTP connections kept open (default: 4)")
+    parser.add_argument("--stages", default=None, metavar="FORMAT,EXPORT,SEND",
+                        help="Run the overlapping async pipeline with these per-stage worker counts, e.g. 2,4,8")
+    parser.add_argument("--journal", default=None, metavar="PATH",
+                        help="Record progress in this journal and resume from it on rerun")
+    parser.add_argument("--index", default=None, metavar="PATH",
+                        help="Only invoice rows that are new or changed since the runs recorded in this index")
+    parser.add_argument("--master-index", default=None, metavar="PATH",
+                        help="Keep the BillTo/Items lookups in this index, rebuilt only when those sheets change")
+    parser.add_argument("--archive", default=None, metavar="DIR",
+                        help="Also write every invoice into bulk .xlsx shards in this directory")
+    parser.add_argument("--archive-size", type=int, default=1000, metavar="N",
+                        help="Invoices per archive shard (default: 1000)")
+    parser.add_argument("--cache", default=None, metavar="DIR",
+                        help="Reuse identical earlier renders from this cache directory")
+    parser.add_argument("--cache-size", type=int, default=512, metavar="MB",
+                        help="Evict least recently used renders beyond this size (default: 512)")
+    parser.add_argument("--metrics-json", default=None, metavar="PATH",
+                        help="Write per-stage timings and counters to this JSON file")
+    parser.add_argument("--metrics-prom", default=None, metavar="PATH",
+                        help="Write per-stage timings and counters in Prometheus text format")
+    parser.add_argument("--metrics-log", action="store_true",
+                        help="Log per-stage timings and counters when the run ends")
+    args = parser.parse_args(argv)
+
+    stages = None
+    if args.stages:
+        format_workers, export_workers, send_workers = (int(n) for n in args.stages.split(","))
+        stages = {"format_workers": format_workers, "export_workers": export_workers,
+                  "send_workers": send_workers}
+
+    sender = None
+    if args.smtp_host:
+        from smtp_sender import SMTPSender
+        sender = SMTPSender(args.smtp_host, port=args.smtp_port, username=args.smtp_user,
+                            password=os.environ.get("SMTP_PASSWORD"), pool_size=args.smtp_pool)
+
+    sinks = []
+    if args.metrics_json:
+        sinks.append(metrics.JSONFileSink(args.metrics_json))
+    if args.metrics_prom:
+        sinks.append(metrics.PrometheusFileSink(args.metrics_prom))
+    if args.metrics_log:
+        import logging
+        logging.basicConfig(level=logging.INFO, format="%(message)s")
+        sinks.append(metrics.LogSink())
+    if sinks:
+        metrics.enable(*sinks)
+
+    run_journal = None
+    if args.journal:
+        from journal import RunJournal
+        run_journal = RunJournal(args.journal)
+    order_index = None
+    if args.index:
+        from order_index import OrderIndex
+        order_index = OrderIndex(args.index)
+    render_cache = None
+    if args.cache:
+        from render_cache import RenderCache
+        render_cache = RenderCache(args.cache, max_bytes=args.cache_size * 1024 * 1024)
+
+    master_index = None
+    if args.master_index:
+        from master_index import MasterDataIndex
+        master_index = MasterDataIndex(args.master_index)
+
+    invoice_archive = None
+    if args.archive:
+        from invoice_archive import InvoiceArchive
+        invoice_archive = InvoiceArchive(args.archive, max_invoices=args.archive_size)
+
+    try:
+        failures = GenerateAllInvoices(args.orders, workers=args.workers, converter_pool=args.converter_pool,
+                                       engine=args.engine, group_by=args.group_by, sender=sender,
+                                       stages=stages, journal=run_journal, index=order_index,
+                                       cache=render_cache, master=master_index, archive=invoice_archive)
+    finally:
+        if sender is not None:
+            sender.close()
+        if run_journal is not None:
+            run_journal.close()
+        if order_index is not None:
+            order_index.close()
+        if master_index is not None:
+            master_index.close()
+        if invoice_archive is not None:
+            invoice_archive.close()
+    for base, error in failures.items():
+        print(f"Failed {base}: {error}")
+
+if __name__ == "__main__":
+    # Run from the importable module: pipeline, invoice_archive and the
+    # rendering processes import `invoice`, and must share its state
+    import invoice
+    invoice.main()
@@ -0,0 +1,193 @@
+"""
+Bulk XLSX archival of formatted invoices.
+
+Exporting every invoice as its own .xlsx produces one small zip file per
+invoice. An InvoiceArchive instead writes many invoices into one workbook,
+one sheet per invoice plus an Index sheet linking to each, and starts a new
+shard file once the current one reaches its cap.
+
+Shards are written with openpyxl's write-only mode: each sheet is streamed
+row by row to a temporary file (see invoice.FormatInvoiceStreaming), so
+memory stays bounded by the shard's shared strings, not the number of
+invoices archived or their length.
+"""
+import os
+import re
+from copy import copy
+
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+
+import metrics
+from invoice import GetInvoiceTemplate, WriteInvoiceSheet
+from totals import order_totals
+
+INDEX_HEADERS = ["Invoice #", "Customer", "Invoice Date", "Due Date", "P.O.#", "Subtotal", "GST", "Total"]
+
+_INVALID_TITLE_CHARS = re.compile(r"[\[\]:*?/\\]")
+
+
+class InvoiceArchive:
+    """
+    Writes transformed orders as invoice sheets into size-capped .xlsx shards.
+
+    Shards are named `<prefix>-00001.xlsx`, `<prefix>-00002.xlsx`, ... in
+    `out_dir`, numbered on from any shards already there. Each is written
+    under a temporary name and only appears once it is complete.
+
+    Args:
+        out_dir: Directory the shards are written to
+        prefix: Shard filename prefix
+        max_invoices: Invoices per shard
+        max_bytes: Optional cap on each shard's uncompressed sheet data;
+            the compressed file is typically a fraction of this
+        logo_path: Logo shown on every sheet. None (the default) leaves it
+            out, since each sheet stores its own copy of the image.
+
+    Usage:
+        with InvoiceArchive("archive/") as archive:
+            for transformed_order in transformed_orders:
+                archive.add(transformed_order)
+        archive.paths  # the shard files written
+    """
+
+    def __init__(self, out_dir: str, prefix: str = "invoices", max_invoices: int = 1000,
+                 max_bytes: int = None, logo_path: str = None):
+        if max_invoices < 1:
+            raise ValueError("max_invoices must be at least 1")
+        os.makedirs(out_dir, exist_ok=True)
+        self.out_dir = out_dir
+        self.prefix = prefix
+        self.max_invoices = max_invoices
+        self.max_bytes = max_bytes
+        self.logo_path = logo_path
+        self.paths = []
+        self._template = GetInvoiceTemplate()
+        self._shard = self._next_shard_number()
+        self._wb = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self._discard()
+
+    def _next_shard_number(self) -> int:
+        pattern = re.compile(rf"{re.escape(self.prefix)}-(\d+)\.xlsx$")
+        numbers = [int(m.group(1)) for m in map(pattern.match, os.listdir(self.out_dir)) if m]
+        return max(numbers, default=0) + 1
+
+    def _open_shard(self) -> None:
+        self._wb = Workbook(write_only=True)
+        self._template.share_styles(self._wb)
+        self._titles = set()
+        self._count = 0
+        self._bytes = 0
+        self._index = self._wb.create_sheet("Index")
+        for col, width in zip("ABCDEFGH", (22, 30, 14, 14, 14, 14, 14, 14)):
+            self._index.column_dimensions[col].width = width
+        self._index.freeze_panes = "A2"
+        header = self._template.styles["label"]
+        self._index.append([self._cell(self._index, h, header) for h in INDEX_HEADERS])
+        self._titles.add("index")
+
+    def _cell(self, ws, value, style) -> WriteOnlyCell:
+        cell = WriteOnlyCell(ws, value)
+        cell._style = copy(style)
+        return cell
+
+    def _title(self, invoice_number) -> str:
+        # Sheet names: at most 31 characters, none of []:*?/\, unique ignoring case
+        base = _INVALID_TITLE_CHARS.sub("_", str(invoice_number or "Invoice"))[:31]
+        title, n = base, 1
+        while title.lower() in self._titles:
+            n += 1
+            suffix = f" ({n})"
+            title = base[:31 - len(suffix)] + suffix
+        self._titles.add(title.lower())
+        return title
+
+    def add(self, transformed_order: dict) -> tuple[str, str]:
+        """
+        Appends one invoice as a new sheet.
+
+        Returns:
+            (shard path, sheet title) the invoice is archived under.
+        """
+        with metrics.timer("archive"):
+            if self._wb is None:
+                self._open_shard()
+            template = self._template
+            title = self._title(transformed_order.get("InvoiceNumber"))
+            ws = self._wb.create_sheet(title)
+            self._count += 1
+            WriteInvoiceSheet(ws, transformed_order, template, f"InvoiceTable{self._count}", self.logo_path)
+            self._bytes += os.path.getsize(ws._writer.out)
+
+            _, subtotal, gst, total = order_totals(transformed_order)
+            sheet_ref = title.replace("'", "''").replace('"', '""')
+            label = title.replace('"', '""')
+            index, date, amount = self._index, template.styles["date"], template.styles["amount"]
+            index.append([
+                f'=HYPERLINK("#\'{sheet_ref}\'!A1","{label}")',
+                transformed_order.get("CustomerName", ""),
+                self._cell(index, transformed_order.get("InvoiceDate"), date),
+                self._cell(index, transformed_order.get("DueDate"), date),
+                transformed_order.get("PO", ""),
+                *(self._cell(index, value, amount) for value in (subtotal, gst, total)),
+            ])
+
+            path = self._shard_path()
+            if self._count >= self.max_invoices or (self.max_bytes is not None and self._bytes >= self.max_bytes):
+                self._finish_shard()
+        return path, title
+
+    def _shard_path(self) -> str:
+        return os.path.join(self.out_dir, f"{self.prefix}-{self._shard:05d}.xlsx")
+
+    def _finish_shard(self) -> None:
+        path = self._shard_path()
+        tmp_path = path + ".tmp"
+        with metrics.timer("save"):
+            self._wb.save(tmp_path)
+        os.replace(tmp_path, path)
+        metrics.add_bytes("archive", os.path.getsize(path))
+        self.paths.append(path)
+        self._wb = None
+        self._shard += 1
+
+    def _discard(self) -> None:
+        # Closing the sheets removes their temporary files; nothing is saved
+        if self._wb is not None:
+            for ws in self._wb.worksheets:
+                if not ws.closed:
+                    ws.close()
+                if ws._writer is not None:
+                    ws._writer.cleanup()
+            self._wb = None
+
+    def close(self) -> list:
+        """
+        Writes the last, partly filled shard. Returns every shard path written.
+        """
+        if self._wb is not None:
+            self._finish_shard()
+        return self.paths
+
+
+def ArchiveInvoices(transformed_orders, out_dir: str, **kwargs) -> dict:
+    """
+    Archives every transformed order into .xlsx shards (see InvoiceArchive
+    for the keyword arguments).
+
+    Returns:
+        Dict mapping each invoice number to its (shard path, sheet title).
+    """
+    locations = {}
+    with InvoiceArchive(out_dir, **kwargs) as archive:
+        for transformed_order in transformed_orders:
+            locations[transformed_order["InvoiceNumber"]] = archive.add(transformed_order)
+    return locations
@@ -0,0 +1,44 @@
+import os
+from datetime import datetime
+
+
+def invoice_email_content(filePath: str) -> tuple[str, str]:
+    """
+    Returns the (subject, plain-text body) of the email sent with the
+    invoice at filePath. The invoice number is taken from the filename.
+
+    Shared by invoice.SendInvoice (Outlook) and smtp_sender.SMTPSender.
+    """
+    # Extract invoice number from filename
+    invoice_number = os.path.basename(filePath).split('.')[0]
+
+    subject = f"Invoice {invoice_number} - Contoso Logistics"
+
+    # Create a professional email body
+    email_body = f"""Dear Valued Customer,
+
+I hope this email finds you well. Please find attached Invoice {invoice_number} for your recent order with Contoso Logistics.
+
+Invoice Details:
+- Invoice Number: {invoice_number}
+- Date: {datetime.now().strftime('%B %d, %Y')}
+
+Payment Terms:
+- Payment is due within 15 days from invoice date
+- Payment methods accepted: Bank Transfer, Credit Card
+- For wire transfer details, please refer to the invoice
+
+If you have any questions regarding this invoice or need any clarification, please don't hesitate to contact our accounting department at accounting@contosologistics.com or call us at (416) 555-0123.
+
+Thank you for your business.
+
+Best regards,
+Contoso Logistics
+Accounting Department
+Phone: (416) 555-0123
+Email: accounting@contosologistics.com
+
+---
+This is an automated message. Please do not reply directly to this email.
+For immediate assistance, please contact our customer service department."""
+    return subject, email_body
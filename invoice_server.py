@@ -0,0 +1,345 @@
+"""
+Long-running HTTP service that renders invoices on request.
+
+Calling the pipeline from another system by running a script pays for the
+interpreter, the openpyxl import, the invoice template and a LibreOffice
+launch on every invoice. The service pays for them once: it loads the
+bill-to data and template at startup, optionally keeps a pool of worker
+processes and persistent LibreOffice instances (converter.ConverterPool)
+warm, and renders each request in memory (invoice.ExportInvoiceToBytes).
+
+    POST /invoices?format=pdf&engine=office   order JSON in, invoice file out
+    GET  /healthz                             liveness check
+    GET  /metrics                             Prometheus text format
+
+The request body is one order line as read from the Orders sheet
+(CustomerID, CustomerName, Email, ItemID, ItemName, Qty, Price), or a list
+of lines for the same customer to invoice together. The invoice number is
+returned in the X-Invoice-Number header.
+
+At most `max_concurrent` invoices are rendered at once; a request that
+cannot get a slot within `queue_timeout` seconds is answered 503 with
+Retry-After. Orders are checked before an invoice number is allocated,
+so neither a rejected (503) nor an invalid (400) request uses one up.
+Each request's latency goes to the
+`invoice_stage_seconds{stage="http_request"}` histogram and its outcome
+to `invoice_http_requests_total{status}`.
+"""
+import json
+import logging
+import threading
+from concurrent.futures import ProcessPoolExecutor, wait
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import metrics
+from totals import to_cents, to_quantity
+from invoice import (ExportInvoiceToBytes, FormatForExport, GetInvoiceTemplate, TransformOrder,
+                     TransformOrderGroup)
+
+CONTENT_TYPES = {
+    "pdf": "application/pdf",
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+}
+ENGINES = ("office", "native")
+REQUIRED_FIELDS = ("CustomerID", "CustomerName", "Email", "Qty", "Price")
+
+# An order is a few hundred bytes; anything this large is not one
+MAX_BODY_BYTES = 1024 * 1024
+
+logger = logging.getLogger("invoice.server")
+
+_converter_pool = 0  # size of this process's warm converter pool
+
+
+def _warm(converter_pool: int) -> None:
+    """
+    Loads everything a render needs up front: the invoice template, the
+    native renderer and, with converter_pool, running LibreOffice instances.
+    Runs in the server process or as each worker process's initializer.
+    """
+    global _converter_pool
+    _converter_pool = converter_pool
+    GetInvoiceTemplate()
+    import pdf_renderer  # noqa: F401
+    if converter_pool:
+        from converter import get_shared_pool
+        get_shared_pool(converter_pool).warm()
+
+
+def _ready() -> bool:
+    return True
+
+
+def _render(transformed_order: dict, format: str, engine: str) -> bytes:
+    """
+    Formats and exports a transformed order, returning the file's contents.
+    Module-level so it can be shipped to a worker process.
+    """
+    if engine == "native":
+        return ExportInvoiceToBytes(transformed_order, format, engine="native")
+    converter = None
+    if _converter_pool and format == "pdf":
+        from converter import get_shared_pool
+        converter = get_shared_pool(_converter_pool)
+    return ExportInvoiceToBytes(FormatForExport(transformed_order), format, converter=converter)
+
+
+def _render_measured(*args) -> tuple:
+    """
+    Runs _render in a worker process and returns (data, metrics snapshot,
+    error) so the server can merge what the worker recorded.
+    """
+    with metrics.capture() as registry:
+        try:
+            data = _render(*args)
+        except Exception as e:
+            return None, registry.snapshot(), e
+    return data, registry.snapshot(), None
+
+
+def _checked_lines(lines: list) -> list:
+    """
+    Checks the fields TransformOrder needs and coerces Qty and Price, so
+    bad input is rejected before an invoice number is allocated for it.
+    """
+    checked = []
+    for line in lines:
+        missing = [name for name in REQUIRED_FIELDS if line.get(name) in (None, "")]
+        if line.get("ItemName") in (None, "") and line.get("ItemID") in (None, ""):
+            missing.append("ItemName or ItemID")
+        if missing:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, f"Order is missing {', '.join(missing)}")
+        try:
+            qty = to_quantity(line["Qty"])
+            to_cents(line["Price"])
+            price = float(line["Price"])
+        except (TypeError, ValueError, ArithmeticError) as e:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, str(e))
+        checked.append({**line, "Qty": qty, "Price": price})
+    if len({line["CustomerID"] for line in checked}) > 1:
+        raise _RequestError(HTTPStatus.BAD_REQUEST, "Cannot invoice lines for several customers together")
+    return checked
+
+
+class _RequestError(Exception):
+    def __init__(self, status: HTTPStatus, message: str, headers: dict = None):
+        super().__init__(message)
+        self.status = status
+        self.headers = headers or {}
+
+
+class InvoiceServer(ThreadingHTTPServer):
+    """
+    HTTP server rendering invoices with warm workers.
+
+    Args:
+        address: (host, port) to listen on; port 0 picks a free one
+        bill_to_data: Mapping of CustomerID to bill-to details, as returned
+            by invoice.LoadBillToData
+        workers: Worker processes to render in. 0 (the default) renders in
+            the server process, which is enough when most of the time is
+            spent in LibreOffice; openpyxl formatting holds the GIL, so use
+            workers to format several invoices in parallel.
+        converter_pool: Persistent LibreOffice instances per rendering
+            process for PDF conversion; 0 launches soffice per invoice.
+        max_concurrent: Invoices rendered at once (defaults to workers, or
+            2 without workers)
+        queue_timeout: Seconds a request waits for a free slot before 503
+        engine: Default engine when a request does not name one
+
+    Usage:
+        with InvoiceServer(("127.0.0.1", 8080), LoadBillToData("orders.xlsx"), workers=2) as server:
+            server.serve_forever()
+    """
+
+    daemon_threads = True
+
+    def __init__(self, address, bill_to_data=None, workers: int = 0, converter_pool: int = 0,
+                 max_concurrent: int = None, queue_timeout: float = 5.0, engine: str = "office"):
+        if engine not in ENGINES:
+            raise ValueError(f"Unsupported engine: {engine}")
+        self.bill_to_data = bill_to_data if bill_to_data is not None else {}
+        self.engine = engine
+        self.queue_timeout = queue_timeout
+        self.slots = threading.BoundedSemaphore(max_concurrent or workers or 2)
+        if not metrics.enabled():
+            metrics.enable()  # for /metrics; no sinks are flushed to
+
+        self.pool = None
+        super().__init__(address, InvoiceRequestHandler)
+        try:
+            if workers:
+                self.pool = ProcessPoolExecutor(max_workers=workers, initializer=_warm, initargs=(converter_pool,))
+                # Start every worker now rather than on the first requests
+                wait([self.pool.submit(_ready) for _ in range(workers)])
+            else:
+                _warm(converter_pool)
+        except BaseException:
+            self.server_close()
+            raise
+
+    def render(self, transformed_order: dict, format: str, engine: str) -> bytes:
+        if self.pool is None:
+            return _render(transformed_order, format, engine)
+        data, recorded, error = self.pool.submit(_render_measured, transformed_order, format, engine).result()
+        metrics.merge(recorded)
+        if error is not None:
+            raise error
+        return data
+
+    def server_close(self) -> None:
+        super().server_close()
+        if self.pool is not None:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+
+class InvoiceRequestHandler(BaseHTTPRequestHandler):
+    server_version = "InvoiceServer/1.0"
+    protocol_version = "HTTP/1.1"  # keep connections open for repeat callers
+    timeout = 30  # seconds a client may take to send its request
+
+    def log_message(self, format, *args):
+        logger.info("%s - " + format, self.address_string(), *args)
+
+    def _reply(self, status: HTTPStatus, body: bytes, content_type: str, headers: dict = None) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _reply_error(self, error: _RequestError) -> None:
+        # The request body may not have been read; don't reuse the connection
+        self.close_connection = True
+        body = json.dumps({"error": str(error)}).encode()
+        self._reply(error.status, body, "application/json", {**error.headers, "Connection": "close"})
+
+    def do_GET(self):
+        path = urlparse(self.path).path
+        if path == "/healthz":
+            self._reply(HTTPStatus.OK, b"ok\n", "text/plain")
+        elif path == "/metrics":
+            text = metrics.prometheus_text(metrics.snapshot())
+            self._reply(HTTPStatus.OK, text.encode(), "text/plain; version=0.0.4")
+        else:
+            self._reply_error(_RequestError(HTTPStatus.NOT_FOUND, f"No such resource: {path}"))
+
+    def do_POST(self):
+        with metrics.timer("http_request"):
+            try:
+                url = urlparse(self.path)
+                if url.path != "/invoices":
+                    raise _RequestError(HTTPStatus.NOT_FOUND, f"No such resource: {url.path}")
+                body, headers, content_type = self._invoice(parse_qs(url.query))
+                status = HTTPStatus.OK
+                self._reply(status, body, content_type, headers)
+            except _RequestError as e:
+                status = e.status
+                self._reply_error(e)
+            except Exception as e:
+                logger.exception("Rendering failed")
+                status = HTTPStatus.INTERNAL_SERVER_ERROR
+                self._reply_error(_RequestError(status, str(e)))
+        metrics.increment("invoice_http_requests_total", status=str(int(status)))
+
+    def _read_order(self):
+        try:
+            length = int(self.headers.get("Content-Length", ""))
+        except ValueError:
+            raise _RequestError(HTTPStatus.LENGTH_REQUIRED, "Content-Length is required")
+        if length > MAX_BODY_BYTES:
+            raise _RequestError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Orders are limited to {MAX_BODY_BYTES} bytes")
+        try:
+            order = json.loads(self.rfile.read(length))
+        except ValueError as e:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+        if isinstance(order, dict):
+            order = [order]
+        if not (isinstance(order, list) and order and all(isinstance(line, dict) for line in order)):
+            raise _RequestError(HTTPStatus.BAD_REQUEST, "Expected an order object or a list of order lines")
+        return _checked_lines(order)
+
+    def _invoice(self, query: dict) -> tuple:
+        server = self.server
+        format = query.get("format", ["pdf"])[0]
+        engine = query.get("engine", [server.engine])[0]
+        if format not in CONTENT_TYPES:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, f"Unsupported format: {format}")
+        if engine not in ENGINES:
+            raise _RequestError(HTTPStatus.BAD_REQUEST, f"Unsupported engine: {engine}")
+        if engine == "native" and format != "pdf":
+            raise _RequestError(HTTPStatus.BAD_REQUEST, f"The native engine only supports pdf, not {format}")
+        lines = self._read_order()
+
+        # Wait for a slot before transforming, so a rejected request does
+        # not use up an invoice number
+        if not server.slots.acquire(timeout=server.queue_timeout):
+            raise _RequestError(HTTPStatus.SERVICE_UNAVAILABLE, "Too many invoices in progress",
+                                {"Retry-After": "1"})
+        try:
+            try:
+                if len(lines) == 1:
+                    transformed_order = TransformOrder(lines[0], server.bill_to_data)
+                else:
+                    transformed_order = TransformOrderGroup(lines, server.bill_to_data)
+            except KeyError as e:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, f"Order is missing a field: {e}")
+            except (TypeError, ValueError, ArithmeticError) as e:
+                raise _RequestError(HTTPStatus.BAD_REQUEST, str(e))
+            data = server.render(transformed_order, format, engine)
+        finally:
+            server.slots.release()
+
+        number = transformed_order["InvoiceNumber"]
+        headers = {
+            "X-Invoice-Number": number,
+            "Content-Disposition": f'attachment; filename="invoice_{number}.{format}"',
+        }
+        return data, headers, CONTENT_TYPES[format]
+
+
+if __name__ == "__main__":
+    import argparse
+
+    from invoice import LoadBillToData
+
+    parser = argparse.ArgumentParser(description="Serve invoice rendering over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--bill-to", default=None, metavar="PATH",
+                        help="Workbook whose BillTo sheet supplies customer details")
+    parser.add_argument("--master-index", default=None, metavar="PATH",
+                        help="SQLite file persisting the BillTo lookup between restarts")
+    parser.add_argument("--workers", type=int, default=0,
+                        help="Worker processes to render in (0 renders in the server process)")
+    parser.add_argument("--converter-pool", type=int, default=0,
+                        help="Persistent LibreOffice instances per rendering process")
+    parser.add_argument("--max-concurrent", type=int, default=None,
+                        help="Invoices rendered at once (defaults to --workers, or 2)")
+    parser.add_argument("--queue-timeout", type=float, default=5.0,
+                        help="Seconds a request waits for a free slot before 503")
+    parser.add_argument("--engine", choices=ENGINES, default="office")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    bill_to_data = {}
+    if args.bill_to:
+        master = None
+        if args.master_index:
+            from master_index import MasterDataIndex
+            master = MasterDataIndex(args.master_index)
+        bill_to_data = LoadBillToData(args.bill_to, master)
+
+    with InvoiceServer((args.host, args.port), bill_to_data, workers=args.workers,
+                       converter_pool=args.converter_pool, max_concurrent=args.max_concurrent,
+                       queue_timeout=args.queue_timeout, engine=args.engine) as server:
+        logger.info("Serving invoices on http://%s:%d", *server.server_address[:2])
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
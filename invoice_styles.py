@@ -0,0 +1,71 @@
+"""
+Cell styles shared by every invoice workbook.
+
+Each style is defined once here and registered once per process, on the
+invoice template workbook (see invoice.InvoiceTemplate). Registering
+resolves a style's font, border, alignment and number format to their ids
+in the workbook's style tables, so cells take a style by reference,
+copying a small array of ids, instead of building Font/Border/Alignment
+objects that openpyxl would have to look up in its style tables cell by
+cell.
+
+The styles are deliberately not Excel named styles (openpyxl NamedStyle):
+those are serialized again on every save, which costs more than the rest
+of the stylesheet for a small invoice.
+"""
+from openpyxl.styles import Alignment, Border, Font, Side
+from openpyxl.styles.borders import DEFAULT_BORDER
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.fonts import DEFAULT_FONT
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE
+
+CURRENCY_FORMAT = '"$"#,##0.00'
+DATE_FORMAT = "dd/mm/yyyy"
+
+_THIN = Side(border_style="thin", color="000000")
+_BOXED = Border(top=_THIN, bottom=_THIN, left=_THIN, right=_THIN)
+
+# Style name -> attributes; anything left out keeps the workbook default
+STYLES = {
+    "title": dict(font=Font(size=20, bold=True, color="000000"),
+                  alignment=Alignment(horizontal="right", vertical="top")),
+    "company": dict(font=Font(size=11, color="000000"), alignment=Alignment(horizontal="left")),
+    "heading": dict(font=Font(size=12, bold=True, color="000000")),
+    "address": dict(font=Font(size=11, color="000000")),
+    "label": dict(font=Font(bold=True, color="000000")),
+    "value": dict(font=Font(color="000000"), alignment=Alignment(horizontal="right")),
+    "table_header": dict(font=Font(bold=True, color="000000"), alignment=Alignment(horizontal="center"),
+                         border=_BOXED),
+    "item": dict(border=_BOXED),
+    "money": dict(border=_BOXED, number_format=CURRENCY_FORMAT, alignment=Alignment(horizontal="right")),
+    "summary_label": dict(font=Font(bold=True, color="000000"), alignment=Alignment(horizontal="right")),
+    "summary_value": dict(font=Font(color="000000"), number_format=CURRENCY_FORMAT,
+                          alignment=Alignment(horizontal="right"), border=_BOXED),
+    "text": dict(font=Font(color="000000")),
+    "date": dict(number_format=DATE_FORMAT),
+    "amount": dict(number_format=CURRENCY_FORMAT, alignment=Alignment(horizontal="right")),
+}
+
+
+def register(wb) -> dict:
+    """
+    Adds every style in STYLES to `wb`'s style tables.
+
+    Returns:
+        Dict mapping each style name to its StyleArray. Assign a copy to a
+        cell's `_style` to apply the style; the ids are valid in `wb` and
+        in any workbook sharing its style tables.
+    """
+    refs = {}
+    for name, attrs in STYLES.items():
+        style = StyleArray()
+        style.fontId = wb._fonts.add(attrs.get("font", DEFAULT_FONT))
+        style.borderId = wb._borders.add(attrs.get("border", DEFAULT_BORDER))
+        style.alignmentId = wb._alignments.add(attrs.get("alignment", Alignment()))
+        number_format = attrs.get("number_format", "General")
+        if number_format in BUILTIN_FORMATS_REVERSE:
+            style.numFmtId = BUILTIN_FORMATS_REVERSE[number_format]
+        else:
+            style.numFmtId = wb._number_formats.add(number_format) + BUILTIN_FORMATS_MAX_SIZE
+        refs[name] = style
+    return refs
@@ -0,0 +1,140 @@
+"""
+Checkpoint journal for resumable invoice runs.
+
+Every order's progress through a run (transformed -> exported -> sent) is
+recorded in a small SQLite database as it happens. Rerunning the same
+orders workbook against the same journal skips invoices that were already
+sent, sends ones that were exported but not sent, and re-renders the rest
+from the stored transformed order so they keep their invoice and PO
+numbers. Each entry also stores a digest of the order lines it was made
+from; if the sheet was edited in between, entries whose lines changed are
+ignored and those orders are invoiced afresh.
+"""
+import os
+import sqlite3
+import threading
+from datetime import datetime
+
+import json_codec
+
+TRANSFORMED = "transformed"
+EXPORTED = "exported"
+SENT = "sent"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    key TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    invoice_number TEXT,
+    output_path TEXT,
+    email TEXT,
+    order_json TEXT,
+    error TEXT,
+    updated_at TEXT NOT NULL,
+    digest TEXT
+)
+"""
+
+
+class RunJournal:
+    """
+    Durable per-order status for GenerateAllInvoices.
+
+    Orders are identified by a stable key (see invoice._KeyedOrderGroups), not by
+    invoice number, since numbers are only allocated once an order is
+    transformed. Each update is committed straight away so a crash loses
+    at most the order in flight. Safe to share between threads.
+
+    Usage:
+        with RunJournal("run.journal") as journal:
+            GenerateAllInvoices("orders.xlsx", journal=journal)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(orders)")}
+        if "digest" not in columns:  # journals written before digests were stored
+            self._conn.execute("ALTER TABLE orders ADD COLUMN digest TEXT")
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def get(self, key: str, digest: str = None):
+        """
+        Returns the entry for `key` as a dict (status, invoice_number,
+        output_path, email, order, error), or None if it was never recorded.
+        With `digest`, an entry recorded for different order lines (or
+        without a digest) is treated as never recorded.
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, invoice_number, output_path, email, order_json, error, digest "
+                "FROM orders WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        status, invoice_number, output_path, email, order_json, error, stored_digest = row
+        if digest is not None and stored_digest != digest:
+            return None
+        return {
+            "status": status,
+            "invoice_number": invoice_number,
+            "output_path": output_path,
+            "email": email,
+            "order": json_codec.loads(order_json) if order_json else None,
+            "error": error,
+        }
+
+    def _write(self, sql: str, params: tuple) -> None:
+        with self._lock:
+            self._conn.execute(sql, params)
+            self._conn.commit()
+
+    def record_transformed(self, key: str, transformed_order: dict, email: str, digest: str = None) -> None:
+        """
+        Stores the transformed order, fixing its invoice and PO numbers for
+        any later rerun. `digest` identifies the order lines it was made
+        from (see get).
+        """
+        self._write(
+            "INSERT OR REPLACE INTO orders "
+            "(key, status, invoice_number, email, order_json, updated_at, digest) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (key, TRANSFORMED, transformed_order.get("InvoiceNumber"), email,
+             json_codec.dumps(transformed_order), datetime.now().isoformat(), digest))
+
+    def record_exported(self, key: str, output_path: str) -> None:
+        self._write(
+            "UPDATE orders SET status = ?, output_path = ?, error = NULL, updated_at = ? WHERE key = ?",
+            (EXPORTED, os.path.abspath(output_path), datetime.now().isoformat(), key))
+
+    def record_sent(self, key: str) -> None:
+        self._write(
+            "UPDATE orders SET status = ?, error = NULL, updated_at = ? WHERE key = ?",
+            (SENT, datetime.now().isoformat(), key))
+
+    def record_failed(self, key: str, error: Exception) -> None:
+        """
+        Notes the last error for `key`; its status is left where it was so
+        the next run retries from that point.
+        """
+        self._write("UPDATE orders SET error = ?, updated_at = ? WHERE key = ?",
+                    (f"{type(error).__name__}: {error}", datetime.now().isoformat(), key))
+
+    def counts(self) -> dict:
+        """
+        Returns the number of orders at each status.
+        """
+        with self._lock:
+            return dict(self._conn.execute("SELECT status, COUNT(*) FROM orders GROUP BY status"))
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,37 @@
+"""
+JSON encoding shared by the SQLite stores (journal.RunJournal and
+master_index.MasterDataIndex).
+
+Records are stored as plain dicts, and datetimes, which JSON has no type
+for, are stored as tagged ISO strings and come back as datetimes.
+"""
+import json
+from datetime import datetime
+
+from records import plain
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    raise TypeError(f"Cannot store {type(value).__name__} as JSON")
+
+
+def _decode(obj: dict):
+    if "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+
+def dumps(value) -> str:
+    """
+    Serializes `value`, which may contain records and datetimes.
+    """
+    return json.dumps(plain(value), default=_encode)
+
+
+def loads(text: str):
+    """
+    Parses text written by dumps, restoring its datetimes.
+    """
+    return json.loads(text, object_hook=_decode)
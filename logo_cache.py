@@ -0,0 +1,67 @@
+import io
+import os
+import threading
+import zlib
+
+# Logo used when none is given; override with the INVOICE_LOGO_PATH environment variable
+DEFAULT_LOGO_PATH = os.environ.get("INVOICE_LOGO_PATH", "docs/assets/logo.png")
+
+# Logos are shown at 150x150px on the invoice; twice that is plenty for print
+MAX_PIXELS = 300
+
+
+class CachedLogo:
+    """
+    A logo decoded once and kept in memory in the forms the invoice
+    backends embed: PNG bytes for workbooks and flattened RGB pixels for
+    the native PDF renderer.
+    """
+
+    def __init__(self, path: str, mtime: float):
+        from PIL import Image as PILImage
+
+        self.path = path
+        self.mtime = mtime
+        with PILImage.open(path) as im:
+            im = im.convert("RGBA")
+            im.thumbnail((MAX_PIXELS, MAX_PIXELS))
+            self.size = im.size
+            buf = io.BytesIO()
+            im.save(buf, format="png")
+            self.png = buf.getvalue()
+            # PDF image XObjects have no alpha here, so flatten onto white
+            flat = PILImage.new("RGB", im.size, (255, 255, 255))
+            flat.paste(im, mask=im.split()[3])
+            self.pdf_xobject = (flat.width, flat.height, zlib.compress(flat.tobytes()))
+
+
+_cache = {}
+_lock = threading.Lock()
+
+def get_logo(path: str):
+    """
+    Returns the CachedLogo for `path`, decoding the file only the first
+    time it is seen or after it changes on disk (by mtime).
+    Returns None if the file does not exist or cannot be decoded.
+    """
+    path = os.path.abspath(path)
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    with _lock:
+        logo = _cache.get(path)
+        if logo is None or logo.mtime != mtime:
+            try:
+                logo = CachedLogo(path, mtime)
+            except (ImportError, OSError):
+                return None
+            _cache[path] = logo
+        return logo
+
+def clear_cache() -> None:
+    """
+    Drops every cached logo.
+    """
+    with _lock:
+        _cache.clear()
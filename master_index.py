@@ -0,0 +1,223 @@
+"""
+Persisted lookup index for the BillTo and Items master data.
+
+Customer and item sheets rarely change between runs, yet building their
+CustomerID/ItemID dicts means parsing the workbook every time. This module
+keeps each sheet's rows in a SQLite file instead, keyed by workbook and
+sheet, and only rebuilds a sheet's rows when the sheet itself has changed.
+
+Freshness is checked in two steps: an unchanged file mtime and size is
+trusted outright; otherwise the sheet's fingerprint (the CRC32s the xlsx
+zip directory already stores for the sheet, its shared strings and its
+styles) is compared, so a workbook whose Orders sheet grows every day does
+not invalidate its untouched BillTo and Items sheets. Neither check parses
+the sheet.
+
+Lookups go straight to SQLite, so only the customers and items a run
+actually references are ever loaded into memory.
+"""
+import hashlib
+import json
+import os
+import posixpath
+import sqlite3
+import threading
+import zipfile
+from collections.abc import Mapping
+from datetime import datetime
+from xml.etree import ElementTree
+
+import json_codec
+import metrics
+
+# Bump when the stored row format changes, so existing indexes are rebuilt
+FORMAT_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS sources (
+    workbook TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    fingerprint TEXT NOT NULL,
+    built_at TEXT NOT NULL,
+    PRIMARY KEY (workbook, sheet)
+);
+CREATE TABLE IF NOT EXISTS rows (
+    workbook TEXT NOT NULL,
+    sheet TEXT NOT NULL,
+    key TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (workbook, sheet, key)
+);
+"""
+
+_MAIN_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL_NS = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+
+def _encode_key(value) -> str:
+    # Match dict semantics, where 7 and 7.0 are the same key
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return json.dumps(value, default=str)
+
+
+def sheet_fingerprint(path: str, sheet: str, key: str) -> str:
+    """
+    Returns a fingerprint of one sheet of an xlsx workbook that changes
+    whenever the sheet's values could have changed.
+
+    Only the zip directory and the small workbook/relationship parts are
+    read. Falls back to hashing the whole file for anything that is not a
+    readable xlsx package.
+    """
+    try:
+        with zipfile.ZipFile(path) as archive:
+            workbook = ElementTree.fromstring(archive.read("xl/workbook.xml"))
+            rels = ElementTree.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+            targets = {rel.get("Id"): rel.get("Target") for rel in rels.iter(f"{_PKG_REL_NS}Relationship")}
+            part = None
+            for node in workbook.iter(f"{_MAIN_NS}sheet"):
+                if node.get("name") == sheet:
+                    target = targets[node.get(f"{_REL_NS}id")]
+                    part = target.lstrip("/") if target.startswith("/") else posixpath.join("xl", target)
+            parts = [part, "xl/sharedStrings.xml", "xl/styles.xml"]
+            crcs = []
+            for name in parts:
+                try:
+                    info = archive.getinfo(name) if name is not None else None
+                except KeyError:
+                    info = None
+                crcs.append(f"{info.CRC:08x}:{info.file_size}" if info is not None else "-")
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError):
+        digest = hashlib.blake2b(digest_size=16)
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        crcs = [digest.hexdigest()]
+    return f"v{FORMAT_VERSION}|{key}|" + "|".join(crcs)
+
+
+class MasterDataIndex:
+    """
+    SQLite index of BillTo/Items rows, shared across runs. Safe to share
+    between threads.
+
+    Usage:
+        with MasterDataIndex("master.index") as master:
+            GenerateAllInvoices("orders.xlsx", master=master)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def table(self, workbook_path: str, sheet: str, key: str, build, record=None) -> "MasterTable":
+        """
+        Returns a read-only mapping of `sheet`'s rows by their `key` column,
+        rebuilding the stored rows first if the sheet has changed.
+
+        Args:
+            workbook_path: Workbook holding the sheet
+            sheet: Sheet name, e.g. "BillTo"
+            key: Column the rows are indexed by, e.g. "CustomerID"
+            build: Called with no arguments when the stored rows are stale;
+                returns a dict of the sheet's rows by key
+            record: Record type (see records.py) rows are returned as;
+                plain dicts by default
+        """
+        workbook = os.path.abspath(workbook_path)
+        stat = os.stat(workbook)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT mtime_ns, size, fingerprint FROM sources WHERE workbook = ? AND sheet = ?",
+                (workbook, sheet)).fetchone()
+
+        if row is not None and row[:2] == (stat.st_mtime_ns, stat.st_size) and \
+                row[2].startswith(f"v{FORMAT_VERSION}|{key}|"):
+            result = "fresh"
+        else:
+            fingerprint = sheet_fingerprint(workbook, sheet, key)
+            if row is not None and row[2] == fingerprint:
+                result = "revalidated"
+                with self._lock:
+                    self._conn.execute(
+                        "UPDATE sources SET mtime_ns = ?, size = ? WHERE workbook = ? AND sheet = ?",
+                        (stat.st_mtime_ns, stat.st_size, workbook, sheet))
+                    self._conn.commit()
+            else:
+                result = "rebuilt"
+                self._rebuild(workbook, sheet, stat, fingerprint, build())
+        metrics.increment("invoice_master_index_total", sheet=sheet, result=result)
+        return MasterTable(self, workbook, sheet, record)
+
+    def _rebuild(self, workbook: str, sheet: str, stat, fingerprint: str, rows: dict) -> None:
+        with self._lock:
+            with self._conn:  # one transaction, so readers never see a half-built sheet
+                self._conn.execute("DELETE FROM rows WHERE workbook = ? AND sheet = ?", (workbook, sheet))
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO rows (workbook, sheet, key, data) VALUES (?, ?, ?, ?)",
+                    [(workbook, sheet, _encode_key(k), json_codec.dumps(v))
+                     for k, v in rows.items()])
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO sources (workbook, sheet, mtime_ns, size, fingerprint, built_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    (workbook, sheet, stat.st_mtime_ns, stat.st_size, fingerprint, datetime.now().isoformat()))
+
+    def _fetch(self, sql: str, params: tuple) -> list:
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class MasterTable(Mapping):
+    """
+    Read-only dict-like view of one indexed sheet. Rows are fetched from
+    SQLite on first lookup and then kept, so repeated lookups of the same
+    customer or item cost a dict access.
+    """
+
+    def __init__(self, index: MasterDataIndex, workbook: str, sheet: str, record=None):
+        self._index = index
+        self._workbook = workbook
+        self._sheet = sheet
+        self._record = record
+        self._rows = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._rows[key]
+        except KeyError:
+            pass
+        found = self._index._fetch("SELECT data FROM rows WHERE workbook = ? AND sheet = ? AND key = ?",
+                                   (self._workbook, self._sheet, _encode_key(key)))
+        if not found:
+            raise KeyError(key)
+        data = json_codec.loads(found[0][0])
+        value = self._rows[key] = self._record(data) if self._record is not None else data
+        return value
+
+    def __iter__(self):
+        for (key,) in self._index._fetch("SELECT key FROM rows WHERE workbook = ? AND sheet = ? ORDER BY rowid",
+                                         (self._workbook, self._sheet)):
+            yield json.loads(key)
+
+    def __len__(self) -> int:
+        return self._index._fetch("SELECT COUNT(*) FROM rows WHERE workbook = ? AND sheet = ?",
+                                  (self._workbook, self._sheet))[0][0]
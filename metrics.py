@@ -0,0 +1,342 @@
+"""
+Per-stage timing and counters for the invoice pipeline.
+
+Instrumented code calls `timed`, `timer`, `increment` and `add_bytes`;
+nothing is recorded until `enable` is called, and while disabled each of
+them costs a single check. Recorded metrics are written to one or more
+sinks by `flush`:
+
+    import metrics
+    metrics.enable(metrics.PrometheusFileSink("invoices.prom"), metrics.LogSink())
+    GenerateAllInvoices("orders.xlsx")   # flushes when the run ends
+
+Stage durations go to the `invoice_stage_seconds` histogram, failures to
+`invoice_stage_failures_total` and output sizes to
+`invoice_bytes_written_total`, each labelled by stage.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+STAGE_SECONDS = "invoice_stage_seconds"
+STAGE_FAILURES = "invoice_stage_failures_total"
+BYTES_WRITTEN = "invoice_bytes_written_total"
+
+# Upper bounds in seconds, from a cached copy to a slow office conversion
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class _Histogram:
+    __slots__ = ("counts", "sum")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(BUCKETS, value)] += 1
+        self.sum += value
+
+
+class Registry:
+    """
+    Counters and histograms keyed by (name, labels).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    def increment(self, name: str, value: float = 1, labels: tuple = ()) -> None:
+        with self._lock:
+            key = (name, labels)
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, labels: tuple = ()) -> None:
+        with self._lock:
+            key = (name, labels)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(value)
+
+    def snapshot(self) -> dict:
+        """
+        Returns every metric as plain data (JSON-serializable).
+        """
+        with self._lock:
+            return {
+                "counters": [
+                    {"name": name, "labels": dict(labels), "value": value}
+                    for (name, labels), value in sorted(self._counters.items())
+                ],
+                "histograms": [
+                    {"name": name, "labels": dict(labels), "count": sum(h.counts), "sum": h.sum,
+                     "buckets": list(zip(BUCKETS + (float("inf"),), h.counts))}
+                    for (name, labels), h in sorted(self._histograms.items())
+                ],
+            }
+
+    def merge(self, snapshot: dict) -> None:
+        """
+        Adds a snapshot taken elsewhere (e.g. in a worker process) to this registry.
+        """
+        with self._lock:
+            for c in snapshot["counters"]:
+                key = (c["name"], tuple(sorted(c["labels"].items())))
+                self._counters[key] = self._counters.get(key, 0) + c["value"]
+            for h in snapshot["histograms"]:
+                key = (h["name"], tuple(sorted(h["labels"].items())))
+                histogram = self._histograms.get(key)
+                if histogram is None:
+                    histogram = self._histograms[key] = _Histogram()
+                for i, (_, count) in enumerate(h["buckets"]):
+                    histogram.counts[i] += count
+                histogram.sum += h["sum"]
+
+
+_registry = None  # None while disabled
+_sinks = []
+
+
+def enable(*sinks) -> None:
+    """
+    Starts recording metrics; `flush` writes them to `sinks`.
+    """
+    global _registry, _sinks
+    _sinks = list(sinks)
+    if _registry is None:
+        _registry = Registry()
+
+
+def disable() -> None:
+    """
+    Stops recording and discards everything recorded so far.
+    """
+    global _registry, _sinks
+    _registry = None
+    _sinks = []
+
+
+def enabled() -> bool:
+    return _registry is not None
+
+
+def increment(name: str, value: float = 1, **labels) -> None:
+    registry = _registry
+    if registry is not None:
+        registry.increment(name, value, tuple(sorted(labels.items())))
+
+
+def add_bytes(stage: str, size: int) -> None:
+    registry = _registry
+    if registry is not None:
+        registry.increment(BYTES_WRITTEN, size, (("stage", stage),))
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ("registry", "labels", "start")
+
+    def __init__(self, registry: Registry, stage: str):
+        self.registry = registry
+        self.labels = (("stage", stage),)
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(STAGE_SECONDS, time.perf_counter() - self.start, self.labels)
+        if exc_type is not None:
+            self.registry.increment(STAGE_FAILURES, 1, self.labels)
+        return False
+
+
+def timer(stage: str):
+    """
+    Context manager timing a block as `stage`; an exception leaving the
+    block also counts as a failure of that stage.
+    """
+    registry = _registry
+    if registry is None:
+        return _NULL_TIMER
+    return _Timer(registry, stage)
+
+
+def timed(stage: str, output_file: bool = False):
+    """
+    Decorator timing every call of a function as `stage`. With
+    output_file=True the function returns a file path whose size is added
+    to the bytes written by that stage.
+    """
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            registry = _registry
+            if registry is None:
+                return func(*args, **kwargs)
+            with _Timer(registry, stage):
+                result = func(*args, **kwargs)
+            if output_file:
+                try:
+                    add_bytes(stage, os.path.getsize(result))
+                except (OSError, TypeError):
+                    pass
+            return result
+        return wrapper
+    return decorate
+
+
+def snapshot() -> dict:
+    """
+    Returns everything recorded so far (empty when disabled).
+    """
+    registry = _registry
+    if registry is None:
+        return {"counters": [], "histograms": []}
+    return registry.snapshot()
+
+
+def merge(data: dict) -> None:
+    registry = _registry
+    if registry is not None:
+        registry.merge(data)
+
+
+@contextmanager
+def capture():
+    """
+    Records into a fresh registry for the duration of the block and yields
+    it, e.g. so a worker process can return its metrics to the parent.
+    Not thread-safe; meant for single-threaded worker processes.
+    """
+    global _registry
+    previous, _registry = _registry, Registry()
+    try:
+        yield _registry
+    finally:
+        _registry = previous
+
+
+def flush() -> None:
+    """
+    Writes the current metrics to every sink.
+    """
+    if _registry is None:
+        return
+    data = _registry.snapshot()
+    for sink in _sinks:
+        sink.write(data)
+
+
+@contextmanager
+def flushing():
+    """
+    Flushes to the sinks when the block exits, however it exits.
+    """
+    try:
+        yield
+    finally:
+        flush()
+
+
+def _label_text(labels: dict, extra: tuple = ()) -> str:
+    pairs = list(labels.items()) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+
+class LogSink:
+    """
+    Writes one log line per metric.
+    """
+
+    def __init__(self, logger: logging.Logger = None, level: int = logging.INFO):
+        self.logger = logger or logging.getLogger("invoice.metrics")
+        self.level = level
+
+    def write(self, data: dict) -> None:
+        for c in data["counters"]:
+            self.logger.log(self.level, "%s%s %s", c["name"], _label_text(c["labels"]), c["value"])
+        for h in data["histograms"]:
+            mean = h["sum"] / h["count"] if h["count"] else 0.0
+            self.logger.log(self.level, "%s%s count=%d sum=%.3fs mean=%.4fs", h["name"],
+                            _label_text(h["labels"]), h["count"], h["sum"], mean)
+
+
+class JSONFileSink:
+    """
+    Overwrites `path` with the metrics as JSON on every flush.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, data: dict) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            # json has no Infinity in the standard; the +Inf bucket is written as "+Inf"
+            json.dump({**data, "histograms": [
+                {**h, "buckets": [["+Inf" if le == float("inf") else le, n] for le, n in h["buckets"]]}
+                for h in data["histograms"]]}, f, indent=2)
+        os.replace(tmp, self.path)
+
+
+def prometheus_text(data: dict) -> str:
+    """
+    Renders a snapshot in the Prometheus text exposition format.
+    """
+    lines = []
+    typed = set()
+    for c in data["counters"]:
+        if c["name"] not in typed:
+            typed.add(c["name"])
+            lines.append(f"# TYPE {c['name']} counter")
+        lines.append(f"{c['name']}{_label_text(c['labels'])} {c['value']}")
+    for h in data["histograms"]:
+        name = h["name"]
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for le, count in h["buckets"]:
+            cumulative += count
+            bound = "+Inf" if le == float("inf") else repr(le)
+            lines.append(f"{name}_bucket{_label_text(h['labels'], (('le', bound),))} {cumulative}")
+        lines.append(f"{name}_sum{_label_text(h['labels'])} {h['sum']}")
+        lines.append(f"{name}_count{_label_text(h['labels'])} {h['count']}")
+    return "\n".join(lines) + "\n"
+
+
+class PrometheusFileSink:
+    """
+    Overwrites `path` with the metrics in the Prometheus text exposition
+    format, e.g. for the node_exporter textfile collector.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, data: dict) -> None:
+        tmp = self.path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(prometheus_text(data))
+        os.replace(tmp, self.path)
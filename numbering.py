@@ -0,0 +1,129 @@
+import os
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+@contextmanager
+def _locked(path: str):
+    """
+    Opens (creating if needed) `path` for reading and writing while holding
+    an exclusive OS-level lock on it, so other processes wait their turn.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, "r+") as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield f
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def _read_counter(f):
+    """
+    Returns (date, counter) from a "YYYYMMDD-N" counter file, or (None, 0).
+    """
+    f.seek(0)
+    try:
+        last_date, counter = f.read().strip().split("-")
+        return last_date, int(counter)
+    except ValueError:
+        return None, 0
+
+
+def _write_counter(f, date: str, counter: int) -> None:
+    f.seek(0)
+    f.truncate()
+    f.write(f"{date}-{counter}")
+    f.flush()
+    os.fsync(f.fileno())
+
+
+class NumberAllocator:
+    """
+    Issues sequential daily numbers such as INV-YYYYMMDD-0001.
+
+    The counter file holds "YYYYMMDD-N", the highest number handed out (or
+    reserved) today. Numbers are reserved `block_size` at a time under an
+    exclusive file lock and then issued from memory, so concurrent threads
+    and processes never receive the same number and the file is rewritten
+    once per block rather than once per number. `release` gives unused
+    numbers back when nobody has reserved past them in the meantime.
+    """
+
+    def __init__(self, counter_file: str, prefix: str, block_size: int = 1):
+        self.counter_file = counter_file
+        self.prefix = prefix
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._date = None
+        self._next = 0   # next number to issue
+        self._end = -1   # last number reserved
+
+    def _reserve(self, today: str) -> None:
+        with _locked(self.counter_file) as f:
+            last_date, counter = _read_counter(f)
+            start = counter + 1 if last_date == today else 1
+            end = start + max(self.block_size, 1) - 1
+            _write_counter(f, today, end)
+        self._date, self._next, self._end = today, start, end
+
+    def next(self) -> str:
+        """
+        Returns the next number, reserving a new block when needed.
+        """
+        today = datetime.now().strftime("%Y%m%d")
+        with self._lock:
+            if self._date != today or self._next > self._end:
+                if self._date is not None and self._date != today:
+                    self._release()
+                self._reserve(today)
+            number = self._next
+            self._next += 1
+        return f"{self.prefix}-{today}-{number:04d}"
+
+    def _release(self) -> None:
+        if self._date is None or self._next > self._end:
+            self._date = None
+            return
+        with _locked(self.counter_file) as f:
+            last_date, counter = _read_counter(f)
+            # Only hand numbers back if ours is still the latest reservation
+            if last_date == self._date and counter == self._end:
+                _write_counter(f, self._date, self._next - 1)
+        self._date = None
+
+    def release(self) -> None:
+        """
+        Returns the unused part of the current block to the counter file.
+        """
+        with self._lock:
+            self._release()
+
+    @contextmanager
+    def reserving(self, block_size: int):
+        """
+        Temporarily reserves `block_size` numbers at a time, releasing the
+        unused remainder on exit.
+        """
+        with self._lock:
+            previous, self.block_size = self.block_size, block_size
+        try:
+            yield self
+        finally:
+            with self._lock:
+                self._release()
+                self.block_size = previous
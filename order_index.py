@@ -0,0 +1,107 @@
+"""
+Content-hash index of order rows that have already been invoiced.
+
+Each Orders row is identified by its OrderID plus a digest of its contents,
+so a daily run against a growing workbook can pick out the rows that are
+new or have changed since they were last invoiced and skip the rest.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+from collections import Counter
+from datetime import datetime
+
+from records import plain
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS invoiced (
+    order_id TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    invoice_number TEXT,
+    invoiced_at TEXT NOT NULL,
+    PRIMARY KEY (order_id, digest)
+)
+"""
+
+
+def row_digest(order: dict) -> str:
+    """
+    Returns a digest of an order row's contents, independent of column order.
+    """
+    data = json.dumps(plain(order), sort_keys=True, default=str)
+    return hashlib.blake2b(data.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class RowKeys:
+    """
+    Assigns (OrderID, digest) keys to the rows of one pass over the sheet.
+
+    Identical rows are numbered in the order they are seen, so a second,
+    identical line added later is still picked up as new.
+    """
+
+    def __init__(self):
+        self._counts = Counter()
+
+    def __call__(self, order: dict) -> tuple:
+        digest = row_digest(order)
+        self._counts[digest] += 1
+        return str(order.get("OrderID") or ""), f"{digest}#{self._counts[digest]}"
+
+
+class OrderIndex:
+    """
+    SQLite record of every order row invoiced so far.
+
+    Rows are recorded once their invoice has been sent, so an interrupted
+    run leaves unsent rows pending for the next one. Safe to share between
+    threads.
+
+    Usage:
+        with OrderIndex("orders.index") as index:
+            GenerateAllInvoices("orders.xlsx", index=index)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(_SCHEMA)
+        self._conn.commit()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM invoiced").fetchone()[0]
+
+    def seen(self, key: tuple) -> bool:
+        """
+        Returns True if the row with this (OrderID, digest) key was invoiced before.
+        """
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM invoiced WHERE order_id = ? AND digest = ?", key).fetchone() is not None
+
+    def record(self, keys, invoice_number: str = None) -> None:
+        """
+        Marks the rows with these keys as invoiced on `invoice_number`.
+        """
+        now = datetime.now().isoformat()
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO invoiced (order_id, digest, invoice_number, invoiced_at) "
+                "VALUES (?, ?, ?, ?)",
+                [(order_id, digest, invoice_number, now) for order_id, digest in keys])
+            self._conn.commit()
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,300 @@
+"""
+Native PDF backend for invoices.
+
+Renders the same layout as FormatInvoice (logo, title, company block,
+Bill To/Ship To, metadata, line-items table, GST summary, terms) straight
+from a transformed order dict, without building a workbook or starting
+Excel/LibreOffice. Only the standard Helvetica fonts are used, so the
+output needs no embedded font data.
+"""
+import io
+import zlib
+from datetime import datetime
+
+from logo_cache import DEFAULT_LOGO_PATH, get_logo
+from totals import order_totals
+
+# Bump whenever the drawn layout changes; cached renders are keyed on it
+LAYOUT_VERSION = 1
+
+# Letter portrait, same margins as the workbook page setup (inches * 72)
+PAGE_WIDTH, PAGE_HEIGHT = 612, 792
+MARGIN_LEFT, MARGIN_RIGHT = 36, 36
+MARGIN_TOP, MARGIN_BOTTOM = 54, 54
+
+# Column widths of the invoice sheet (Excel character units), scaled to the page
+_COLUMN_CHARS = [8, 30, 14, 14, 20, 12]
+_USABLE_WIDTH = PAGE_WIDTH - MARGIN_LEFT - MARGIN_RIGHT
+COLUMN_WIDTHS = [w * _USABLE_WIDTH / sum(_COLUMN_CHARS) for w in _COLUMN_CHARS]
+COLUMN_X = [MARGIN_LEFT + sum(COLUMN_WIDTHS[:i]) for i in range(len(COLUMN_WIDTHS) + 1)]
+
+ROW_HEIGHT = 15
+CELL_PADDING = 3
+BODY_SIZE = 10
+LOGO_SIZE = 112  # 150px at 96dpi
+
+# Advance widths (1/1000 em) of the printable ASCII range, from the standard AFM files
+_HELVETICA_WIDTHS = [
+    278, 278, 355, 556, 556, 889, 667, 191, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 278, 278, 584, 584, 584, 556,
+    1015, 667, 667, 722, 722, 667, 611, 778, 722, 278, 500, 667, 556, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 278, 278, 278, 469, 556,
+    333, 556, 556, 500, 556, 556, 278, 556, 556, 222, 222, 500, 222, 833, 556, 556,
+    556, 556, 333, 500, 278, 556, 500, 722, 500, 500, 500, 334, 260, 334, 584,
+]
+_HELVETICA_BOLD_WIDTHS = [
+    278, 333, 474, 556, 556, 889, 722, 238, 333, 333, 389, 584, 278, 333, 278, 278,
+    556, 556, 556, 556, 556, 556, 556, 556, 556, 556, 333, 333, 584, 584, 584, 611,
+    975, 722, 722, 722, 722, 667, 611, 778, 722, 278, 556, 722, 611, 833, 722, 778,
+    667, 778, 722, 667, 611, 722, 667, 944, 667, 667, 611, 333, 278, 333, 584, 556,
+    333, 556, 611, 556, 611, 556, 333, 611, 611, 278, 278, 556, 278, 889, 611, 611,
+    611, 611, 389, 556, 333, 611, 556, 778, 556, 556, 500, 389, 280, 389, 584,
+]
+_FONTS = {
+    "F1": ("Helvetica", _HELVETICA_WIDTHS),
+    "F2": ("Helvetica-Bold", _HELVETICA_BOLD_WIDTHS),
+}
+
+
+def text_width(text: str, size: float, bold: bool = False) -> float:
+    """
+    Width of `text` in points when set in Helvetica (or Helvetica-Bold) at `size`.
+    """
+    widths = _FONTS["F2" if bold else "F1"][1]
+    total = 0
+    for ch in text:
+        code = ord(ch)
+        total += widths[code - 32] if 32 <= code <= 126 else 556
+    return total * size / 1000
+
+
+def _escape(text: str) -> bytes:
+    data = text.encode("cp1252", errors="replace")
+    return data.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)")
+
+
+def _fmt_currency(value) -> str:
+    return f"${value:,.2f}"
+
+
+def _fmt_date(value) -> str:
+    return value.strftime("%d/%m/%Y") if isinstance(value, datetime) else str(value)
+
+
+class _Page:
+    """
+    Content stream of a single page, in top-down coordinates.
+    """
+
+    def __init__(self):
+        self.ops = []
+        self.uses_logo = False
+
+    def text(self, x, top, value, size=BODY_SIZE, bold=False, align="left", width=None, clip=True):
+        """
+        Draws `value` with its baseline one font size below `top`.
+        With `width`, the text is aligned within [x, x + width] and, if
+        `clip` is set, truncated with an ellipsis when it does not fit.
+        """
+        value = "" if value is None else str(value)
+        if not value:
+            return
+        if width is not None:
+            room = width - 2 * CELL_PADDING
+            if clip and text_width(value, size, bold) > room:
+                while value and text_width(value + "...", size, bold) > room:
+                    value = value[:-1]
+                value += "..."
+            w = text_width(value, size, bold)
+            if align == "right":
+                x = x + width - CELL_PADDING - w
+            elif align == "center":
+                x = x + (width - w) / 2
+            else:
+                x = x + CELL_PADDING
+        y = PAGE_HEIGHT - top - size
+        font = "F2" if bold else "F1"
+        self.ops.append(b"BT /%s %g Tf %.2f %.2f Td (%s) Tj ET" % (font.encode(), size, x, y, _escape(value)))
+
+    def box(self, x, top, width, height):
+        """
+        Strokes the outline of a cell.
+        """
+        y = PAGE_HEIGHT - top - height
+        self.ops.append(b"%.2f %.2f %.2f %.2f re S" % (x, y, width, height))
+
+    def logo(self, x, top, size):
+        y = PAGE_HEIGHT - top - size
+        self.ops.append(b"q %g 0 0 %g %.2f %.2f cm /Im1 Do Q" % (size, size, x, y))
+        self.uses_logo = True
+
+    def stream(self) -> bytes:
+        return b"0 g 0 G 0.5 w\n" + b"\n".join(self.ops)
+
+
+def _write_pdf(pages: list, logo) -> bytes:
+    """
+    Serialises pages into a PDF 1.4 document.
+    """
+    objects = []  # object bodies; object number is index + 1
+
+    def add(body: bytes) -> int:
+        objects.append(body)
+        return len(objects)
+
+    def stream(dictionary: bytes, data: bytes) -> bytes:
+        return b"<< %s /Length %d >>\nstream\n%s\nendstream" % (dictionary, len(data), data)
+
+    catalog = add(b"")
+    pages_obj = add(b"")
+    fonts = {
+        name: add(b"<< /Type /Font /Subtype /Type1 /BaseFont /%s /Encoding /WinAnsiEncoding >>" % base.encode())
+        for name, (base, _) in _FONTS.items()
+    }
+    font_dict = b" ".join(b"/%s %d 0 R" % (name.encode(), num) for name, num in fonts.items())
+    resources = b"/Font << %s >>" % font_dict
+    if logo is not None:
+        w, h, data = logo
+        image = add(stream(
+            b"/Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+            b"/BitsPerComponent 8 /Filter /FlateDecode" % (w, h), data))
+        resources += b" /XObject << /Im1 %d 0 R >>" % image
+
+    kids = []
+    for page in pages:
+        content = add(stream(b"/Filter /FlateDecode", zlib.compress(page.stream())))
+        kids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << %s >> /Contents %d 0 R >>"
+            % (pages_obj, PAGE_WIDTH, PAGE_HEIGHT, resources, content)))
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_obj
+    objects[pages_obj - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+    offsets = []
+    for num, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (num, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (
+        len(objects) + 1, catalog, xref))
+    return out.getvalue()
+
+
+def _row_top(row: int) -> float:
+    """
+    Top edge of a 1-based sheet row on the first page.
+    """
+    return MARGIN_TOP + (row - 1) * ROW_HEIGHT
+
+
+def RenderInvoicePDF(order: dict, logo_path: str = DEFAULT_LOGO_PATH) -> bytes:
+    """
+    Render a transformed order (the dict FormatInvoice takes) as PDF bytes.
+    Long line-item lists continue on further pages with the table header repeated.
+    Pass logo_path=None to leave the logo out.
+    """
+    page = _Page()
+    pages = [page]
+    col = COLUMN_X
+    widths = COLUMN_WIDTHS
+
+    # — Logo & Title —
+    cached = get_logo(logo_path) if logo_path else None
+    logo = cached.pdf_xobject if cached is not None else None
+    if logo is not None:
+        page.logo(col[0], _row_top(1), LOGO_SIZE)
+    page.text(col[1], _row_top(4), "INVOICE", size=20, bold=True, align="right", width=col[6] - col[1])
+
+    # — Company Info & Contact —
+    company_lines = [
+        "Yukon Packing",
+        "443 Maple Avenue",
+        "Ontario, NT B4M 3B7",
+        f"Phone: {order.get('CompanyContact','')}"
+    ]
+    for i, txt in enumerate(company_lines, start=9):
+        page.text(col[0], _row_top(i), txt)
+
+    # — Bill To / Ship To —
+    for c, label, key in [(0, "Bill To", "BillTo"), (2, "Ship To", "ShipTo")]:
+        page.text(col[c], _row_top(14), label, size=12, bold=True)
+        info = order.get(key, {})
+        lines = [
+            info.get("CustomerName", ""),
+            info.get("Address", ""),
+            info.get("City", ""),
+            f"Phone: {info.get('Phone','')}",
+            f"Email: {info.get('Email','')}",
+        ]
+        for r, txt in enumerate(lines, start=15):
+            page.text(col[c], _row_top(r), txt)
+
+    # — Metadata —
+    meta = [
+        ("Invoice #", order["InvoiceNumber"]),
+        ("Invoice Date", _fmt_date(order["InvoiceDate"])),
+        ("P.O.#", order.get("PO", "")),
+        ("Due Date", _fmt_date(order["DueDate"])),
+    ]
+    for r, (label, val) in enumerate(meta, start=14):
+        page.text(col[4], _row_top(r), label, bold=True)
+        # values overflow to the left like a right-aligned spreadsheet cell
+        page.text(col[5], _row_top(r), val, align="right", width=widths[5], clip=False)
+
+    # — Line-Items Table —
+    headers = ["Qty", "Description", "Unit Price", "Amount", "Notes", "Status"]
+
+    def header_row(pg, top):
+        for i, h in enumerate(headers):
+            pg.box(col[i], top, widths[i], ROW_HEIGHT)
+            pg.text(col[i], top + 2, h, bold=True, align="center", width=widths[i])
+
+    top = _row_top(21)
+    header_row(page, top)
+    amounts, sub, gst, total = order_totals(order)
+    for item, amt in zip(order["Items"], amounts):
+        top += ROW_HEIGHT
+        if top + ROW_HEIGHT > PAGE_HEIGHT - MARGIN_BOTTOM:
+            page = _Page()
+            pages.append(page)
+            top = MARGIN_TOP
+            header_row(page, top)
+            top += ROW_HEIGHT
+        cells = [
+            (item["Qty"], "left"),
+            (item["Description"], "left"),
+            (_fmt_currency(item["UnitPrice"]), "right"),
+            (_fmt_currency(amt), "right"),
+            ("", "left"),
+            ("", "left"),
+        ]
+        for i, (val, align) in enumerate(cells):
+            page.box(col[i], top, widths[i], ROW_HEIGHT)
+            page.text(col[i], top + 2, val, align=align, width=widths[i])
+
+    # — Summary —
+    summary = [("Subtotal", sub), ("GST 5%", gst), ("TOTAL", total)]
+    # summary + terms need 6 rows below a blank one
+    if top + 8 * ROW_HEIGHT > PAGE_HEIGHT - MARGIN_BOTTOM:
+        page = _Page()
+        pages.append(page)
+        top = MARGIN_TOP - ROW_HEIGHT
+    top += 2 * ROW_HEIGHT
+    for i, (lbl, val) in enumerate(summary):
+        row_top = top + i * ROW_HEIGHT
+        page.text(col[4], row_top + 2, lbl, bold=True, align="right", width=widths[4])
+        page.box(col[5], row_top, widths[5], ROW_HEIGHT)
+        page.text(col[5], row_top + 2, _fmt_currency(val), align="right", width=widths[5])
+
+    # — Terms & Conditions —
+    trow = top + 4 * ROW_HEIGHT
+    page.text(col[0], trow, "Terms & Conditions:", bold=True)
+    page.text(col[0], trow + ROW_HEIGHT, order.get("Terms", "Payment is due within 15 days."))
+
+    return _write_pdf(pages, logo if any(p.uses_logo for p in pages) else None)
@@ -0,0 +1,137 @@
+"""
+Asyncio delivery pipeline: format -> export -> send.
+
+Each stage has its own worker count and feeds the next through a bounded
+queue, so a slow stage applies backpressure to the ones before it instead
+of letting work pile up in memory. Stage functions are blocking and run in
+per-stage thread pools; the subprocess and network waits of export and
+send release the GIL, so all three stages overlap.
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+import invoice
+
+_DONE = object()
+
+
+def _init_com():
+    # Outlook COM (SendInvoice) must be initialised on every thread that uses it
+    try:
+        import pythoncom
+    except ImportError:
+        return
+    pythoncom.CoInitialize()
+
+
+class _Cached(str):
+    """Path of an invoice copied from the render cache; nothing left to export."""
+
+
+def _format(job, engine: str, cache=None):
+    transformed_order, base, email = job
+    key = None
+    if cache is not None:
+        key = invoice.RenderKey(transformed_order, "pdf", engine)
+        if cache.fetch(key, "pdf", base + ".pdf"):
+            return _Cached(base + ".pdf"), base, email, key
+    if engine == "native":
+        # The native engine draws straight from the order
+        return transformed_order, base, email, key
+    return invoice.FormatForExport(transformed_order), base, email, key
+
+
+def _export(item, converter_pool: int, engine: str, cache=None):
+    wb, base, email, key = item
+    if isinstance(wb, _Cached):
+        return wb, base, email
+    if engine == "native":
+        path = invoice.ExportInvoice(wb, base, format="pdf", engine="native")
+    elif converter_pool:
+        from converter import get_shared_pool
+        path = invoice.ExportInvoice(wb, base, format="pdf", converter=get_shared_pool(converter_pool))
+    else:
+        path = invoice.ExportInvoice(wb, base, format="pdf")
+    if key is not None:
+        cache.store(key, "pdf", path)
+    return path, base, email
+
+
+async def RunPipeline(jobs, send, format_workers: int = 1, export_workers: int = 2,
+                      send_workers: int = 4, queue_size: int = None, converter_pool: int = 0,
+                      engine: str = "office", cache=None) -> dict:
+    """
+    Pushes `jobs` (transformed_order, base, email) through the format,
+    export and send stages concurrently.
+
+    Args:
+        jobs: Iterator of (transformed_order, base filename, recipient email)
+        send: Callable send(email, pdf_path) used by the send stage
+        format_workers, export_workers, send_workers: Concurrency per stage
+        queue_size: Capacity of each inter-stage queue (defaults to twice
+            the widest stage)
+        converter_pool, engine, cache: As for GenerateAllInvoices
+
+    Returns:
+        Dict mapping each failed invoice's base filename to its exception.
+    """
+    loop = asyncio.get_running_loop()
+    size = queue_size or 2 * max(format_workers, export_workers, send_workers)
+    to_format, to_export, to_send = (asyncio.Queue(size) for _ in range(3))
+    failures = {}
+
+    reader = ThreadPoolExecutor(max_workers=1)  # jobs may read the workbook; keep it on one thread
+    format_pool = ThreadPoolExecutor(max_workers=format_workers)
+    export_pool = ThreadPoolExecutor(max_workers=export_workers)
+    send_pool = ThreadPoolExecutor(max_workers=send_workers, initializer=_init_com)
+
+    async def produce():
+        try:
+            while True:
+                job = await loop.run_in_executor(reader, next, jobs, _DONE)
+                if job is _DONE:
+                    break
+                await to_format.put(job)
+        finally:
+            for _ in range(format_workers):
+                await to_format.put(_DONE)
+
+    # Every item is a (payload, base filename, email) tuple
+    async def worker(inbox, outbox, run, pool):
+        while True:
+            item = await inbox.get()
+            if item is _DONE:
+                return
+            try:
+                result = await loop.run_in_executor(pool, run, item)
+            except Exception as e:
+                failures[item[1]] = e
+                continue
+            if outbox is not None:
+                await outbox.put(result)
+
+    async def stage(count, inbox, outbox, next_count, run, pool):
+        await asyncio.gather(*(worker(inbox, outbox, run, pool) for _ in range(count)))
+        if outbox is not None:
+            for _ in range(next_count):
+                await outbox.put(_DONE)
+
+    try:
+        results = await asyncio.gather(
+            produce(),
+            stage(format_workers, to_format, to_export, export_workers,
+                  lambda job: _format(job, engine, cache), format_pool),
+            stage(export_workers, to_export, to_send, send_workers,
+                  lambda item: _export(item, converter_pool, engine, cache), export_pool),
+            stage(send_workers, to_send, None, 0,
+                  lambda item: send(item[2], item[0]), send_pool),
+            return_exceptions=True,
+        )
+    finally:
+        for pool in (reader, format_pool, export_pool, send_pool):
+            pool.shutdown(wait=True)
+    # e.g. a transform error ends the job stream; everything queued still drains first
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return failures
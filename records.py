@@ -0,0 +1,217 @@
+"""
+Compact record types for the invoice pipeline.
+
+Orders, customers, line items and invoices are slotted objects rather
+than dicts, which roughly halves their memory footprint in large batches.
+Each record still behaves as a mutable mapping of its fields
+(`order["Qty"]`, `order.get("Email", "")`, `"OrderID" in order`,
+comparison with plain dicts), so code written against the old dicts keeps
+working. Fields can also be read as attributes (`order.Qty`), which is as
+cheap as a dict lookup; hot paths use attributes inside `key_errors()`,
+which reports an unset field as the KeyError a dict would have raised,
+and convert plain dicts they are given with `Order.of(...)` first.
+Records are not JSON serializable; pass them through `plain()` first.
+
+A field that was never set is simply absent, exactly like a missing dict
+key. Columns a sheet has beyond the known fields are kept in a small
+per-record dict, so no data is lost.
+"""
+from collections.abc import Mapping, MutableMapping
+
+
+class Record(MutableMapping):
+    """
+    Base class: a slotted object that is also a dict of its fields.
+    Subclasses list their fields in FIELDS.
+    """
+
+    __slots__ = ("_extra",)
+    FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        cls._SLOTS = {name: getattr(cls, name) for name in cls.FIELDS}
+
+    def __init__(self, fields: Mapping = (), **kwargs):
+        self._extra = None
+        if fields:
+            self.update(fields)
+        slots = self._SLOTS
+        for key, value in kwargs.items():
+            if key in slots:
+                setattr(self, key, value)
+            else:
+                self._set_extra(key, value)
+
+    @classmethod
+    def row_reader(cls, headers, convert: dict = None):
+        """
+        Returns a function that builds a record from a sheet row with the
+        given header row. The header lookup is done once here rather than
+        for every row; `convert` maps field names to conversion functions
+        (e.g. {"Qty": int}).
+        """
+        convert = convert or {}
+        setters = []
+        for name in headers:
+            fn = convert.get(name)
+            slot = cls._SLOTS.get(name)
+            if slot is not None:
+                setters.append(slot.__set__ if fn is None else
+                               (lambda record, value, set_=slot.__set__, fn=fn: set_(record, fn(value))))
+            else:
+                setters.append(lambda record, value, name=name, fn=fn:
+                               record._set_extra(name, value if fn is None else fn(value)))
+        new = cls.__new__
+
+        def read(row):
+            record = new(cls)
+            record._extra = None
+            for set_, value in zip(setters, row):
+                set_(record, value)
+            return record
+        return read
+
+    @classmethod
+    def of(cls, value) -> "Record":
+        """
+        Returns `value` itself if it is already a `cls`, else a `cls` with
+        the same fields (e.g. from a plain dict).
+        """
+        return value if type(value) is cls else cls(value)
+
+    def _set_extra(self, key, value) -> None:
+        if self._extra is None:
+            self._extra = {}
+        self._extra[key] = value
+
+    def __getitem__(self, key):
+        if key in self._SLOTS:
+            try:
+                return getattr(self, key)
+            except AttributeError:
+                raise KeyError(key) from None
+        if self._extra is not None and key in self._extra:
+            return self._extra[key]
+        raise KeyError(key)
+
+    def __setitem__(self, key, value) -> None:
+        slot = self._SLOTS.get(key)
+        if slot is not None:
+            slot.__set__(self, value)
+        else:
+            self._set_extra(key, value)
+
+    def __delitem__(self, key) -> None:
+        slot = self._SLOTS.get(key)
+        if slot is not None:
+            try:
+                slot.__delete__(self)
+            except AttributeError:
+                raise KeyError(key) from None
+        elif self._extra is not None and key in self._extra:
+            del self._extra[key]
+        else:
+            raise KeyError(key)
+
+    def __contains__(self, key) -> bool:
+        slot = self._SLOTS.get(key)
+        if slot is not None:
+            return hasattr(self, key)
+        return self._extra is not None and key in self._extra
+
+    def __iter__(self):
+        for name in self.FIELDS:
+            if hasattr(self, name):
+                yield name
+        if self._extra:
+            yield from self._extra
+
+    def __len__(self) -> int:
+        return sum(1 for _ in self)
+
+    def get(self, key, default=None):
+        if key in self._SLOTS:
+            return getattr(self, key, default)
+        if self._extra is not None:
+            return self._extra.get(key, default)
+        return default
+
+    def to_dict(self) -> dict:
+        """
+        Returns a plain dict copy, converting nested records (and lists of
+        records) as well.
+        """
+        return {key: plain(self[key]) for key in self}
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({dict(self)!r})"
+
+
+class Order(Record):
+    """One row of the Orders sheet."""
+    FIELDS = ("OrderID", "CustomerID", "CustomerName", "Email", "ItemID", "ItemName", "Qty", "Price")
+    __slots__ = FIELDS
+
+
+class Customer(Record):
+    """One row of the BillTo sheet."""
+    FIELDS = ("CustomerID", "CustomerName", "Email", "Phone", "Address", "City")
+    __slots__ = FIELDS
+
+
+class LineItem(Record):
+    """One line of an invoice's items table."""
+    FIELDS = ("Qty", "Description", "UnitPrice", "Amount")
+    __slots__ = FIELDS
+
+
+class Invoice(Record):
+    """A transformed order, ready for FormatInvoice or the native PDF engine."""
+    FIELDS = ("CustomerID", "CustomerName", "Email", "BillTo", "ShipTo", "CompanyContact",
+              "InvoiceNumber", "InvoiceDate", "PO", "DueDate", "Items", "Terms",
+              "Subtotal", "GST", "Total")
+    __slots__ = FIELDS
+
+
+def plain(value):
+    """
+    Returns `value` with every record in it, at any depth (inside dicts and
+    lists too), converted to a plain dict, e.g. before it is serialized.
+    """
+    if isinstance(value, Record):
+        return value.to_dict()
+    if isinstance(value, dict):
+        return {key: plain(v) for key, v in value.items()}
+    if isinstance(value, list):
+        return [plain(v) for v in value]
+    return value
+
+
+class _KeyErrors:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and issubclass(exc_type, AttributeError) and isinstance(exc.obj, Record):
+            raise KeyError(exc.name) from None
+        return False
+
+
+_KEY_ERRORS = _KeyErrors()
+
+
+def key_errors():
+    """
+    Context manager under which reading an unset record field as an
+    attribute raises KeyError, as the same lookup on a dict would, so code
+    can use the faster attribute access without changing what its callers
+    catch. Other AttributeErrors pass through unchanged.
+
+    Usage:
+        with key_errors():
+            customer_id = order.CustomerID
+    """
+    return _KEY_ERRORS
@@ -0,0 +1,153 @@
+"""
+Content-addressed cache of rendered invoices.
+
+Rendered files are stored under a hash of the transformed order, the
+output format, the rendering engine and its template version, so exporting
+an identical invoice again (a reprint, a correction run, a resumed batch)
+is a file copy instead of a workbook build and PDF conversion. The cache
+directory is kept under `max_bytes` by evicting least recently used files.
+"""
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import date, datetime
+
+from records import plain
+
+# 512 MB holds tens of thousands of single-page invoices
+DEFAULT_MAX_BYTES = 512 * 1024 * 1024
+
+
+def _canonical(value):
+    # Invoices print dates only, so the time of day must not change the key
+    if isinstance(value, (datetime, date)):
+        return value.strftime("%Y-%m-%d")
+    raise TypeError(f"Cannot hash {type(value).__name__} in an invoice")
+
+
+def render_key(transformed_order: dict, format: str, engine: str, template_version, logo_path: str = None) -> str:
+    """
+    Returns the cache key for rendering `transformed_order` as `format` with
+    `engine` at `template_version`. The logo file's path and modification
+    time are included, so replacing the logo invalidates cached renders.
+    """
+    logo = None
+    if logo_path is not None:
+        try:
+            logo = [os.path.abspath(logo_path), os.stat(logo_path).st_mtime]
+        except OSError:
+            logo = None
+    data = json.dumps([plain(transformed_order), format, engine, template_version, logo],
+                      sort_keys=True, default=_canonical)
+    return hashlib.sha256(data.encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """
+    A directory of rendered invoices keyed by render_key.
+
+    Entries are written to a temporary file and renamed into place, so
+    several threads or processes can share one directory. A hit refreshes
+    the entry's modification time, which is what eviction orders by.
+
+    Usage:
+        cache = RenderCache("cache/renders", max_bytes=256 * 1024 * 1024)
+        RenderInvoice(transformed_order, "output/invoice_1001", cache=cache)
+    """
+
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._size = None  # bytes cached, as of the last scan plus our own stores
+        os.makedirs(directory, exist_ok=True)
+
+    def __getstate__(self):
+        # Shipped to rendering processes; the lock stays behind
+        return {"directory": self.directory, "max_bytes": self.max_bytes}
+
+    def __setstate__(self, state):
+        self.__init__(state["directory"], state["max_bytes"])
+
+    def _path(self, key: str, format: str) -> str:
+        return os.path.join(self.directory, f"{key}.{format}")
+
+    def fetch(self, key: str, format: str, dest_path: str) -> bool:
+        """
+        Copies the cached file for `key` to dest_path. Returns False on a miss.
+        """
+        path = self._path(key, format)
+        try:
+            shutil.copyfile(path, dest_path)
+            os.utime(path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def store(self, key: str, format: str, src_path: str) -> None:
+        """
+        Adds the rendered file at src_path under `key`, then evicts the least
+        recently used entries if the cache has grown past max_bytes.
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.directory, suffix=".part")
+        os.close(fd)
+        try:
+            shutil.copyfile(src_path, tmp)
+            size = os.path.getsize(tmp)
+            os.replace(tmp, self._path(key, format))
+        except BaseException:
+            os.remove(tmp)
+            raise
+        with self._lock:
+            if self._size is not None:
+                self._size += size
+            full_scan = self._size is None or self._size > self.max_bytes
+        # Other processes' stores are only seen by a scan, which is done
+        # when this process's running total says the cache may be full
+        if full_scan:
+            self.evict()
+
+    def evict(self) -> None:
+        """
+        Removes least recently used entries until the cache fits in max_bytes.
+        """
+        with self._lock:
+            entries = []
+            total = 0
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    if entry.name.endswith(".part"):
+                        continue
+                    try:
+                        st = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((st.st_mtime, st.st_size, entry.path))
+                    total += st.st_size
+            if total > self.max_bytes:
+                entries.sort()
+                for _, size, path in entries:
+                    try:
+                        os.remove(path)
+                    except FileNotFoundError:
+                        pass  # evicted by another process
+                    total -= size
+                    if total <= self.max_bytes:
+                        break
+            self._size = total
+
+    def clear(self) -> None:
+        """
+        Removes every cached file.
+        """
+        with self._lock:
+            with os.scandir(self.directory) as it:
+                for entry in it:
+                    try:
+                        os.remove(entry.path)
+                    except FileNotFoundError:
+                        pass
+            self._size = 0
@@ -0,0 +1,231 @@
+import os
+import queue
+import smtplib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from email.message import EmailMessage
+
+import metrics
+from invoice_email import invoice_email_content
+
+# Errors worth retrying: dropped connections, timeouts and 4xx replies
+_TRANSIENT = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, TimeoutError, ConnectionError)
+
+
+def _is_transient(error: Exception) -> bool:
+    if isinstance(error, _TRANSIENT):
+        return True
+    if isinstance(error, smtplib.SMTPResponseException):
+        return 400 <= error.smtp_code < 500
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return all(400 <= code < 500 for code, _ in error.recipients.values())
+    return False
+
+
+class SMTPSender:
+    """
+    Sends invoices over SMTP, keeping up to `pool_size` authenticated
+    connections open and reusing them across messages. Idle connections
+    are checked with NOOP before reuse and replaced if the server dropped them.
+
+    Transient failures (dropped connections, timeouts, 4xx replies) are
+    retried up to `retries` times with exponential backoff; permanent 5xx
+    failures are raised straight away. A connection is only replaced when
+    it was dropped, not when the server refused a message.
+
+    Usage:
+        with SMTPSender("smtp.example.com", username="bot", password="...") as sender:
+            sender.send("customer@example.com", "invoice_1001.pdf")
+    """
+
+    def __init__(self, host: str, port: int = 587, username: str = None, password: str = None,
+                 use_tls: bool = True, from_addr: str = "accounting@contosologistics.com",
+                 pool_size: int = 4, retries: int = 3, backoff: float = 1.0, timeout: float = 30.0):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.from_addr = from_addr
+        self.pool_size = pool_size
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.host, self.port, timeout=self.timeout)
+        if self.use_tls:
+            conn.starttls()
+        if self.username:
+            conn.login(self.username, self.password or "")
+        return conn
+
+    def _checkout(self):
+        """
+        Takes an idle connection, or returns None after reserving a slot
+        for a new one. Blocks while the pool is full.
+        """
+        while True:
+            with self._lock:
+                try:
+                    return self._idle.get_nowait()
+                except queue.Empty:
+                    if self._open < self.pool_size:
+                        self._open += 1
+                        return None
+            # Pool is full; wait for a connection to come back (or be discarded)
+            try:
+                return self._idle.get(timeout=0.1)
+            except queue.Empty:
+                continue
+
+    @staticmethod
+    def _alive(conn: smtplib.SMTP) -> bool:
+        try:
+            return conn.noop()[0] == 250
+        except (smtplib.SMTPException, OSError):
+            return False
+
+    def _acquire(self) -> smtplib.SMTP:
+        while True:
+            conn = self._checkout()
+            if conn is None:
+                break
+            # Servers drop idle sessions; check before reusing one
+            if self._alive(conn):
+                return conn
+            self._discard(conn)
+        try:
+            return self._connect()
+        except Exception:
+            with self._lock:
+                self._open -= 1
+            raise
+
+    def _discard(self, conn: smtplib.SMTP) -> None:
+        try:
+            conn.close()
+        finally:
+            with self._lock:
+                self._open -= 1
+
+    def build_message(self, emailAddr: str, filePath: str, cc: str = None,
+                      additional_attachments: list = None) -> EmailMessage:
+        """
+        Builds the invoice email with the same subject, body and attachment
+        rules as SendInvoice (PDF attachments only).
+        """
+        def validate_path(path):
+            abs_path = os.path.abspath(path)
+            if not os.path.exists(abs_path):
+                raise RuntimeError(f"Failed to send invoice: File not found - {abs_path}")
+            return abs_path
+
+        abs_file_path = validate_path(filePath)
+        if not abs_file_path.lower().endswith('.pdf'):
+            raise ValueError("Only PDF files can be attached to the email")
+
+        subject, body = invoice_email_content(filePath)
+        msg = EmailMessage()
+        msg["From"] = self.from_addr
+        msg["To"] = emailAddr
+        if cc:
+            msg["Cc"] = cc
+        msg["Subject"] = subject
+        msg.set_content(body)
+        msg.add_alternative(body.replace('\n', '<br>'), subtype="html")
+
+        attachments = [abs_file_path]
+        for attachment in additional_attachments or []:
+            abs_attachment_path = validate_path(attachment)
+            if abs_attachment_path.lower().endswith('.pdf'):  # Skip non-PDF files
+                attachments.append(abs_attachment_path)
+        for path in attachments:
+            with open(path, "rb") as f:
+                msg.add_attachment(f.read(), maintype="application", subtype="pdf",
+                                   filename=os.path.basename(path))
+        return msg
+
+    def send_message(self, msg: EmailMessage) -> None:
+        """
+        Delivers an already built message on a pooled connection, retrying
+        transient failures.
+        """
+        for attempt in range(self.retries + 1):
+            conn = None
+            try:
+                conn = self._acquire()
+                conn.send_message(msg)
+            except Exception as e:
+                if conn is not None:
+                    # A reply refusing the message (e.g. a bad recipient) leaves the
+                    # session usable; SMTPException is itself an OSError, so socket
+                    # errors are told apart by excluding it
+                    if isinstance(e, smtplib.SMTPException) and not isinstance(e, smtplib.SMTPServerDisconnected):
+                        self._idle.put(conn)
+                    else:
+                        self._discard(conn)
+                if not _is_transient(e) or attempt == self.retries:
+                    raise RuntimeError(f"Failed to send invoice: {str(e)}")
+                time.sleep(self.backoff * (2 ** attempt))
+            else:
+                self._idle.put(conn)
+                return
+
+    @metrics.timed("send")
+    def send(self, emailAddr: str, filePath: str, cc: str = None, additional_attachments: list = None) -> None:
+        """
+        Sends the invoice at filePath to emailAddr. Same arguments as SendInvoice.
+        """
+        self.send_message(self.build_message(emailAddr, filePath, cc, additional_attachments))
+
+    def send_many(self, jobs) -> dict:
+        """
+        Sends many invoices concurrently, one in flight per pooled connection.
+
+        Args:
+            jobs: Iterable of (emailAddr, filePath) pairs
+
+        Returns:
+            Dict mapping the filePath of each failed send to its exception.
+        """
+        failures = {}
+
+        def deliver(job):
+            email, path = job
+            try:
+                self.send(email, path)
+            except Exception as e:
+                failures[path] = e
+
+        with ThreadPoolExecutor(max_workers=self.pool_size) as pool:
+            list(pool.map(deliver, jobs))
+        return failures
+
+    def close(self) -> None:
+        """
+        Closes every idle pooled connection.
+        """
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                conn.quit()
+            except (smtplib.SMTPException, OSError):
+                conn.close()
+            with self._lock:
+                self._open -= 1
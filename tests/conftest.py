@@ -1,5 +1,114 @@
 import os
+import shutil
 import sys
+from pathlib import Path
+
+import pytest
 
 # Add the project root directory to the Python path
-sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))) 
\ No newline at end of file
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import invoice  # noqa: E402
+import metrics  # noqa: E402
+
+DATA = Path(__file__).parent / "data"
+
+
+def _order_line(order_id, **fields) -> dict:
+    line = {"OrderID": str(order_id), "Email": "c@x.com", "CustomerID": "CUST001",
+            "CustomerName": "Customer", "ItemID": "ITEM001", "Qty": 1, "Price": 10.0}
+    line.update(fields)
+    return line
+
+
+@pytest.fixture
+def order_line():
+    """
+    Returns order_line(order_id, **fields), which builds one Orders row:
+    1 x ITEM001 at 10.0 for CUST001, with `fields` overriding any of it.
+    """
+    return _order_line
+
+
+@pytest.fixture
+def orders_workbook(tmp_path):
+    """
+    Path of a copy of the sample orders workbook (an Orders sheet only).
+    """
+    path = tmp_path / "orders.xlsx"
+    shutil.copy(DATA / "orders_sample_with_id.xlsx", path)
+    return str(path)
+
+
+@pytest.fixture
+def orders_source(monkeypatch):
+    """
+    Stands in for the orders workbook: no file is opened, the bill-to data
+    is empty and GenerateAllInvoices reads the order lines passed to
+    `orders_source(lines)`, whatever path it is given.
+    """
+    lines = []
+    monkeypatch.setattr(invoice.WorkbookSource, "__init__", lambda self, *args, **kwargs: setattr(self, "_wb", None))
+    monkeypatch.setattr(invoice.WorkbookSource, "close", lambda self: None)
+    monkeypatch.setattr(invoice.WorkbookSource, "bill_to", lambda self: {})
+    monkeypatch.setattr(invoice.WorkbookSource, "orders", lambda self: iter(list(lines)))
+
+    def use(orders):
+        lines[:] = orders
+    return use
+
+
+class RecordingRenderer:
+    """
+    Stand-in for invoice._RenderInvoice: records every (base, transformed
+    order) rendered in `rendered` and its base name in `bases`, and writes
+    a placeholder PDF, or raises for the base names in `failing`.
+    """
+
+    def __init__(self):
+        self.rendered = []
+        self.bases = []
+        self.failing = set()
+
+    def __call__(self, transformed_order, base, *args, **kwargs):
+        self.rendered.append((base, transformed_order))
+        self.bases.append(base)
+        if base in self.failing:
+            raise RuntimeError("render boom")
+        Path(base + ".pdf").write_bytes(b"%PDF")
+        return base + ".pdf"
+
+
+@pytest.fixture
+def renderer(tmp_path, monkeypatch):
+    """
+    Replaces rendering with a RecordingRenderer; runs in tmp_path so its
+    placeholder PDFs (and the number counters) stay out of the repo.
+    """
+    monkeypatch.chdir(tmp_path)
+    recorder = RecordingRenderer()
+    monkeypatch.setattr(invoice, "_RenderInvoice", recorder)
+    return recorder
+
+
+class RecordingSender:
+    """
+    Stand-in for smtp_sender.SMTPSender: records every (email, path) sent
+    in `sent`, or raises for the addresses in `failing`. Sends are timed
+    as the "send" stage like the real sender's.
+    """
+
+    def __init__(self):
+        self.sent = []
+        self.failing = set()
+
+    @metrics.timed("send")
+    def send(self, email, pdf_path):
+        if email in self.failing:
+            raise RuntimeError("mail server went away")
+        self.sent.append((email, pdf_path))
+
+
+@pytest.fixture
+def sender():
+    return RecordingSender()
@@ -0,0 +1,41 @@
+import json
+
+import invoice
+from benchmark import CompareResults, GenerateWorkbook, RunBenchmark
+
+
+def test_generate_workbook_groups_lines_per_order(tmp_path):
+    path = GenerateWorkbook(str(tmp_path / "orders.xlsx"), rows=12, items_per_order=3)
+
+    orders = invoice.LoadOrders(path)
+    assert len(orders) == 12
+    assert len(invoice.GroupOrders(orders)) == 4
+    assert all(order["CustomerID"] in invoice.LoadBillToData(path) for order in orders)
+
+
+def test_run_benchmark_reports_every_stage(tmp_path):
+    counters = open("invoice_counter.txt").read()
+
+    result = RunBenchmark(rows=30, items_per_order=2, sample=3, pdf_sample=2,
+                          workdir=str(tmp_path), office_pdf=False)
+
+    assert result["meta"]["invoices"] == 15
+    assert set(result["stages"]) == {"LoadOrders", "TransformOrder", "FormatInvoice",
+                                     "ExportInvoice[xlsx]", "ExportInvoice[pdf,native]"}
+    assert result["stages"]["FormatInvoice"]["count"] == 3
+    assert result["stages"]["ExportInvoice[pdf,native]"]["latency_ms"]["p50"] > 0
+    json.dumps(result)
+    # Real invoice numbers are left untouched
+    assert open("invoice_counter.txt").read() == counters
+
+
+def test_compare_flags_throughput_drops():
+    baseline = {"stages": {"FormatInvoice": {"throughput_per_s": 100.0},
+                           "LoadOrders": {"throughput_per_s": 1000.0}}}
+    current = {"stages": {"FormatInvoice": {"throughput_per_s": 80.0},
+                          "LoadOrders": {"throughput_per_s": 950.0}}}
+
+    regressions = CompareResults(current, baseline, tolerance=0.10)
+
+    assert len(regressions) == 1
+    assert regressions[0].startswith("FormatInvoice")
@@ -0,0 +1,78 @@
+import pytest
+from openpyxl import Workbook
+import converter
+from converter import ConverterPool
+from invoice import ExportInvoice
+
+class FakeInstance:
+    """Stands in for a soffice process; records lifecycle calls."""
+    started = 0
+
+    def __init__(self, soffice="soffice", start_timeout=30.0):
+        self.running = False
+        self.fail_next = False
+
+    def start(self):
+        FakeInstance.started += 1
+        self.running = True
+
+    def healthy(self):
+        return self.running
+
+    def stop(self):
+        self.running = False
+
+    def convert(self, src_path, pdf_path):
+        if self.fail_next:
+            self.fail_next = False
+            self.running = False
+            raise OSError("bridge disposed")
+        with open(pdf_path, "w") as f:
+            f.write("PDF-DATA")
+        return pdf_path
+
+@pytest.fixture(autouse=True)
+def fake_soffice(monkeypatch):
+    FakeInstance.started = 0
+    monkeypatch.setattr(converter, "SofficeInstance", FakeInstance)
+
+def test_pool_reuses_instances(tmp_path):
+    with ConverterPool(size=2) as pool:
+        for i in range(5):
+            pool.convert("in.xlsx", str(tmp_path / f"out{i}.pdf"))
+
+    # Only one instance was ever needed for sequential calls, and it was reused
+    assert FakeInstance.started == 1
+    assert len(list(tmp_path.glob("*.pdf"))) == 5
+
+def test_pool_restarts_crashed_instance(tmp_path):
+    with ConverterPool(size=1) as pool:
+        pool.convert("in.xlsx", str(tmp_path / "a.pdf"))
+        instance = pool._instances[0]
+
+        # A crash during conversion is retried on a restarted instance
+        instance.fail_next = True
+        pool.convert("in.xlsx", str(tmp_path / "b.pdf"))
+        assert FakeInstance.started == 2
+
+        # A dead instance is restarted by the health check before use
+        instance.running = False
+        pool.convert("in.xlsx", str(tmp_path / "c.pdf"))
+        assert FakeInstance.started == 3
+
+    assert (tmp_path / "c.pdf").exists()
+
+def test_pool_rejects_empty_size():
+    with pytest.raises(ValueError):
+        ConverterPool(size=0)
+
+def test_export_invoice_uses_converter(tmp_path):
+    wb = Workbook()
+    wb.active.title = "Invoice"
+    with ConverterPool(size=1) as pool:
+        file_path = ExportInvoice(wb, str(tmp_path / "invoice001"), format="pdf", converter=pool)
+
+    assert file_path.endswith("invoice001.pdf")
+    assert (tmp_path / "invoice001.pdf").exists()
+    # The temporary xlsx is cleaned up
+    assert not (tmp_path / "invoice001_tmp.xlsx").exists()
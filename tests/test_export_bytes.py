@@ -0,0 +1,66 @@
+import io
+import os
+import sys
+from unittest.mock import patch
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import invoice
+from invoice import ExportInvoiceToBytes
+
+
+def fake_soffice_run(calls):
+    def run(cmd, check=False):
+        calls.append(cmd)
+        out_dir = cmd[cmd.index("--outdir") + 1]
+        for src in cmd[cmd.index("--outdir") + 2:]:
+            name = os.path.splitext(os.path.basename(src))[0] + ".pdf"
+            with open(os.path.join(out_dir, name), "wb") as f:
+                f.write(b"PDF-DATA")
+    return run
+
+
+@pytest.fixture
+def dummy_wb():
+    wb = Workbook()
+    wb.active["A1"] = "Contoso Logistics"
+    return wb
+
+
+def test_xlsx_bytes_round_trip(dummy_wb, tmp_path, monkeypatch):
+    monkeypatch.setenv("INVOICE_SCRATCH_DIR", str(tmp_path))
+    data = ExportInvoiceToBytes(dummy_wb, format="xlsx")
+    assert load_workbook(io.BytesIO(data)).active["A1"].value == "Contoso Logistics"
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_pdf_bytes_use_scratch_dir_and_clean_up(dummy_wb, tmp_path, monkeypatch):
+    monkeypatch.setenv("INVOICE_SCRATCH_DIR", str(tmp_path))
+    calls = []
+    monkeypatch.setattr(invoice.subprocess, "run", fake_soffice_run(calls))
+    with patch.dict(sys.modules, {"win32com": None, "win32com.client": None}):
+        data = ExportInvoiceToBytes(dummy_wb, format="pdf")
+
+    assert data == b"PDF-DATA"
+    assert len(calls) == 1
+    # soffice was given the scratch copy and wrote its PDF beside it
+    assert os.path.dirname(calls[0][-1]) == str(tmp_path)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_converter_failure_cleans_up(dummy_wb, tmp_path, monkeypatch):
+    monkeypatch.setenv("INVOICE_SCRATCH_DIR", str(tmp_path))
+
+    class Broken:
+        def convert(self, xlsx_path, pdf_path):
+            raise OSError("office crashed")
+
+    with pytest.raises(RuntimeError, match="PDF conversion failed"):
+        ExportInvoiceToBytes(dummy_wb, format="pdf", converter=Broken())
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_invalid_format(dummy_wb):
+    with pytest.raises(ValueError, match="Unsupported format"):
+        ExportInvoiceToBytes(dummy_wb, format="docx")
@@ -49,3 +49,72 @@ def test_export_invalid_format(dummy_wb):
     with pytest.raises(ValueError) as exc:
         ExportInvoice(dummy_wb, "out", format="docx")
     assert "Unsupported format" in str(exc.value)
+
+def fake_soffice_run(calls):
+    """Returns a subprocess.run stand-in that 'converts' like soffice does."""
+    def run(cmd, check=False):
+        calls.append(cmd)
+        out_dir = cmd[cmd.index("--outdir") + 1]
+        for src in cmd[cmd.index("--outdir") + 2:]:
+            name = os.path.splitext(os.path.basename(src))[0] + ".pdf"
+            with open(os.path.join(out_dir, name), "w") as f:
+                f.write("PDF-DATA")
+    return run
+
+def test_export_pdf_libreoffice(tmp_path, dummy_wb, monkeypatch):
+    import invoice
+    out = tmp_path / "invoice003"
+    calls = []
+    monkeypatch.setattr(invoice.subprocess, "run", fake_soffice_run(calls))
+    # Make the win32com import fail so the LibreOffice branch is used
+    with patch.dict(sys.modules, {"win32com": None, "win32com.client": None}):
+        file_path = ExportInvoice(dummy_wb, str(out), format="pdf")
+
+    assert file_path == str(out) + ".pdf"
+    assert (tmp_path / "invoice003.pdf").exists()
+    assert not (tmp_path / "invoice003_tmp.xlsx").exists()
+    assert len(calls) == 1
+
+def test_export_invoices_batch(tmp_path, monkeypatch):
+    import invoice
+    from invoice import ExportInvoicesBatch
+    calls = []
+    monkeypatch.setattr(invoice.subprocess, "run", fake_soffice_run(calls))
+
+    workbooks = {}
+    for i in range(5):
+        wb = Workbook()
+        wb.active["A1"] = f"Invoice {i}"
+        workbooks[f"INV-20250608-000{i}"] = wb
+
+    results = ExportInvoicesBatch(workbooks, str(tmp_path / "out"), chunk_size=2)
+
+    # 5 invoices in chunks of 2 need 3 soffice launches
+    assert len(calls) == 3
+    assert list(results) == list(workbooks)
+    for base, path in results.items():
+        assert path == str(tmp_path / "out" / f"{base}.pdf")
+        assert os.path.exists(path)
+    # No temporary xlsx files are left next to the PDFs
+    assert sorted(os.listdir(tmp_path / "out")) == sorted(f"{b}.pdf" for b in workbooks)
+
+def test_export_invoices_batch_reports_missing(tmp_path, monkeypatch):
+    import invoice
+    from invoice import ExportInvoicesBatch
+    monkeypatch.setattr(invoice.subprocess, "run", lambda cmd, check=False: None)
+
+    wb = Workbook()
+    with pytest.raises(RuntimeError) as exc:
+        ExportInvoicesBatch({"INV-1": wb}, str(tmp_path))
+    assert "INV-1" in str(exc.value)
+
+def test_export_invoices_batch_ignores_stale_pdf(tmp_path, monkeypatch):
+    import invoice
+    from invoice import ExportInvoicesBatch
+    monkeypatch.setattr(invoice.subprocess, "run", lambda cmd, check=False: None)
+    (tmp_path / "INV-1.pdf").write_bytes(b"%PDF-1.4 from an earlier run")
+
+    with pytest.raises(RuntimeError) as exc:
+        ExportInvoicesBatch({"INV-1": Workbook()}, str(tmp_path))
+    assert "INV-1" in str(exc.value)
+    assert not (tmp_path / "INV-1.pdf").exists()
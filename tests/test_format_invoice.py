@@ -99,3 +99,42 @@ def test_get_next_invoice_number(tmp_path):
     finally:
         # Clean up and return to original directory
         os.chdir(original_dir)
+
+def test_format_invoice_clones_template(sample_order):
+    """Each invoice gets its own copy of the shared template"""
+    from invoice import GetInvoiceTemplate
+
+    template = GetInvoiceTemplate()
+    assert GetInvoiceTemplate() is template
+
+    first = FormatInvoice(sample_order)
+    other = dict(sample_order, InvoiceNumber="INV-2024-002",
+                 Items=sample_order["Items"] * 3)
+    second = FormatInvoice(other)
+
+    ws1, ws2 = first["Invoice"], second["Invoice"]
+    assert ws1["F14"].value == "INV-2024-001"
+    assert ws2["F14"].value == "INV-2024-002"
+    # Static layout is present in both, variable rows only where written
+    assert ws1["A9"].value == ws2["A9"].value == "Yukon Packing"
+    assert ws1.cell(row=24, column=1).value is None
+    assert ws2.cell(row=24, column=1).value == 2
+    # Styles survive the clone
+    assert ws2["B4"].font.bold and ws2["B4"].font.size == 20
+    assert ws2.cell(row=22, column=3).number_format == '"$"#,##0.00'
+    # The template itself is never filled in
+    assert template.wb.active["F14"].value is None
+
+def test_format_invoice_blank_bill_to_fields(sample_order):
+    # Blank BillTo cells are read as None
+    sample_order["BillTo"] = {"CustomerName": "Acme Corp", "Address": None, "City": None,
+                              "Phone": None, "Email": "acme@example.com"}
+    sample_order["ShipTo"] = sample_order["BillTo"]
+    ws = FormatInvoice(sample_order)["Invoice"]
+
+    for col in ("A", "C"):
+        assert ws[f"{col}15"].value == "Acme Corp"
+        assert ws[f"{col}16"].value is None
+        assert ws[f"{col}17"].value is None
+        assert ws[f"{col}18"].value == "Phone: "
+        assert ws[f"{col}19"].value == "Email: acme@example.com"
@@ -0,0 +1,92 @@
+import io
+import tracemalloc
+import zipfile
+from datetime import datetime
+
+from openpyxl import load_workbook
+
+import invoice
+from invoice import FormatInvoice, FormatInvoiceStreaming
+from totals import apply_totals
+
+
+def _order(items):
+    order = {
+        "CustomerName": "Freight Co",
+        "InvoiceNumber": "INV-20240320-0001",
+        "InvoiceDate": datetime(2024, 3, 20),
+        "DueDate": datetime(2024, 4, 4),
+        "PO": "PO-1",
+        "BillTo": {"CustomerName": "Freight Co", "Address": "1 Dock Rd", "City": "Halifax",
+                   "Phone": "555-0001", "Email": "f@x.com"},
+        "ShipTo": {"CustomerName": "Freight Co", "Address": "1 Dock Rd", "City": "Halifax",
+                   "Phone": "555-0001", "Email": "f@x.com"},
+        "CompanyContact": "555-0100",
+        "Items": [{"Qty": i % 7 + 1, "Description": f"Pallet {i}", "UnitPrice": 12.5} for i in range(items)],
+    }
+    apply_totals([order])
+    return order
+
+
+def _saved(wb):
+    buf = io.BytesIO()
+    wb.save(buf)
+    return load_workbook(buf).active
+
+
+def _cells(ws):
+    return {(c.row, c.column): (c.value, c.number_format, c.font.b, c.alignment.horizontal, c.border.left.style)
+            for row in ws.iter_rows() for c in row if c.value is not None or c.has_style}
+
+
+def test_streaming_matches_format_invoice():
+    order = _order(40)
+    expected, streamed = _saved(FormatInvoice(order)), _saved(FormatInvoiceStreaming(order))
+
+    assert _cells(streamed) == _cells(expected)
+    assert streamed.merged_cells.ranges == expected.merged_cells.ranges
+    assert [(t.displayName, t.ref) for t in streamed.tables.values()] == \
+        [(t.displayName, t.ref) for t in expected.tables.values()]
+    assert len(streamed._images) == len(expected._images) == 1
+    assert streamed.page_setup.orientation == expected.page_setup.orientation
+    assert streamed.sheet_properties.pageSetUpPr.fitToPage
+    assert {col: streamed.column_dimensions[col].width for col in "ABCDEF"} == \
+        {col: expected.column_dimensions[col].width for col in "ABCDEF"}
+
+
+def test_streaming_table_xml_matches_format_invoice():
+    order = _order(40)
+    parts = []
+    for fmt in (FormatInvoice, FormatInvoiceStreaming):
+        buf = io.BytesIO()
+        fmt(order, logo_path=None).save(buf)
+        with zipfile.ZipFile(buf) as z:
+            parts.append({name: z.read(name) for name in z.namelist() if name.startswith("xl/tables/")})
+
+    assert parts[0] == parts[1]
+    assert b"<autoFilter " in parts[1]["xl/tables/table1.xml"]
+
+
+def test_streaming_memory_does_not_grow_with_items():
+    def peak(items):
+        order = _order(items)
+        tracemalloc.start()
+        FormatInvoiceStreaming(order, logo_path=None).save(io.BytesIO())
+        result = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        return result
+
+    assert peak(2000) < 2 * peak(200)
+
+
+def test_long_invoices_are_streamed_for_export(tmp_path, monkeypatch):
+    monkeypatch.setattr(invoice, "STREAMING_ITEMS", 10)
+    used = []
+    monkeypatch.setattr(invoice, "FormatInvoiceStreaming",
+                        lambda order: used.append(len(order["Items"])) or FormatInvoiceStreaming(order))
+
+    invoice.RenderInvoice(_order(5), str(tmp_path / "short"), format="xlsx")
+    invoice.RenderInvoice(_order(10), str(tmp_path / "long"), format="xlsx")
+
+    assert used == [10]
+    assert load_workbook(tmp_path / "long.xlsx").active["D31"].value == 12.5 * 3
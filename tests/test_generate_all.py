@@ -42,7 +42,7 @@ def test_generate_all_invokes_subroutines(tmp_path, monkeypatch):
             "ItemName": "Test Item 3"
         }
     ]
-    monkeypatch.setattr(invoice, "LoadOrders", lambda path: orders_stub)
+    monkeypatch.setattr(invoice.WorkbookSource, "orders", lambda self: iter(orders_stub))
 
     # Counters for subroutine calls
     counts = {"fmt": 0, "exp": 0, "send": 0}
@@ -71,3 +71,42 @@ def test_generate_all_invokes_subroutines(tmp_path, monkeypatch):
     assert counts["fmt"] == 3
     assert counts["exp"] == 3
     assert counts["send"] == 3
+
+def test_generate_all_parallel_captures_failures(monkeypatch, orders_source, order_line, renderer, sender):
+    from concurrent.futures import ThreadPoolExecutor
+
+    orders_source([order_line(1000 + i, Email=f"c{i}@x.com") for i in range(6)])
+    monkeypatch.setattr(invoice, "TransformOrders", lambda groups, bill_to: [
+        {"InvoiceNumber": f"INV-{lines[0]['OrderID']}"} for lines in groups])
+    # Threads stand in for processes so the stubs are visible to workers
+    monkeypatch.setattr(invoice, "ProcessPoolExecutor", ThreadPoolExecutor)
+    renderer.failing.add("invoice_1003")
+
+    failures = invoice.GenerateAllInvoices("orders.xlsx", workers=2, sender=sender)
+
+    # The failing order is reported and the rest are still sent
+    assert list(failures) == ["invoice_1003"]
+    assert "render boom" in str(failures["invoice_1003"])
+    assert sorted(path for _, path in sender.sent) == [
+        f"invoice_{1000 + i}.pdf" for i in range(6) if i != 3
+    ]
+
+def test_generate_all_process_pool_keeps_rows_of_one_order_apart(tmp_path, monkeypatch, orders_source,
+                                                                  order_line, sender):
+    # A real process pool: transformed orders are pickled and rendered by
+    # module-level functions in the workers
+    from journal import SENT, RunJournal
+    from order_index import RowKeys
+    monkeypatch.chdir(tmp_path)
+    rows = [order_line("O1", ItemID=f"ITEM00{n}", Qty=n) for n in (1, 2)]
+    orders_source(rows)
+
+    with RunJournal(str(tmp_path / "run.journal")) as journal:
+        failures = invoice.GenerateAllInvoices("orders.xlsx", workers=2, engine="native",
+                                               sender=sender, journal=journal)
+        assert failures == {}
+        assert journal.counts() == {SENT: 2}
+        numbers = [journal.get(f"row:{RowKeys()(row)[1]}")["invoice_number"] for row in rows]
+
+    assert sorted(path for _, path in sender.sent) == ["invoice_O1.pdf", f"invoice_O1_{numbers[1]}.pdf"]
+    assert all((tmp_path / path).read_bytes().startswith(b"%PDF") for _, path in sender.sent)
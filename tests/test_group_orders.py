@@ -0,0 +1,58 @@
+import pytest
+import invoice
+from invoice import GroupOrders, TransformOrderGroup
+
+@pytest.fixture
+def order_lines():
+    def line(order_id, customer, item, qty, price):
+        return {"OrderID": order_id, "CustomerID": customer, "CustomerName": f"Name {customer}",
+                "Email": f"{customer.lower()}@example.com", "ItemID": item,
+                "ItemName": f"Item {item}", "Qty": qty, "Price": price}
+    return [
+        line("1001", "CUST001", "A", 1, 10.0),
+        line("1002", "CUST002", "B", 2, 20.0),
+        line("1001", "CUST001", "C", 3, 30.0),
+        line("1003", "CUST001", "D", 4, 40.0),
+        line(None, "CUST002", "E", 5, 50.0),
+        line(None, "CUST002", "F", 6, 60.0),
+    ]
+
+def test_group_orders_by_order_id(order_lines):
+    groups = GroupOrders(order_lines, by="OrderID")
+
+    # First-seen order is kept; rows without an OrderID stay on their own
+    assert [[l["ItemID"] for l in g] for g in groups] == [["A", "C"], ["B"], ["D"], ["E"], ["F"]]
+
+def test_group_orders_by_customer(order_lines):
+    groups = GroupOrders(iter(order_lines), by="CustomerID")
+    assert [[l["ItemID"] for l in g] for g in groups] == [["A", "C", "D"], ["B", "E", "F"]]
+
+def test_transform_order_group(tmp_path, monkeypatch, order_lines):
+    monkeypatch.chdir(tmp_path)
+    bill_to = {"CUST001": {"CustomerName": "Acme", "Email": "billing@acme.com"}}
+
+    result = TransformOrderGroup([order_lines[0], order_lines[2]], bill_to)
+
+    assert result["Email"] == "billing@acme.com"
+    assert result["Items"] == [
+        {"Qty": 1, "Description": "Item A", "UnitPrice": 10.0, "Amount": 10.0},
+        {"Qty": 3, "Description": "Item C", "UnitPrice": 30.0, "Amount": 90.0},
+    ]
+    assert (result["Subtotal"], result["GST"], result["Total"]) == (100.0, 5.0, 105.0)
+    assert result["InvoiceNumber"].endswith("-0001")
+    assert (result["DueDate"] - result["InvoiceDate"]).days in (14, 15)
+
+def test_transform_order_group_rejects_mixed_customers(tmp_path, monkeypatch, order_lines):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(ValueError):
+        TransformOrderGroup([order_lines[0], order_lines[1]], {})
+
+def test_generate_all_groups_lines(monkeypatch, order_lines, orders_source, renderer):
+    orders_source(order_lines)
+    monkeypatch.setattr(invoice, "SendInvoice", lambda email, path: None)
+
+    invoice.GenerateAllInvoices("orders.xlsx", group_by="CustomerID")
+
+    # Two customers -> two invoices; lines span several orders so the invoice number names them
+    assert [len(order["Items"]) for _, order in renderer.rendered] == [3, 3]
+    assert all(base.startswith("invoice_INV-") for base in renderer.bases)
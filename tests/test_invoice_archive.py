@@ -0,0 +1,141 @@
+import io
+import zipfile
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+from openpyxl import load_workbook
+
+import invoice
+from invoice import FormatInvoice
+from invoice_archive import ArchiveInvoices, InvoiceArchive
+from totals import apply_totals
+
+
+def _order(n, items=2):
+    order = {
+        "CustomerName": f"Customer {n}",
+        "InvoiceNumber": f"INV-20240320-{n:04d}",
+        "InvoiceDate": datetime(2024, 3, 20),
+        "DueDate": datetime(2024, 4, 4),
+        "PO": f"PO-{n}",
+        "BillTo": {"CustomerName": f"Customer {n}", "Address": "1 Main St", "City": "Toronto",
+                   "Phone": "555-0001", "Email": "c@x.com"},
+        "ShipTo": {"CustomerName": f"Customer {n}", "Address": "1 Main St", "City": "Toronto",
+                   "Phone": "555-0001", "Email": "c@x.com"},
+        "CompanyContact": "555-0100",
+        "Items": [{"Qty": i + 1, "Description": f"Item {i}", "UnitPrice": 9.99} for i in range(items)],
+        "Terms": "Payment is due within 15 days.",
+    }
+    apply_totals([order])
+    return order
+
+
+def test_sheets_match_format_invoice(tmp_path):
+    order = _order(1, items=3)
+    locations = ArchiveInvoices([order], str(tmp_path), logo_path=None)
+    path, title = locations[order["InvoiceNumber"]]
+
+    buf = io.BytesIO()
+    FormatInvoice(order, logo_path=None).save(buf)
+    expected = load_workbook(buf).active
+    archived = load_workbook(path)[title]
+
+    def cells(ws):
+        return {(c.row, c.column): (c.value, c.number_format, c.font.b, c.border.left.style)
+                for row in ws.iter_rows() for c in row if c.value is not None}
+    assert cells(archived) == cells(expected)
+    assert archived.merged_cells.ranges == expected.merged_cells.ranges
+    assert archived.column_dimensions["B"].width == expected.column_dimensions["B"].width
+    assert [t.ref for t in archived.tables.values()] == [t.ref for t in expected.tables.values()]
+
+
+def test_index_sheet_lists_every_invoice(tmp_path):
+    orders = [_order(n) for n in range(1, 4)]
+    ArchiveInvoices(orders, str(tmp_path))
+
+    wb = load_workbook(tmp_path / "invoices-00001.xlsx")
+    assert wb.sheetnames == ["Index"] + [o["InvoiceNumber"] for o in orders]
+    rows = list(wb["Index"].iter_rows(values_only=True))
+    assert rows[0][0] == "Invoice #"
+    assert rows[1][0] == '=HYPERLINK("#\'INV-20240320-0001\'!A1","INV-20240320-0001")'
+    assert rows[3][-1] == orders[2]["Total"]
+
+
+def test_shards_are_capped(tmp_path):
+    orders = [_order(n) for n in range(5)]
+    locations = ArchiveInvoices(orders, str(tmp_path), max_invoices=2)
+
+    assert sorted(p.name for p in tmp_path.iterdir()) == \
+        ["invoices-00001.xlsx", "invoices-00002.xlsx", "invoices-00003.xlsx"]
+    assert [Path(path).name for path, _ in locations.values()] == \
+        ["invoices-00001.xlsx"] * 2 + ["invoices-00002.xlsx"] * 2 + ["invoices-00003.xlsx"]
+
+    # A later archive continues the numbering instead of overwriting
+    ArchiveInvoices(orders[:1], str(tmp_path))
+    assert (tmp_path / "invoices-00004.xlsx").exists()
+
+
+def test_byte_cap_starts_new_shard(tmp_path):
+    with InvoiceArchive(str(tmp_path), max_bytes=1) as archive:
+        archive.add(_order(1))
+        archive.add(_order(2))
+    assert len(archive.paths) == 2
+
+
+def test_sheet_titles_are_valid_and_unique(tmp_path):
+    first, second = _order(1), _order(2)
+    first["InvoiceNumber"] = second["InvoiceNumber"] = "INV/2024:01"
+    with InvoiceArchive(str(tmp_path)) as archive:
+        titles = [archive.add(first)[1], archive.add(second)[1]]
+    assert titles == ["INV_2024_01", "INV_2024_01 (2)"]
+
+
+def test_failed_archive_leaves_no_partial_shard(tmp_path):
+    with pytest.raises(KeyError):
+        with InvoiceArchive(str(tmp_path)) as archive:
+            archive.add(_order(1))
+            archive.add({"InvoiceNumber": "broken"})
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_generate_all_archives_each_invoice(tmp_path, orders_source, order_line, renderer, sender):
+    orders_source([order_line(n) for n in range(3)])
+
+    with InvoiceArchive(str(tmp_path / "archive")) as archive:
+        invoice.GenerateAllInvoices("orders.xlsx", sender=sender, archive=archive)
+    with zipfile.ZipFile(archive.paths[0]) as z:
+        sheets = [n for n in z.namelist() if n.startswith("xl/worksheets/sheet")]
+    assert len(sheets) == 4  # index + 3 invoices
+
+
+def test_generate_all_archives_only_sent_invoices(tmp_path, monkeypatch, orders_source, order_line, renderer,
+                                                  sender):
+    from concurrent.futures import ThreadPoolExecutor
+    from journal import RunJournal
+    # Threads stand in for processes so the stub renderer is visible to workers
+    monkeypatch.setattr(invoice, "ProcessPoolExecutor", ThreadPoolExecutor)
+    orders_source([order_line(n, Email=f"c{n}@x.com") for n in range(4)])
+    renderer.failing.add("invoice_1")
+    sender.failing.add("c2@x.com")
+
+    def archived():
+        sheets = []
+        for path in sorted((tmp_path / "archive").glob("*.xlsx")):
+            sheets += load_workbook(path).sheetnames[1:]
+        return sheets
+
+    with RunJournal(str(tmp_path / "run.journal")) as journal:
+        with InvoiceArchive(str(tmp_path / "archive")) as archive:
+            failures = invoice.GenerateAllInvoices("orders.xlsx", sender=sender, archive=archive,
+                                                   journal=journal, workers=2)
+        assert sorted(failures) == ["invoice_1", "invoice_2"]
+        first_run = archived()
+        assert len(first_run) == 2
+
+        # The rerun picks up the failed invoices only; nothing is archived twice
+        renderer.failing.clear()
+        sender.failing.clear()
+        with InvoiceArchive(str(tmp_path / "archive")) as archive:
+            invoice.GenerateAllInvoices("orders.xlsx", sender=sender, archive=archive, journal=journal)
+    assert len(archived()) == 4 == len(set(archived()))
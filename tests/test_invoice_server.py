@@ -0,0 +1,142 @@
+import http.client
+import io
+import json
+import threading
+
+import pytest
+from openpyxl import load_workbook
+
+import metrics
+from invoice_server import InvoiceServer
+
+BILL_TO = {"CUST001": {"CustomerID": "CUST001", "CustomerName": "Acme Corp", "Email": "billing@acme.com",
+                       "Phone": "555-0001", "Address": "1 Main St", "City": "Toronto"}}
+
+
+def _line(**overrides):
+    line = {"OrderID": "1", "Email": "orders@acme.com", "CustomerID": "CUST001", "CustomerName": "Acme",
+            "ItemID": "ITEM001", "ItemName": "Widget", "Qty": 2, "Price": 9.99}
+    return {**line, **overrides}
+
+
+@pytest.fixture
+def start(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)  # invoice/PO counter files
+    servers = []
+
+    def start(**kwargs):
+        server = InvoiceServer(("127.0.0.1", 0), BILL_TO, **kwargs)
+        threading.Thread(target=server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append(server)
+        return server
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+    metrics.disable()
+
+
+def _request(server, method, path, body=None):
+    conn = http.client.HTTPConnection(*server.server_address[:2], timeout=10)
+    try:
+        if body is not None and not isinstance(body, bytes):
+            body = json.dumps(body).encode()
+        conn.request(method, path, body=body)
+        response = conn.getresponse()
+        return response.status, dict(response.getheaders()), response.read()
+    finally:
+        conn.close()
+
+
+def test_renders_xlsx(start):
+    server = start()
+    status, headers, body = _request(server, "POST", "/invoices?format=xlsx", _line())
+
+    assert status == 200
+    assert headers["Content-Type"].startswith("application/vnd.openxmlformats")
+    number = headers["X-Invoice-Number"]
+    assert number.startswith("INV-")
+    assert headers["Content-Disposition"] == f'attachment; filename="invoice_{number}.xlsx"'
+    ws = load_workbook(io.BytesIO(body)).active
+    values = {c.value for row in ws.iter_rows() for c in row}
+    assert "Acme Corp" in values and "Widget" in values
+
+
+def test_lines_are_invoiced_together_natively(start):
+    server = start(engine="native")
+    status, headers, body = _request(server, "POST", "/invoices", [_line(), _line(ItemName="Gadget")])
+    assert status == 200
+    assert headers["Content-Type"] == "application/pdf"
+    assert body.startswith(b"%PDF")
+
+
+@pytest.mark.parametrize("path, body, expected", [
+    ("/invoices", b"{not json", 400),
+    ("/invoices", {"CustomerID": "CUST001"}, 400),
+    ("/invoices", [], 400),
+    ("/invoices", _line(Price="abc"), 400),
+    ("/invoices", _line(Price=None), 400),
+    ("/invoices", _line(Qty=1.5), 400),
+    ("/invoices", [_line(), _line(CustomerID="CUST002")], 400),
+    ("/invoices?format=docx", _line(), 400),
+    ("/invoices?format=xlsx&engine=native", _line(), 400),
+    ("/orders", _line(), 404),
+])
+def test_bad_requests(start, path, body, expected):
+    server = start()
+    status, headers, body = _request(server, "POST", path, body)
+    assert status == expected
+    assert "error" in json.loads(body)
+    # Rejected orders do not use up an invoice number
+    _, headers, _ = _request(server, "POST", "/invoices?format=xlsx", _line())
+    assert headers["X-Invoice-Number"].endswith("-0001")
+
+
+def test_busy_server_rejects_before_numbering(start):
+    server = start(max_concurrent=1, queue_timeout=0.05)
+    entered, release = threading.Event(), threading.Event()
+    render = server.render
+
+    def slow_render(*args):
+        entered.set()
+        release.wait(10)
+        return render(*args)
+    server.render = slow_render
+
+    first = []
+    thread = threading.Thread(target=lambda: first.append(_request(server, "POST", "/invoices?format=xlsx", _line())))
+    thread.start()
+    assert entered.wait(10)
+    status, headers, _ = _request(server, "POST", "/invoices?format=xlsx", _line())
+    release.set()
+    thread.join(10)
+
+    assert status == 503 and headers["Retry-After"] == "1"
+    assert first[0][0] == 200
+    # The rejected request did not take a number
+    status, headers, _ = _request(server, "POST", "/invoices?format=xlsx", _line())
+    assert headers["X-Invoice-Number"][-4:] == "0002"
+
+
+def test_metrics_and_health(start):
+    server = start()
+    assert _request(server, "GET", "/healthz")[0] == 200
+    _request(server, "POST", "/invoices?format=xlsx", _line())
+    _request(server, "POST", "/invoices?format=docx", _line())
+
+    status, _, body = _request(server, "GET", "/metrics")
+    text = body.decode()
+    assert status == 200
+    assert 'invoice_stage_seconds_count{stage="http_request"} 2' in text
+    assert 'invoice_http_requests_total{status="200"} 1' in text
+    assert 'invoice_http_requests_total{status="400"} 1' in text
+
+
+def test_worker_processes(start):
+    server = start(workers=1)
+    status, headers, body = _request(server, "POST", "/invoices?format=xlsx", _line())
+    assert status == 200
+    assert load_workbook(io.BytesIO(body)).active is not None
+    # Stages recorded in the worker are merged into the server's metrics
+    text = _request(server, "GET", "/metrics")[2].decode()
+    assert 'invoice_stage_seconds_count{stage="export"} 1' in text
@@ -0,0 +1,49 @@
+from datetime import datetime
+
+from openpyxl import Workbook
+
+import invoice_styles
+from invoice import FormatInvoice, GetInvoiceTemplate
+from totals import apply_totals
+
+
+def _order():
+    order = {
+        "InvoiceNumber": "INV-20240320-0001",
+        "InvoiceDate": datetime(2024, 3, 20),
+        "DueDate": datetime(2024, 4, 4),
+        "BillTo": {"CustomerName": "Acme Corp"},
+        "ShipTo": {"CustomerName": "Acme Corp"},
+        "Items": [{"Qty": 2, "Description": "Widget", "UnitPrice": 9.99}],
+    }
+    apply_totals([order])
+    return order
+
+
+def test_register_resolves_each_style():
+    wb = Workbook()
+    refs = invoice_styles.register(wb)
+    ws = wb.active
+
+    cell = ws["A1"]
+    cell._style = refs["money"]
+    assert cell.number_format == invoice_styles.CURRENCY_FORMAT
+    assert cell.border.left.style == "thin"
+    assert cell.alignment.horizontal == "right"
+
+    cell._style = refs["title"]
+    assert cell.font.b and cell.font.sz == 20
+
+    # Registering again reuses the existing table entries
+    assert invoice_styles.register(wb) == refs
+
+
+def test_invoice_cells_only_use_registered_styles():
+    styles = GetInvoiceTemplate().styles
+    ws = FormatInvoice(_order(), logo_path=None).active
+    registered = {tuple(style) for style in styles.values()}
+
+    used = {tuple(cell._style) for row in ws.iter_rows() for cell in row if cell.has_style}
+    assert used <= registered
+    assert tuple(ws["D22"]._style) == tuple(styles["money"])
+    assert tuple(ws["A21"]._style) == tuple(styles["table_header"])
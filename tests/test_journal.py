@@ -0,0 +1,131 @@
+import pytest
+
+import invoice
+from journal import EXPORTED, SENT, TRANSFORMED, RunJournal
+from order_index import RowKeys
+
+
+def _key(order):
+    # Journal key of a row that is the only one with its contents
+    return f"row:{RowKeys()(order)[1]}"
+
+
+@pytest.fixture
+def lines(orders_source, order_line, renderer):
+    """
+    Serves five one-line orders, 1000-1004 for c0@x.com-c4@x.com, as the
+    orders sheet, with rendering stubbed.
+    """
+    lines = [order_line(1000 + i, Email=f"c{i}@x.com", CustomerID=f"CUST{i:03d}") for i in range(5)]
+    orders_source(lines)
+    return lines
+
+
+def test_journal_round_trips_transformed_order(tmp_path, monkeypatch, order_line):
+    monkeypatch.chdir(tmp_path)
+    order = invoice.TransformOrder(order_line(1000), {})
+    with RunJournal(str(tmp_path / "run.journal")) as journal:
+        journal.record_transformed("row:1", order, "c@x.com")
+        entry = journal.get("row:1")
+
+    assert entry["status"] == TRANSFORMED
+    assert entry["invoice_number"] == order["InvoiceNumber"]
+    assert entry["order"] == order  # datetimes included
+
+
+def test_rerun_resumes_after_crash(tmp_path, lines, renderer, sender):
+    journal_path = str(tmp_path / "run.journal")
+    sender.failing.add("c3@x.com")
+
+    with RunJournal(journal_path) as journal:
+        with pytest.raises(RuntimeError):
+            invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+        assert journal.counts() == {SENT: 3, EXPORTED: 1}
+        numbers = journal.get(_key(lines[3]))["invoice_number"]
+
+    renderer.bases.clear()
+    sender.failing.clear()
+
+    with RunJournal(journal_path) as journal:
+        assert invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal) == {}
+        assert journal.counts() == {SENT: 5}
+        # The exported invoice was sent as-is and kept its number
+        assert journal.get(_key(lines[3]))["invoice_number"] == numbers
+
+    assert renderer.bases == ["invoice_1004"]
+    assert len(sender.sent) == 5
+    assert len(set(sender.sent)) == 5
+
+
+def test_rerun_of_finished_run_does_nothing(tmp_path, lines, renderer, sender):
+    journal_path = str(tmp_path / "run.journal")
+    for _ in range(2):
+        with RunJournal(journal_path) as journal:
+            invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+
+    assert len(renderer.bases) == 5
+    assert len(sender.sent) == 5
+
+
+def test_edited_rows_are_not_matched_to_old_entries(tmp_path, lines, orders_source, renderer, sender):
+    journal_path = str(tmp_path / "run.journal")
+    with RunJournal(journal_path) as journal:
+        invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+
+    # Row 3 now holds a different customer's order
+    edited = list(lines)
+    edited[2] = {**lines[2], "OrderID": "2002", "Email": "new@x.com", "CustomerID": "CUST099"}
+    orders_source(edited)
+    renderer.rendered.clear()
+    sender.sent.clear()
+    with RunJournal(journal_path) as journal:
+        invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+
+    assert sender.sent == [("new@x.com", "invoice_2002.pdf")]
+    assert [order["CustomerID"] for _, order in renderer.rendered] == ["CUST099"]
+
+
+def test_inserted_and_reordered_rows_are_not_sent_again(tmp_path, lines, orders_source, sender):
+    journal_path = str(tmp_path / "run.journal")
+    with RunJournal(journal_path) as journal:
+        invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+
+    # A new row is inserted at the top and the rest are sorted the other way
+    new = {**lines[0], "OrderID": "2000", "Email": "new@x.com"}
+    orders_source([new] + lines[::-1])
+    sender.sent.clear()
+    with RunJournal(journal_path) as journal:
+        invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+
+    assert sender.sent == [("new@x.com", "invoice_2000.pdf")]
+
+
+def test_exported_invoice_is_not_sent_to_a_different_row(tmp_path, lines, orders_source, sender):
+    journal_path = str(tmp_path / "run.journal")
+    sender.failing.add("c0@x.com")
+
+    orders_source(lines[:1])
+    with RunJournal(journal_path) as journal:
+        with pytest.raises(RuntimeError):
+            invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+        old = journal.get(_key(lines[0]))
+    assert old["status"] == EXPORTED
+
+    replaced = {**lines[0], "OrderID": "2000", "Email": "other@x.com", "CustomerID": "CUST099"}
+    orders_source([replaced])
+    with RunJournal(journal_path) as journal:
+        invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+        assert journal.get(_key(replaced))["invoice_number"] != old["invoice_number"]
+
+    assert sender.sent == [("other@x.com", "invoice_2000.pdf")]
+
+
+def test_render_failures_are_journaled(tmp_path, lines, renderer, sender):
+    renderer.failing.add("invoice_1002")
+    with RunJournal(str(tmp_path / "run.journal")) as journal:
+        with pytest.raises(RuntimeError):
+            invoice.GenerateAllInvoices("orders.xlsx", sender=sender, journal=journal)
+        entry = journal.get(_key(lines[2]))
+
+    assert entry["status"] == TRANSFORMED
+    assert entry["error"] == "RuntimeError: render boom"
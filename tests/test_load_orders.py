@@ -1,7 +1,8 @@
 import shutil
 from pathlib import Path
 import pytest
-from invoice import LoadOrders
+import types
+from invoice import LoadOrders, IterOrders
 
 def test_load_orders(tmp_path):
     """
@@ -23,3 +24,46 @@ def test_load_orders(tmp_path):
     assert first["ItemID"] == "ABC123"
     assert first["Qty"] == 2
     assert first["Price"] == 9.99
+
+def test_iter_orders_streams_rows(tmp_path):
+    """
+    Test that IterOrders yields the same typed rows lazily.
+    """
+    sample_src = Path("tests/data/orders_sample_with_id.xlsx")
+    sample = tmp_path / "orders_sample_with_id.xlsx"
+    shutil.copy(sample_src, sample)
+
+    rows = IterOrders(str(sample))
+
+    # Assert it is a lazy generator, not a materialised list
+    assert isinstance(rows, types.GeneratorType)
+
+    first = next(rows)
+    assert first["ItemID"] == "ABC123"
+    assert first["Qty"] == 2
+    assert isinstance(first["Qty"], int)
+    assert first["Price"] == 9.99
+
+    # Remaining rows are yielded on demand
+    assert len(list(rows)) == 9
+
+def _orders_workbook(path, quantities):
+    from openpyxl import Workbook
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "Orders"
+    ws.append(["CustomerID", "ItemID", "Qty", "Price", "CustomerName", "Email"])
+    for qty in quantities:
+        ws.append(["CUST001", "ITEM001", qty, 9.99, "Acme Corp", "acme@example.com"])
+    wb.save(path)
+    return str(path)
+
+def test_load_orders_keeps_whole_quantities(tmp_path):
+    table = LoadOrders(_orders_workbook(tmp_path / "orders.xlsx", [3.0, 4]))
+    assert [row["Qty"] for row in table] == [3, 4]
+    assert all(isinstance(row["Qty"], int) for row in table)
+
+def test_load_orders_rejects_fractional_quantity(tmp_path):
+    # 2.5 must not be truncated to 2
+    with pytest.raises(ValueError, match="Invalid quantity: 2.5"):
+        LoadOrders(_orders_workbook(tmp_path / "orders.xlsx", [1, 2.5]))
@@ -0,0 +1,54 @@
+import os
+import pytest
+from PIL import Image as PILImage
+import logo_cache
+from logo_cache import get_logo
+from invoice import FormatInvoice
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    logo_cache.clear_cache()
+    yield
+    logo_cache.clear_cache()
+
+@pytest.fixture
+def logo_file(tmp_path):
+    path = tmp_path / "logo.png"
+    PILImage.new("RGBA", (600, 400), (255, 0, 0, 128)).save(path)
+    return str(path)
+
+@pytest.fixture
+def sample_order():
+    return {
+        "InvoiceNumber": "INV-2024-001",
+        "InvoiceDate": "2024-03-20",
+        "DueDate": "2024-04-04",
+        "Items": [{"Qty": 1, "Description": "Test Item", "UnitPrice": 5.0}],
+    }
+
+def test_logo_is_decoded_once(logo_file):
+    first = get_logo(logo_file)
+    assert first is not None
+    assert get_logo(logo_file) is first
+    # Large logos are scaled down once for embedding
+    assert max(first.size) == logo_cache.MAX_PIXELS
+    assert first.png.startswith(b"\x89PNG")
+
+def test_logo_reloads_when_file_changes(logo_file):
+    first = get_logo(logo_file)
+    PILImage.new("RGBA", (50, 50)).save(logo_file)
+    os.utime(logo_file, (first.mtime + 10, first.mtime + 10))
+
+    second = get_logo(logo_file)
+    assert second is not first
+    assert second.size == (50, 50)
+
+def test_missing_logo(tmp_path):
+    assert get_logo(str(tmp_path / "nope.png")) is None
+
+def test_format_invoice_logo_path(logo_file, sample_order):
+    ws = FormatInvoice(sample_order, logo_path=logo_file)["Invoice"]
+    assert len(ws._images) == 1
+    assert ws._images[0]._data() == get_logo(logo_file).png
+
+    assert FormatInvoice(sample_order, logo_path=None)["Invoice"]._images == []
@@ -0,0 +1,111 @@
+import os
+
+import pytest
+from openpyxl import Workbook, load_workbook
+
+import invoice
+import metrics
+from invoice import LoadBillToData, LoadItemData, WorkbookSource
+from master_index import MasterDataIndex
+from records import Customer
+
+
+def _write_workbook(path, customers, orders=1):
+    wb = Workbook()
+    sheet = wb.active
+    sheet.title = "Orders"
+    sheet.append(["CustomerID", "ItemID", "Qty", "Price", "CustomerName", "Email"])
+    for n in range(orders):
+        sheet.append(["CUST001", "ITEM001", n + 1, 9.99, "Acme Corp", "acme@example.com"])
+    bill_to = wb.create_sheet("BillTo")
+    bill_to.append(["CustomerID", "CustomerName", "Email", "Phone", "Address", "City"])
+    for customer_id, name in customers:
+        bill_to.append([customer_id, name, f"{customer_id.lower()}@example.com", "555-0001", "1 Main St", "Toronto"])
+    items = wb.create_sheet("Items")
+    items.append(["ItemID", "Name", "Description", "UnitPrice"])
+    items.append(["ITEM001", "Mouse", "Wireless Mouse", 9.99])
+    wb.save(path)
+
+
+@pytest.fixture
+def results():
+    """
+    Enables metrics and returns a function giving the index's results so far.
+    """
+    metrics.enable()
+    yield lambda: {c["labels"]["result"]: c["value"] for c in metrics.snapshot()["counters"]
+                   if c["name"] == "invoice_master_index_total" and c["labels"]["sheet"] == "BillTo"}
+    metrics.disable()
+
+
+@pytest.fixture
+def master(tmp_path):
+    with MasterDataIndex(str(tmp_path / "master.index")) as master:
+        yield master
+
+
+def test_lookups_match_the_sheet(tmp_path, master):
+    path = str(tmp_path / "orders.xlsx")
+    _write_workbook(path, [("CUST001", "Acme Corp"), ("CUST002", "Beta LLC")])
+
+    bill_to = LoadBillToData(path, master)
+    assert bill_to == LoadBillToData(path)
+    assert list(bill_to) == ["CUST001", "CUST002"]
+    assert isinstance(bill_to["CUST002"], Customer)
+    assert bill_to.get("CUST999", {}) == {}
+    assert LoadItemData(path, master)["ITEM001"]["Description"] == "Wireless Mouse"
+
+
+def test_unchanged_workbook_is_not_parsed_again(tmp_path, master, results, monkeypatch):
+    path = str(tmp_path / "orders.xlsx")
+    _write_workbook(path, [("CUST001", "Acme Corp")])
+    LoadBillToData(path, master)
+
+    def fail(*args, **kwargs):
+        raise AssertionError("BillTo sheet parsed again")
+    monkeypatch.setattr(invoice, "_index_rows", fail)
+    assert LoadBillToData(path, master)["CUST001"]["CustomerName"] == "Acme Corp"
+    assert results() == {"rebuilt": 1, "fresh": 1}
+
+
+def test_only_a_changed_sheet_is_rebuilt(tmp_path, master, results):
+    path = str(tmp_path / "orders.xlsx")
+    _write_workbook(path, [("CUST001", "Acme Corp")])
+    with WorkbookSource(path, master) as source:
+        source.bill_to()
+
+    # More orders, same customers: the file changes but BillTo does not
+    _write_workbook(path, [("CUST001", "Acme Corp")], orders=5)
+    with WorkbookSource(path, master) as source:
+        assert source.bill_to()["CUST001"]["CustomerName"] == "Acme Corp"
+    assert results() == {"rebuilt": 1, "revalidated": 1}
+
+    _write_workbook(path, [("CUST001", "Acme Corporation"), ("CUST003", "Gamma")], orders=5)
+    with WorkbookSource(path, master) as source:
+        bill_to = source.bill_to()
+        assert bill_to["CUST001"]["CustomerName"] == "Acme Corporation"
+        assert len(bill_to) == 2
+    assert results() == {"rebuilt": 2, "revalidated": 1}
+
+
+def test_edit_in_place_is_detected(tmp_path, master):
+    path = str(tmp_path / "orders.xlsx")
+    _write_workbook(path, [("CUST001", "Acme Corp")])
+    LoadBillToData(path, master)
+
+    wb = load_workbook(path)
+    wb["BillTo"]["B2"] = "Renamed"
+    stat = os.stat(path)
+    wb.save(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1))
+
+    assert LoadBillToData(path, master)["CUST001"]["CustomerName"] == "Renamed"
+
+
+def test_missing_sheet_gives_empty_mapping(tmp_path, master):
+    path = str(tmp_path / "orders.xlsx")
+    wb = Workbook()
+    wb.active.title = "Orders"
+    wb.save(path)
+
+    assert dict(LoadItemData(path, master)) == {}
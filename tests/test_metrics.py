@@ -0,0 +1,106 @@
+import json
+
+import pytest
+
+import invoice
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def reset_metrics():
+    metrics.disable()
+    yield
+    metrics.disable()
+
+
+class MemorySink:
+    def __init__(self):
+        self.writes = []
+
+    def write(self, data):
+        self.writes.append(data)
+
+
+def _histogram(data, stage):
+    return next(h for h in data["histograms"]
+                if h["name"] == metrics.STAGE_SECONDS and h["labels"] == {"stage": stage})
+
+
+def test_nothing_is_recorded_while_disabled():
+    calls = []
+    wrapped = metrics.timed("work")(lambda x: calls.append(x) or x)
+
+    assert wrapped(3) == 3
+    with metrics.timer("block"):
+        pass
+    metrics.increment("things_total")
+
+    assert calls == [3]
+    assert metrics.snapshot() == {"counters": [], "histograms": []}
+
+
+def test_timings_and_failures_by_stage():
+    metrics.enable()
+
+    @metrics.timed("work")
+    def work(fail=False):
+        if fail:
+            raise ValueError("boom")
+
+    work()
+    with pytest.raises(ValueError):
+        work(fail=True)
+
+    data = metrics.snapshot()
+    assert _histogram(data, "work")["count"] == 2
+    assert {"name": metrics.STAGE_FAILURES, "labels": {"stage": "work"}, "value": 1} in data["counters"]
+
+
+def test_merge_adds_worker_snapshots():
+    metrics.enable()
+    with metrics.capture():
+        with metrics.timer("format"):
+            pass
+        worker = metrics.snapshot()
+    assert metrics.snapshot()["histograms"] == []
+
+    metrics.merge(worker)
+    metrics.merge(worker)
+
+    assert _histogram(metrics.snapshot(), "format")["count"] == 2
+
+
+def test_file_sinks(tmp_path):
+    prom = tmp_path / "invoices.prom"
+    js = tmp_path / "invoices.json"
+    metrics.enable(metrics.PrometheusFileSink(str(prom)), metrics.JSONFileSink(str(js)))
+    metrics.add_bytes("export", 2048)
+    for _ in range(3):
+        with metrics.timer("send"):
+            pass
+
+    metrics.flush()
+
+    text = prom.read_text()
+    assert "# TYPE invoice_stage_seconds histogram" in text
+    assert 'invoice_stage_seconds_bucket{stage="send",le="+Inf"} 3' in text
+    assert 'invoice_stage_seconds_count{stage="send"} 3' in text
+    assert 'invoice_bytes_written_total{stage="export"} 2048' in text
+    assert _histogram(json.loads(js.read_text()), "send")["count"] == 3
+
+
+def test_generate_all_reports_each_stage(tmp_path, monkeypatch, orders_workbook, order_line, sender):
+    monkeypatch.chdir(tmp_path)
+    orders = [order_line(1000 + i) for i in range(3)]
+    monkeypatch.setattr(invoice.WorkbookSource, "orders", lambda self: iter(orders))
+
+    sink = MemorySink()
+    metrics.enable(sink)
+    invoice.GenerateAllInvoices(orders_workbook, engine="native", sender=sender)
+
+    assert len(sink.writes) == 1
+    data = sink.writes[0]
+    for stage in ("load_workbook", "transform", "render_pdf", "export", "send"):
+        assert _histogram(data, stage)["count"] == (1 if stage == "load_workbook" else 3)
+    written = next(c for c in data["counters"] if c["name"] == metrics.BYTES_WRITTEN)
+    assert written["value"] == sum((tmp_path / f"invoice_{1000 + i}.pdf").stat().st_size for i in range(3))
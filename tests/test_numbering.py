@@ -0,0 +1,69 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+import pytest
+import invoice
+from numbering import NumberAllocator
+
+def read_counter(path):
+    with open(path) as f:
+        date, counter = f.read().strip().split("-")
+    return date, int(counter)
+
+def issue_numbers(counter_file, count):
+    allocator = NumberAllocator(counter_file, "INV")
+    return [allocator.next() for _ in range(count)]
+
+def test_numbers_unique_across_processes(tmp_path):
+    counter_file = str(tmp_path / "invoice_counter.txt")
+    with ProcessPoolExecutor(max_workers=4) as pool:
+        batches = list(pool.map(issue_numbers, [counter_file] * 4, [25] * 4))
+
+    numbers = [n for batch in batches for n in batch]
+    assert len(set(numbers)) == 100
+    assert read_counter(counter_file)[1] == 100
+
+def test_numbers_unique_across_threads(tmp_path):
+    allocator = NumberAllocator(str(tmp_path / "invoice_counter.txt"), "INV", block_size=7)
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        numbers = list(pool.map(lambda _: allocator.next(), range(200)))
+
+    assert sorted(int(n.rsplit("-", 1)[1]) for n in numbers) == list(range(1, 201))
+
+def test_block_reservation_and_release(tmp_path):
+    counter_file = str(tmp_path / "invoice_counter.txt")
+    allocator = NumberAllocator(counter_file, "INV")
+    today = datetime.now().strftime("%Y%m%d")
+
+    with allocator.reserving(100):
+        assert allocator.next() == f"INV-{today}-0001"
+        assert allocator.next() == f"INV-{today}-0002"
+        # The whole block is claimed with a single file write
+        assert read_counter(counter_file) == (today, 100)
+
+    # Unused numbers are handed back so the sequence has no gap
+    assert read_counter(counter_file) == (today, 2)
+    assert allocator.next() == f"INV-{today}-0003"
+
+def test_release_keeps_later_reservations(tmp_path):
+    counter_file = str(tmp_path / "invoice_counter.txt")
+    first = NumberAllocator(counter_file, "INV", block_size=10)
+    second = NumberAllocator(counter_file, "INV", block_size=10)
+
+    a = first.next()
+    b = second.next()
+    assert a.endswith("-0001") and b.endswith("-0011")
+
+    # Another allocator reserved after us, so our remainder cannot be returned
+    first.release()
+    assert read_counter(counter_file)[1] == 20
+    second.release()
+    assert read_counter(counter_file)[1] == 11
+
+def test_reserved_numbers_for_pipeline(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with invoice.ReservedNumbers(50):
+        numbers = [invoice.get_next_invoice_number() for _ in range(3)]
+        assert read_counter("invoice_counter.txt")[1] == 50
+    assert [n[-4:] for n in numbers] == ["0001", "0002", "0003"]
+    assert read_counter("invoice_counter.txt")[1] == 3
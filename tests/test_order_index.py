@@ -0,0 +1,70 @@
+import pytest
+
+import invoice
+from order_index import OrderIndex, RowKeys, row_digest
+
+
+@pytest.fixture
+def run(tmp_path, orders_source, renderer, sender):
+    """
+    Returns run(orders, **kwargs) -> list of invoices sent, each as
+    (pdf path, [Qty of every line on it]).
+    """
+    def run(orders, **kwargs):
+        sender.sent.clear()
+        orders_source(orders)
+        with OrderIndex(str(tmp_path / "orders.index")) as index:
+            invoice.GenerateAllInvoices("orders.xlsx", sender=sender, index=index, **kwargs)
+        rendered = dict(renderer.rendered)
+        return [(path, [item["Qty"] for item in rendered[path[:-len(".pdf")]]["Items"]])
+                for _, path in sender.sent]
+    return run
+
+
+def test_row_digest_ignores_column_order(order_line):
+    row = order_line("1001")
+    assert row_digest(row) == row_digest(dict(reversed(list(row.items()))))
+    assert row_digest(row) != row_digest(order_line("1001", Qty=2))
+
+
+def test_identical_rows_get_distinct_keys(order_line):
+    keys = RowKeys()
+    assert keys(order_line("")) != keys(order_line(""))
+
+
+def test_only_new_and_changed_orders_are_invoiced(run, order_line):
+    assert len(run([order_line("1001"), order_line("1002")])) == 2
+
+    sent = run([order_line("1001"), order_line("1002", Qty=5), order_line("1003")])
+
+    assert sent == [("invoice_1002.pdf", [5]), ("invoice_1003.pdf", [1])]
+    assert run([order_line("1001"), order_line("1002", Qty=5), order_line("1003")]) == []
+
+
+def test_changed_line_reinvoices_whole_order(run, order_line):
+    run([order_line("1001"), order_line("1001", ItemID="ITEM002")], group_by="OrderID")
+
+    sent = run([order_line("1001"), order_line("1001", ItemID="ITEM002", Qty=3)], group_by="OrderID")
+
+    assert sent == [("invoice_1001.pdf", [1, 3])]
+
+
+def test_customer_groups_pick_up_only_new_lines(run, order_line):
+    run([order_line("1001"), order_line("1002")], group_by="CustomerID")
+
+    sent = run([order_line("1001"), order_line("1002"), order_line("1003", Qty=7)], group_by="CustomerID")
+
+    assert len(sent) == 1
+    assert sent[0][1] == [7]
+
+
+def test_failed_send_stays_pending(tmp_path, run, orders_source, order_line, sender):
+    sender.failing.add("c@x.com")
+    orders_source([order_line("1001")])
+    with OrderIndex(str(tmp_path / "orders.index")) as index:
+        with pytest.raises(RuntimeError):
+            invoice.GenerateAllInvoices("orders.xlsx", sender=sender, index=index)
+        assert len(index) == 0
+
+    sender.failing.clear()
+    assert len(run([order_line("1001")])) == 1
@@ -0,0 +1,81 @@
+import re
+import zlib
+import pytest
+from openpyxl import Workbook
+from datetime import datetime, timedelta
+from pdf_renderer import RenderInvoicePDF
+from invoice import ExportInvoice
+
+@pytest.fixture
+def sample_order():
+    return {
+        "InvoiceNumber": "INV-2024-001",
+        "InvoiceDate": datetime(2024, 3, 20),
+        "DueDate": datetime(2024, 3, 20) + timedelta(days=15),
+        "PO": "PO-2024-001",
+        "Items": [
+            {
+                "Qty": 2,
+                "Description": "Test Item",
+                "UnitPrice": 9.99
+            }
+        ],
+        "BillTo": {
+            "CustomerName": "Acme Corp",
+            "Address": "123 Main St",
+            "City": "Metropolis",
+            "Phone": "555-0123",
+            "Email": "acme@example.com"
+        },
+        "ShipTo": {
+            "CustomerName": "Acme Corp",
+            "Address": "123 Main St",
+            "City": "Metropolis",
+            "Phone": "555-0123",
+            "Email": "acme@example.com"
+        },
+        "CompanyContact": "555-0123",
+        "Terms": "Payment is due within 15 days."
+    }
+
+def page_text(pdf: bytes) -> str:
+    """Decompresses every content stream and returns the drawn strings."""
+    text = []
+    for raw in re.findall(rb"/Filter /FlateDecode /Length \d+ >>\nstream\n(.*?)\nendstream", pdf, re.S):
+        text += re.findall(rb"\((.*?)\) Tj", zlib.decompress(raw))
+    return "\n".join(t.decode("cp1252") for t in text)
+
+def test_render_invoice_pdf_layout(sample_order):
+    pdf = RenderInvoicePDF(sample_order)
+    assert pdf.startswith(b"%PDF-1.4")
+    assert pdf.rstrip().endswith(b"%%EOF")
+    assert b"/Subtype /Image" in pdf  # logo
+
+    text = page_text(pdf)
+    for expected in ["INVOICE", "Yukon Packing", "Bill To", "Ship To", "Acme Corp",
+                     "INV-2024-001", "20/03/2024", "04/04/2024", "Test Item", "$9.99",
+                     "$19.98", "GST 5%", "$1.00", "$20.98", "Terms & Conditions:"]:
+        assert expected in text
+
+def test_render_invoice_pdf_paginates(sample_order):
+    sample_order["Items"] = [{"Qty": 1, "Description": f"Item {i}", "UnitPrice": 1.0} for i in range(100)]
+    pdf = RenderInvoicePDF(sample_order, logo_path=None)
+
+    count = int(re.search(rb"/Type /Pages /Kids \[.*?\] /Count (\d+)", pdf).group(1))
+    assert count > 1
+    text = page_text(pdf)
+    assert "Item 99" in text
+    # The table header is repeated on every page
+    assert text.count("Description") == count
+
+def test_export_invoice_native_engine(tmp_path, sample_order):
+    out = tmp_path / "invoice001"
+    file_path = ExportInvoice(sample_order, str(out), format="pdf", engine="native")
+    assert file_path == str(out) + ".pdf"
+    assert (tmp_path / "invoice001.pdf").read_bytes().startswith(b"%PDF")
+
+def test_export_invoice_native_engine_rejects_workbook(tmp_path):
+    with pytest.raises(ValueError):
+        ExportInvoice(Workbook(), str(tmp_path / "x"), format="pdf", engine="native")
+    with pytest.raises(ValueError):
+        ExportInvoice({}, str(tmp_path / "x"), format="xlsx", engine="native")
@@ -0,0 +1,74 @@
+import asyncio
+import threading
+import time
+import pytest
+import invoice
+from pipeline import RunPipeline
+
+def make_jobs(count):
+    return iter([({"InvoiceNumber": f"INV-{i}"}, f"invoice_{i}", f"c{i}@x.com") for i in range(count)])
+
+@pytest.fixture
+def stub_stages(monkeypatch):
+    monkeypatch.setattr(invoice, "FormatInvoice", lambda order: f"wb-{order['InvoiceNumber']}")
+    def fake_export(wb, base, format="pdf", **kwargs):
+        if base == "invoice_3":
+            raise RuntimeError("export boom")
+        time.sleep(0.01)
+        return f"{base}.pdf"
+    monkeypatch.setattr(invoice, "ExportInvoice", fake_export)
+
+def test_pipeline_delivers_every_invoice(stub_stages):
+    sent = []
+    lock = threading.Lock()
+    def send(email, path):
+        with lock:
+            sent.append((email, path))
+
+    failures = asyncio.run(RunPipeline(make_jobs(10), send, format_workers=2,
+                                       export_workers=3, send_workers=2))
+
+    assert list(failures) == ["invoice_3"]
+    assert "export boom" in str(failures["invoice_3"])
+    assert sorted(sent) == sorted((f"c{i}@x.com", f"invoice_{i}.pdf") for i in range(10) if i != 3)
+
+def test_pipeline_applies_backpressure(stub_stages):
+    produced = []
+    in_flight = []
+    release = threading.Event()
+
+    def jobs():
+        for job in make_jobs(50):
+            produced.append(job)
+            yield job
+
+    def slow_send(email, path):
+        in_flight.append(len(produced))
+        release.wait(timeout=5)
+
+    async def run():
+        task = asyncio.ensure_future(RunPipeline(jobs(), slow_send, queue_size=2, send_workers=1))
+        await asyncio.sleep(0.3)
+        # With send blocked, only a few queue slots' worth of jobs were read ahead
+        read_ahead = len(produced)
+        release.set()
+        await task
+        return read_ahead
+
+    read_ahead = asyncio.run(run())
+    assert read_ahead < 15
+    assert len(produced) == 50
+
+def test_pipeline_raises_job_errors_after_draining(stub_stages):
+    sent = []
+    def jobs():
+        yield from make_jobs(2)
+        raise ValueError("bad row")
+
+    with pytest.raises(ValueError):
+        asyncio.run(RunPipeline(jobs(), lambda email, path: sent.append(path)))
+    assert sorted(sent) == ["invoice_0.pdf", "invoice_1.pdf"]
+
+def test_generate_all_rejects_workers_with_stages():
+    with pytest.raises(ValueError):
+        invoice.GenerateAllInvoices("orders.xlsx", workers=2, stages={"send_workers": 2})
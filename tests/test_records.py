@@ -0,0 +1,92 @@
+import json
+import pickle
+import sys
+
+import pytest
+
+import invoice as invoice_module
+from records import Customer, Invoice, LineItem, Order, key_errors, plain
+
+
+def test_record_behaves_like_a_dict():
+    order = Order(OrderID="1001", Qty=2, Price=9.99)
+
+    assert order["Qty"] == 2 and order.Qty == 2
+    assert order.get("Email", "none") == "none"
+    assert "OrderID" in order and "Email" not in order
+    with pytest.raises(KeyError):
+        order["Email"]
+    assert order == {"OrderID": "1001", "Qty": 2, "Price": 9.99}
+    assert json.loads(json.dumps(dict(order))) == order
+
+    order["Email"] = "a@b.com"
+    del order["Price"]
+    assert list(order) == ["OrderID", "Email", "Qty"]
+    assert len(order) == 3
+
+
+def test_unknown_columns_are_kept():
+    order = Order(OrderID="1001", Notes="fragile")
+    assert order["Notes"] == "fragile"
+    assert dict(order) == {"OrderID": "1001", "Notes": "fragile"}
+
+
+def test_row_reader_maps_headers_once():
+    read = Order.row_reader(["CustomerID", "Qty", "Price", "Warehouse"], convert={"Qty": int, "Price": float})
+
+    order = read(("CUST001", "3", 4, "East"))
+
+    assert order == {"CustomerID": "CUST001", "Qty": 3, "Price": 4.0, "Warehouse": "East"}
+    assert "OrderID" not in order
+    assert read(("CUST002",)) == {"CustomerID": "CUST002"}  # short rows, like dict(zip(...))
+
+
+def test_records_are_slotted_and_smaller_than_dicts():
+    fields = {"OrderID": "1", "CustomerID": "C", "CustomerName": "N", "Email": "e",
+              "ItemID": "I", "ItemName": "n", "Qty": 1, "Price": 2.0}
+    order = Order(fields)
+    assert not hasattr(order, "__dict__")
+    assert sys.getsizeof(order) < sys.getsizeof(dict(fields))
+
+
+def test_nested_records_round_trip():
+    invoice = Invoice(InvoiceNumber="INV-1", BillTo=Customer(CustomerName="Acme"),
+                      Items=[LineItem(Qty=1, Description="Widget", UnitPrice=10.0)])
+
+    assert pickle.loads(pickle.dumps(invoice)) == invoice
+    assert invoice.to_dict() == {"InvoiceNumber": "INV-1", "BillTo": {"CustomerName": "Acme"},
+                                 "Items": [{"Qty": 1, "Description": "Widget", "UnitPrice": 10.0}]}
+    assert type(invoice.to_dict()["Items"][0]) is dict
+
+
+def test_of_converts_dicts_and_keeps_records():
+    order = Order(OrderID="1001", Qty=2)
+    assert Order.of(order) is order
+    converted = Order.of({"OrderID": "1001", "Qty": 2, "Notes": "fragile"})
+    assert type(converted) is Order and converted.Qty == 2 and converted["Notes"] == "fragile"
+    # Unset fields read as attributes fall back like dict.get
+    assert getattr(converted, "ItemName", "n/a") == "n/a"
+    assert converted.get("ItemName", "n/a") == "n/a"
+
+
+def test_plain_makes_records_json_serializable():
+    invoice = {"InvoiceNumber": "INV-1", "Items": [LineItem(Qty=1, Description="Widget", UnitPrice=10.0)]}
+    assert json.loads(json.dumps(plain(invoice))) == {
+        "InvoiceNumber": "INV-1", "Items": [{"Qty": 1, "Description": "Widget", "UnitPrice": 10.0}]}
+
+
+def test_key_errors_reports_unset_fields_as_key_errors():
+    order = Order(OrderID="1001")
+    with pytest.raises(KeyError, match="CustomerID"):
+        with key_errors():
+            order.CustomerID
+    # Unrelated attribute errors are left alone
+    with pytest.raises(AttributeError):
+        with key_errors():
+            None.CustomerID
+
+
+def test_transform_reports_missing_field_as_key_error(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with pytest.raises(KeyError, match="CustomerID"):
+        invoice_module.TransformOrder({"Qty": 1, "Price": 1.0, "ItemID": "I1"}, {})
@@ -0,0 +1,100 @@
+import os
+from datetime import datetime
+
+import invoice
+from render_cache import RenderCache, render_key
+
+
+def _order(**overrides):
+    order = {
+        "CustomerID": "CUST001", "CustomerName": "Customer One", "Email": "a@b.com",
+        "BillTo": {}, "ShipTo": {}, "CompanyContact": "555-0123",
+        "InvoiceNumber": "INV-20250608-0001", "InvoiceDate": datetime(2025, 6, 8, 9, 30),
+        "PO": "PO-20250608-0001", "DueDate": datetime(2025, 6, 23, 9, 30),
+        "Items": [{"Qty": 2, "Description": "Widget", "UnitPrice": 10.0}],
+        "Terms": "Payment is due within 15 days.",
+    }
+    order.update(overrides)
+    return order
+
+
+def test_render_key_tracks_what_is_printed():
+    key = render_key(_order(), "pdf", "office", 1)
+
+    # Only the date is printed, so the time of day does not matter
+    assert key == render_key(_order(InvoiceDate=datetime(2025, 6, 8, 17, 0)), "pdf", "office", 1)
+    assert key != render_key(_order(InvoiceNumber="INV-20250608-0002"), "pdf", "office", 1)
+    assert key != render_key(_order(), "xlsx", "office", 1)
+    assert key != render_key(_order(), "pdf", "native", 1)
+    assert key != render_key(_order(), "pdf", "office", 2)
+
+
+def test_fetch_and_store(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"))
+    src = tmp_path / "invoice.pdf"
+    src.write_bytes(b"%PDF-1.4 rendered")
+
+    assert not cache.fetch("abc", "pdf", str(tmp_path / "copy.pdf"))
+    cache.store("abc", "pdf", str(src))
+    assert cache.fetch("abc", "pdf", str(tmp_path / "copy.pdf"))
+    assert (tmp_path / "copy.pdf").read_bytes() == b"%PDF-1.4 rendered"
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = RenderCache(str(tmp_path / "cache"), max_bytes=250)
+    src = tmp_path / "invoice.pdf"
+    src.write_bytes(b"x" * 100)
+    for n, key in enumerate(["a", "b"]):
+        cache.store(key, "pdf", str(src))
+        os.utime(os.path.join(cache.directory, f"{key}.pdf"), (1000 + n, 1000 + n))
+    cache.fetch("a", "pdf", str(tmp_path / "copy.pdf"))  # "a" is now the most recent
+
+    cache.store("c", "pdf", str(src))
+
+    assert sorted(os.listdir(cache.directory)) == ["a.pdf", "c.pdf"]
+
+
+def test_render_invoice_reuses_identical_render(tmp_path, monkeypatch):
+    cache = RenderCache(str(tmp_path / "cache"))
+    renders = []
+    real_export = invoice.ExportInvoice
+
+    def counting_export(*args, **kwargs):
+        renders.append(args[1])
+        return real_export(*args, **kwargs)
+    monkeypatch.setattr(invoice, "ExportInvoice", counting_export)
+
+    first = invoice.RenderInvoice(_order(), str(tmp_path / "first"), engine="native", cache=cache)
+    second = invoice.RenderInvoice(_order(), str(tmp_path / "second"), engine="native", cache=cache)
+    invoice.RenderInvoice(_order(PO="PO-20250608-0002"), str(tmp_path / "third"), engine="native", cache=cache)
+
+    assert len(renders) == 2
+    assert open(first, "rb").read() == open(second, "rb").read()
+
+
+def test_pipeline_serves_cached_renders(tmp_path, monkeypatch):
+    import asyncio
+    from pipeline import RunPipeline
+
+    monkeypatch.chdir(tmp_path)
+    cache = RenderCache(str(tmp_path / "cache"))
+    exports = []
+    monkeypatch.setattr(invoice, "FormatInvoice", lambda order: order)
+
+    def fake_export(wb, base, format="pdf", **kwargs):
+        exports.append(base)
+        with open(f"{base}.pdf", "wb") as f:
+            f.write(wb["InvoiceNumber"].encode())
+        return f"{base}.pdf"
+    monkeypatch.setattr(invoice, "ExportInvoice", fake_export)
+
+    def jobs():
+        return iter([({"InvoiceNumber": f"INV-{i}"}, f"invoice_{i}", "a@b.com") for i in range(3)])
+
+    sent = []
+    for _ in range(2):
+        asyncio.run(RunPipeline(jobs(), lambda email, path: sent.append(path), cache=cache))
+
+    assert len(exports) == 3
+    assert len(sent) == 6
+    assert open("invoice_2.pdf", "rb").read() == b"INV-2"
@@ -0,0 +1,201 @@
+import smtplib
+import socket
+import subprocess
+import sys
+from pathlib import Path
+import pytest
+import invoice
+from smtp_sender import SMTPSender
+
+aiosmtpd = pytest.importorskip("aiosmtpd")
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+
+
+class RecordingHandler(Sink):
+    """Local stand-in SMTP server that keeps every message and session."""
+
+    def __init__(self):
+        self.messages = []
+        self.sessions = set()
+
+    async def handle_DATA(self, server, session, envelope):
+        self.messages.append(envelope)
+        self.sessions.add(id(session))
+        return "250 OK"
+
+
+@pytest.fixture
+def smtp_server():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    handler = RecordingHandler()
+    controller = Controller(handler, hostname="127.0.0.1", port=port)
+    controller.start()
+    try:
+        yield handler, port
+    finally:
+        controller.stop()
+
+
+@pytest.fixture
+def invoice_files(tmp_path):
+    paths = []
+    for i in range(6):
+        path = tmp_path / f"inv{i:03d}.pdf"
+        path.write_bytes(b"%PDF-1.4 test")
+        paths.append(str(path))
+    return paths
+
+
+def test_smtp_sender_delivers_invoice(smtp_server, invoice_files, tmp_path):
+    handler, port = smtp_server
+    extra = tmp_path / "extra.xlsx"
+    extra.write_text("XLSX-DATA")
+
+    with SMTPSender("127.0.0.1", port=port, use_tls=False) as sender:
+        sender.send("foo@bar.com", invoice_files[0], cc="cc@bar.com", additional_attachments=[str(extra)])
+
+    assert len(handler.messages) == 1
+    envelope = handler.messages[0]
+    assert set(envelope.rcpt_tos) == {"foo@bar.com", "cc@bar.com"}
+    content = envelope.content.decode()
+    assert "Subject: Invoice inv000 - Contoso Logistics" in content
+    assert 'filename="inv000.pdf"' in content
+    assert "extra.xlsx" not in content  # only PDFs are attached
+
+
+def test_smtp_sender_reuses_connections(smtp_server, invoice_files):
+    handler, port = smtp_server
+
+    with SMTPSender("127.0.0.1", port=port, use_tls=False, pool_size=2) as sender:
+        failures = sender.send_many(("foo@bar.com", path) for path in invoice_files)
+
+    assert failures == {}
+    assert len(handler.messages) == 6
+    # Six messages went over at most two SMTP sessions
+    assert len(handler.sessions) <= 2
+
+
+def test_smtp_sender_rejects_non_pdf(tmp_path):
+    xlsx_file = tmp_path / "invoice.xlsx"
+    xlsx_file.write_text("XLSX-DATA")
+    with pytest.raises(ValueError):
+        SMTPSender("127.0.0.1").send("foo@bar.com", str(xlsx_file))
+
+
+class FlakySMTP:
+    """smtplib.SMTP stand-in that fails with the queued errors first."""
+    errors = []
+    sent = []
+
+    def __init__(self, host, port, timeout=None):
+        pass
+
+    def send_message(self, msg):
+        if FlakySMTP.errors:
+            raise FlakySMTP.errors.pop(0)
+        FlakySMTP.sent.append(msg)
+
+    def noop(self):
+        return 250, b"OK"
+
+    def close(self):
+        pass
+
+    def quit(self):
+        pass
+
+
+def test_smtp_sender_retries_transient_errors(monkeypatch, invoice_files):
+    monkeypatch.setattr(smtplib, "SMTP", FlakySMTP)
+    FlakySMTP.sent = []
+    FlakySMTP.errors = [smtplib.SMTPServerDisconnected("gone"),
+                        smtplib.SMTPResponseException(421, b"try later")]
+
+    with SMTPSender("mail", use_tls=False, backoff=0) as sender:
+        sender.send("foo@bar.com", invoice_files[0])
+    assert len(FlakySMTP.sent) == 1
+
+
+def test_smtp_sender_permanent_error(monkeypatch, invoice_files):
+    monkeypatch.setattr(smtplib, "SMTP", FlakySMTP)
+    FlakySMTP.sent = []
+    FlakySMTP.errors = [smtplib.SMTPResponseException(550, b"no such user")]
+
+    with SMTPSender("mail", use_tls=False, backoff=0) as sender:
+        with pytest.raises(RuntimeError) as exc:
+            sender.send("foo@bar.com", invoice_files[0])
+    assert "no such user" in str(exc.value)
+    assert FlakySMTP.errors == [] and FlakySMTP.sent == []
+
+
+def test_smtp_sender_keeps_connection_after_refused_message(monkeypatch, invoice_files):
+    class CountingSMTP(FlakySMTP):
+        opened = 0
+
+        def __init__(self, host, port, timeout=None):
+            CountingSMTP.opened += 1
+
+    monkeypatch.setattr(smtplib, "SMTP", CountingSMTP)
+    FlakySMTP.sent = []
+    FlakySMTP.errors = [smtplib.SMTPRecipientsRefused({"bad@bar.com": (550, b"no such user")})]
+
+    with SMTPSender("mail", use_tls=False, pool_size=1, backoff=0) as sender:
+        with pytest.raises(RuntimeError):
+            sender.send("bad@bar.com", invoice_files[0])
+        sender.send("foo@bar.com", invoice_files[1])
+
+    assert CountingSMTP.opened == 1
+    assert len(FlakySMTP.sent) == 1
+
+
+def test_smtp_sender_replaces_dropped_idle_connection(monkeypatch, invoice_files):
+    class DroppingSMTP(FlakySMTP):
+        opened = []
+
+        def __init__(self, host, port, timeout=None):
+            self.dropped = False
+            DroppingSMTP.opened.append(self)
+
+        def noop(self):
+            if self.dropped:
+                raise smtplib.SMTPServerDisconnected("idle timeout")
+            return 250, b"OK"
+
+        def send_message(self, msg):
+            if self.dropped:
+                raise smtplib.SMTPServerDisconnected("idle timeout")
+            super().send_message(msg)
+
+    monkeypatch.setattr(smtplib, "SMTP", DroppingSMTP)
+    FlakySMTP.sent = []
+    FlakySMTP.errors = []
+
+    with SMTPSender("mail", use_tls=False, pool_size=1, retries=0) as sender:
+        sender.send("foo@bar.com", invoice_files[0])
+        DroppingSMTP.opened[0].dropped = True
+        sender.send("foo@bar.com", invoice_files[1])
+        sender.send("foo@bar.com", invoice_files[2])
+
+    # The dropped connection was replaced once, without a failed send
+    assert len(DroppingSMTP.opened) == 2
+    assert len(FlakySMTP.sent) == 3
+
+
+def test_smtp_sender_does_not_import_invoice():
+    # invoice's CLI imports smtp_sender, so the reverse import would be a cycle
+    code = "import sys, smtp_sender; sys.exit('invoice' in sys.modules)"
+    root = Path(__file__).resolve().parent.parent
+    assert subprocess.run([sys.executable, "-c", code], cwd=root).returncode == 0
+
+
+def test_generate_all_uses_sender(monkeypatch, orders_source, renderer, sender):
+    orders_source([{"OrderID": "1001", "Email": "a@b.com"}])
+    monkeypatch.setattr(invoice, "ReservedNumbers", lambda: __import__("contextlib").nullcontext())
+    monkeypatch.setattr(invoice, "TransformOrders", lambda groups, bill_to: [{"InvoiceNumber": "INV-1"}])
+    monkeypatch.setattr(invoice, "SendInvoice", lambda email, path: pytest.fail("Outlook used"))
+
+    invoice.GenerateAllInvoices("orders.xlsx", sender=sender)
+    assert sender.sent == [("a@b.com", "invoice_1001.pdf")]
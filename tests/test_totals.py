@@ -0,0 +1,110 @@
+import random
+
+import pytest
+
+import invoice
+import totals
+from totals import LineColumns, gst_cents, order_totals, to_cents
+
+
+def test_prices_round_half_up_to_the_cent():
+    assert to_cents(9.99) == 999
+    assert to_cents(1.005) == 101   # binary float is 1.00499..., but the written value rounds up
+    assert to_cents(2.675) == 268
+    assert to_cents(-1.005) == -101
+    assert to_cents(12) == 1200
+
+
+def test_gst_rounds_half_up_from_exact_subtotal():
+    assert gst_cents(1990) == 100   # 99.5 cents
+    assert gst_cents(1989) == 99    # 99.45 cents
+    assert gst_cents(10) == 1
+    assert gst_cents(-1990) == -100
+
+
+def test_subtotal_is_exact():
+    order = {"Items": [{"Qty": 1, "UnitPrice": 0.1}] * 3}
+    amounts, sub, gst, total = order_totals(order)
+    assert amounts == [0.1, 0.1, 0.1]
+    assert (sub, gst, total) == (0.3, 0.02, 0.32)
+
+
+
+@pytest.mark.parametrize("qty", [1.5, "0.25", None, "two"])
+def test_fractional_or_invalid_quantities_are_rejected(qty):
+    with pytest.raises(ValueError, match="Invalid quantity"):
+        order_totals({"Items": [{"Qty": qty, "UnitPrice": 10}]})
+
+
+def test_whole_float_quantities_are_accepted():
+    assert order_totals({"Items": [{"Qty": 2.0, "UnitPrice": 10}]})[1] == 20.0
+
+
+@pytest.mark.parametrize("price", [None, "abc", float("nan")])
+def test_invalid_prices_raise_value_error(price):
+    with pytest.raises(ValueError, match="Invalid price"):
+        to_cents(price)
+
+def _random_invoices(count, seed=1):
+    rng = random.Random(seed)
+    return [[{"Qty": rng.randint(-3, 50), "UnitPrice": round(rng.uniform(0, 999), rng.choice([2, 3]))}
+             for _ in range(rng.randint(0, 6))] for _ in range(count)]
+
+
+def test_numpy_and_array_paths_agree(monkeypatch):
+    pytest.importorskip("numpy")
+    columns = LineColumns.from_invoices(_random_invoices(2000))
+    vectorized = columns.totals()
+    monkeypatch.setattr(totals, "np", None)
+    looped = columns.totals()
+
+    for name in ("amounts", "subtotals", "gst", "totals"):
+        assert getattr(vectorized, name) == getattr(looped, name)
+
+
+def test_batch_transform_matches_single(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    groups = [[{"CustomerID": "C1", "CustomerName": "One", "Email": "a@b.com", "ItemID": f"I{i}",
+                "Qty": qty, "Price": price} for i, (qty, price) in enumerate(items)]
+              for items in [[(2, 9.99)], [(1, 1.005), (3, 19.99)], [(7, 0.35)]]]
+
+    batch = invoice.TransformOrders(groups, {})
+    single = [invoice.TransformOrderGroup(lines, {}) for lines in groups]
+
+    for a, b in zip(batch, single):
+        assert order_totals(a) == order_totals(b)
+    assert (batch[1]["Subtotal"], batch[1]["GST"], batch[1]["Total"]) == (60.98, 3.05, 64.03)
+    assert len({o["InvoiceNumber"] for o in batch + single}) == 6
+
+
+def test_format_invoice_recomputes_edited_totals(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    order = invoice.TransformOrder({"CustomerID": "C1", "CustomerName": "One", "Email": "a@b.com",
+                                    "ItemID": "I1", "Qty": 1, "Price": 10.0}, {})
+    order["Items"][0]["Qty"] = 5  # edited after the totals were stored
+
+    ws = invoice.FormatInvoice(order, logo_path=None).active
+    values = {ws.cell(row=r, column=5).value: ws.cell(row=r, column=6).value for r in range(21, 30)}
+
+    assert ws.cell(row=22, column=1).value == 5
+    assert ws.cell(row=22, column=4).value == 50.0
+    assert values["Subtotal"] == 50.0
+    assert values["GST 5%"] == 2.5
+    assert values["TOTAL"] == 52.5
+
+
+def test_generate_all_transforms_in_batches(monkeypatch, orders_source, order_line, renderer, sender):
+    orders_source([order_line(1000 + i) for i in range(5)])
+    monkeypatch.setattr(invoice, "TRANSFORM_BATCH", 2)
+    batches = []
+    real = invoice.TransformOrders
+
+    def recording(groups, bill_to):
+        batches.append(len(groups))
+        return real(groups, bill_to)
+    monkeypatch.setattr(invoice, "TransformOrders", recording)
+
+    invoice.GenerateAllInvoices("orders.xlsx", sender=sender)
+
+    assert batches == [2, 2, 1]
+    assert [o["Total"] for _, o in renderer.rendered] == [10.5] * 5
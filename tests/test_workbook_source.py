@@ -0,0 +1,86 @@
+import shutil
+from pathlib import Path
+import pytest
+from openpyxl import Workbook
+import invoice
+from invoice import WorkbookSource
+
+@pytest.fixture
+def combined_workbook(tmp_path):
+    # Build a workbook with all three input sheets
+    wb = Workbook()
+    orders = wb.active
+    orders.title = "Orders"
+    orders.append(["CustomerID", "ItemID", "Qty", "Price", "CustomerName", "Email"])
+    orders.append(["CUST001", "ITEM001", 2, 9.99, "Acme Corp", "acme@example.com"])
+    orders.append(["CUST002", "ITEM002", 1, 19.95, "Beta LLC", "beta@example.com"])
+
+    bill_to = wb.create_sheet("BillTo")
+    bill_to.append(["CustomerID", "CustomerName", "Email", "Phone", "Address", "City"])
+    bill_to.append(["CUST001", "Acme Corp", "acme@example.com", "555-0001", "1 Main St", "Toronto"])
+    bill_to.append([None, "No ID", "", "", "", ""])
+
+    items = wb.create_sheet("Items")
+    items.append(["ItemID", "Name", "Description", "UnitPrice"])
+    items.append(["ITEM001", "Mouse", "Wireless Mouse", 9.99])
+
+    path = tmp_path / "combined.xlsx"
+    wb.save(path)
+    return str(path)
+
+def test_workbook_source_reads_all_sheets(combined_workbook):
+    with WorkbookSource(combined_workbook) as source:
+        orders, bill_to, items = source.load()
+
+    assert [o["CustomerID"] for o in orders] == ["CUST001", "CUST002"]
+    assert orders[0]["Qty"] == 2
+    assert list(bill_to) == ["CUST001"]
+    assert items["ITEM001"]["Description"] == "Wireless Mouse"
+
+def test_workbook_source_opens_file_once(combined_workbook, monkeypatch):
+    calls = []
+    real_load = invoice.load_workbook
+    def counting_load(*args, **kwargs):
+        calls.append(args)
+        return real_load(*args, **kwargs)
+    monkeypatch.setattr(invoice, "load_workbook", counting_load)
+
+    with WorkbookSource(combined_workbook) as source:
+        list(source.orders())
+        source.bill_to()
+        source.bill_to()
+        source.items()
+
+    assert len(calls) == 1
+
+def test_workbook_source_missing_sheets(tmp_path):
+    sample_src = Path("tests/data/orders_sample_with_id.xlsx")
+    sample = tmp_path / "orders_sample_with_id.xlsx"
+    shutil.copy(sample_src, sample)
+
+    with WorkbookSource(str(sample)) as source:
+        assert source.bill_to() == {}
+        assert source.items() == {}
+        assert len(list(source.orders())) == 10
+
+def test_workbook_source_ignores_stale_dimension(combined_workbook, tmp_path):
+    # Many writers leave a wrong <dimension> tag; read-only sheets must not trust it
+    import re
+    import zipfile
+    stale = tmp_path / "stale.xlsx"
+    with zipfile.ZipFile(combined_workbook) as zin, zipfile.ZipFile(stale, "w") as zout:
+        for item in zin.infolist():
+            data = zin.read(item.filename)
+            if item.filename.startswith("xl/worksheets/sheet"):
+                data = re.sub(rb'<dimension ref="[^"]*"\s*/>', b'<dimension ref="A1:C1"/>', data)
+            zout.writestr(item, data)
+
+    with WorkbookSource(combined_workbook) as source:
+        expected = source.load()
+    with WorkbookSource(str(stale)) as source:
+        orders, bill_to, items = source.load()
+
+    assert (orders, bill_to, items) == expected
+    assert [o["Email"] for o in orders] == ["acme@example.com", "beta@example.com"]
+    assert bill_to["CUST001"]["City"] == "Toronto"
+    assert items["ITEM001"]["UnitPrice"] == 9.99
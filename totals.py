@@ -0,0 +1,188 @@
+"""
+Invoice arithmetic on columns of integer cents.
+
+Line items are held as parallel arrays (quantity, unit price in cents and
+the invoice each line belongs to), and line amounts, per-invoice
+subtotals, GST and totals are computed over whole columns at once: with
+NumPy when it is installed, otherwise with plain loops over the same
+arrays. Working in integer cents makes every result exact, and rounding
+happens in exactly two places, the same way on both paths:
+
+  - prices are rounded to the cent, half up, when they enter a column
+  - GST is rounded to the cent, half up, from the exact subtotal
+"""
+import operator
+from array import array
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from functools import lru_cache
+
+from records import Invoice, LineItem, key_errors
+
+try:
+    import numpy as np
+except ImportError:  # optional; the array-module path gives identical results
+    np = None
+
+GST_PERCENT = 5
+
+# Below this many lines, converting to NumPy costs more than it saves
+VECTOR_MIN_LINES = 256
+
+
+@lru_cache(maxsize=65536)
+def to_cents(value) -> int:
+    """
+    Converts a money amount to integer cents, rounding half up (away from
+    zero) on its decimal value, so 1.005 becomes 101.
+    """
+    try:
+        return int(Decimal(str(value)).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP).scaleb(2))
+    except (InvalidOperation, ValueError, OverflowError):
+        # None, text, NaN or infinity
+        raise ValueError(f"Invalid price: {value!r}") from None
+
+
+def to_quantity(value) -> int:
+    """
+    Converts a line quantity to an int. Quantities are whole numbers;
+    anything else raises ValueError rather than being truncated.
+    """
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    try:
+        qty = Decimal(str(value))
+        if qty == qty.to_integral_value():
+            return int(qty)
+    except (InvalidOperation, OverflowError):
+        pass
+    raise ValueError(f"Invalid quantity: {value!r} (must be a whole number)")
+
+
+def from_cents(cents: int) -> float:
+    """
+    Converts cents back to the float amount written to invoices.
+    """
+    return cents / 100
+
+
+def gst_cents(subtotal_cents: int) -> int:
+    """
+    GST on a subtotal, in cents, rounded half up (away from zero).
+    """
+    n = subtotal_cents * GST_PERCENT
+    gst = (abs(n) + 50) // 100
+    return gst if n >= 0 else -gst
+
+
+class ColumnTotals:
+    """
+    Results of LineColumns.totals(), in cents: `amounts` per line and
+    `subtotals`, `gst` and `totals` per invoice.
+    """
+
+    __slots__ = ("amounts", "subtotals", "gst", "totals")
+
+    def __init__(self, amounts: array, subtotals: array, gst: array, totals: array):
+        self.amounts = amounts
+        self.subtotals = subtotals
+        self.gst = gst
+        self.totals = totals
+
+
+class LineColumns:
+    """
+    The line items of many invoices as parallel int64 arrays.
+
+    Usage:
+        columns = LineColumns.from_invoices(order["Items"] for order in orders)
+        totals = columns.totals()
+        totals.totals[0]  # first invoice's total in cents
+    """
+
+    def __init__(self):
+        self.qty = array("q")
+        self.price = array("q")    # unit price in cents
+        self.invoice = array("q")  # index of the invoice each line belongs to
+        self.invoices = 0
+
+    @classmethod
+    def from_invoices(cls, item_lists) -> "LineColumns":
+        columns = cls()
+        for items in item_lists:
+            columns.add_invoice(items)
+        return columns
+
+    def add_invoice(self, items: list[dict]) -> None:
+        """
+        Appends one invoice's items ({"Qty", "UnitPrice"} dicts).
+        """
+        n = self.invoices
+        with key_errors():
+            for item in items:
+                item = LineItem.of(item)
+                self.qty.append(to_quantity(item.Qty))
+                self.price.append(to_cents(item.UnitPrice))
+                self.invoice.append(n)
+        self.invoices += 1
+
+    def totals(self) -> ColumnTotals:
+        """
+        Computes line amounts, subtotals, GST and totals for every invoice.
+        """
+        if np is not None and len(self.qty) >= VECTOR_MIN_LINES:
+            return self._totals_numpy()
+        amounts = array("q", map(operator.mul, self.qty, self.price))
+        subtotals = array("q", bytes(8 * self.invoices))
+        for invoice, amount in zip(self.invoice, amounts):
+            subtotals[invoice] += amount
+        gst = array("q", map(gst_cents, subtotals))
+        return ColumnTotals(amounts, subtotals, gst, array("q", map(operator.add, subtotals, gst)))
+
+    def _totals_numpy(self) -> ColumnTotals:
+        qty = np.frombuffer(self.qty, dtype=np.int64)
+        price = np.frombuffer(self.price, dtype=np.int64)
+        invoice = np.frombuffer(self.invoice, dtype=np.int64)
+        amounts = qty * price
+        # Lines are stored invoice by invoice, so each invoice's subtotal is
+        # a difference of the running sum at its boundaries
+        running = np.concatenate(([0], np.cumsum(amounts)))
+        bounds = np.searchsorted(invoice, np.arange(self.invoices + 1))
+        subtotals = running[bounds[1:]] - running[bounds[:-1]]
+        n = subtotals * GST_PERCENT
+        gst = np.sign(n) * ((np.abs(n) + 50) // 100)
+
+        def to_array(values):
+            out = array("q")
+            out.frombytes(values.astype(np.int64).tobytes())
+            return out
+        return ColumnTotals(to_array(amounts), to_array(subtotals), to_array(gst), to_array(subtotals + gst))
+
+
+def apply_totals(orders: list[dict]) -> None:
+    """
+    Computes the totals of many transformed orders in one columnar pass
+    and stores them on the orders: "Amount" on every item and "Subtotal",
+    "GST" and "Total" on each order.
+    """
+    orders = list(orders)
+    result = LineColumns.from_invoices(order["Items"] for order in orders).totals()
+    amounts = iter(result.amounts)
+    for i, order in enumerate(orders):
+        for item in order["Items"]:
+            item["Amount"] = from_cents(next(amounts))
+        order["Subtotal"] = from_cents(result.subtotals[i])
+        order["GST"] = from_cents(result.gst[i])
+        order["Total"] = from_cents(result.totals[i])
+
+
+def order_totals(order: dict) -> tuple:
+    """
+    Returns (line amounts, subtotal, GST, total) for a transformed order,
+    computed from its Items. Totals stored by apply_totals are not reused,
+    since the items may have been edited after they were stored.
+    """
+    with key_errors():
+        items = Invoice.of(order).Items
+    result = LineColumns.from_invoices([items]).totals()
+    return ([from_cents(a) for a in result.amounts], from_cents(result.subtotals[0]),
+            from_cents(result.gst[0]), from_cents(result.totals[0]))